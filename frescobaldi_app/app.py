@@ -96,12 +96,60 @@ def openUrl(url, encoding=None):
             d = document.Document.new_from_url(url, encoding)
     return d
 
+def openUrls(urls, encoding=None):
+    """Returns a list of Document instances for the given QUrls.
+
+    The files are read and decoded in parallel, but the text is only put in
+    a new document when it is needed (see Document.setLazyText()). Urls that
+    can't be read are skipped, an empty url gives a new, empty document.
+    Documents that were already open are returned as is.
+
+    """
+    import concurrent.futures
+    import document
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        futures = [None if url.isEmpty() or _findDocument(url) else
+                   executor.submit(document.Document.load_lazy_data, url, encoding)
+                   for url in urls]
+    result = []
+    for url, future in zip(urls, futures):
+        if url.isEmpty():
+            d = document.Document(url, encoding)
+        else:
+            d = _findDocument(url)
+            if not d:
+                try:
+                    text, stat = future.result()
+                except IOError:
+                    continue
+                if (len(documents) == 1
+                    and documents[0].url().isEmpty()
+                    and documents[0].isEmpty()
+                    and not documents[0].isUndoAvailable()
+                    and not documents[0].isRedoAvailable()):
+                    d = documents[0]
+                    d.setEncoding(encoding)
+                    d.setUrl(url)
+                else:
+                    d = document.Document(url, encoding)
+                d.setLazyText(text, stat)
+        result.append(d)
+    return result
+
 def findDocument(url):
     """Returns a Document instance for the given QUrl if already loaded.
 
     Returns None if no document with given url exists or if the url is empty.
+    If the document has lazy text, it is loaded (see Document.ensureLoaded()).
 
     """
+    d = _findDocument(url)
+    if d:
+        d.ensureLoaded()
+    return d
+
+def _findDocument(url):
+    """Returns the Document with the url, without loading lazy text."""
     if not url.isEmpty():
         for d in documents:
             if url == d.url():
@@ -213,6 +261,16 @@ def settings(name):
     s.setFallbacksEnabled(False)
     return s
 
+def cachedir(name):
+    """Returns the path of a directory in Frescobaldi's cache location.
+
+    The directory is not created.
+
+    """
+    from PyQt5.QtCore import QStandardPaths
+    base = QStandardPaths.writableLocation(QStandardPaths.CacheLocation)
+    return os.path.join(base, name)
+
 def excepthook(exctype, excvalue, exctb):
     """Called when a Python exception goes unhandled."""
     from traceback import format_exception
@@ -68,6 +68,13 @@ class CompleterManager(plugin.MainWindowPlugin):
 app.mainwindowCreated.connect(CompleterManager.instance)
 
 
+@app.documentLoaded.connect
+def _updateIndex(document):
+    """Indexes the files included by a loaded document in the background."""
+    import fileindex
+    fileindex.update(document)
+
+
 class Actions(actioncollection.ActionCollection):
     name = 'autocomplete'
     def createActions(self, parent):
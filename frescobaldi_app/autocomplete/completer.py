@@ -22,18 +22,121 @@ The completer for Frescobaldi.
 """
 
 
+import bisect
+import itertools
 import re
+import weakref
 
+from PyQt5.QtCore import QAbstractListModel, Qt
 from PyQt5.QtGui import QTextCursor
+from PyQt5.QtWidgets import QCompleter
 
 import app
 import textformats
 import widgets.completer
 
 
+_indexes = weakref.WeakKeyDictionary()
+
+
+def sortedIndex(model):
+    """Returns the (keys, items) index for a listmodel.ListModel.
+
+    The items are the entries of the model, sorted on their lower case edit
+    text. The keys are the lower case edit texts. The index is built only
+    once for every model.
+
+    """
+    try:
+        return _indexes[model]
+    except KeyError:
+        edit = model._roles.get(Qt.EditRole, str)
+        entries = sorted(((edit(item).lower(), item) for item in model._data),
+                         key=lambda entry: entry[0])
+        keys = [key for key, item in entries]
+        items = [item for key, item in entries]
+        result = _indexes[model] = keys, items
+        return result
+
+
+class PrefixModel(QAbstractListModel):
+    """Shows the entries of a listmodel.ListModel that start with a prefix.
+
+    The matching entries are looked up in a sorted index using bisect, so
+    filtering does not depend on the number of entries in the model.
+    Entries that were used before are shown first, the most often used
+    entries first, and then the most recently used ones.
+
+    """
+    def __init__(self, parent=None):
+        super(PrefixModel, self).__init__(parent)
+        self._source = None
+        self._prefix = ''
+        self._rows = []
+        self.used = {}  # lower case edit text: (times used, last use)
+
+    def source(self):
+        """Returns the model we are filtering."""
+        return self._source
+
+    def setSource(self, model):
+        """Sets the listmodel.ListModel to filter."""
+        self._source = model
+        self.update()
+
+    def setPrefix(self, prefix):
+        """Shows only the entries that start with prefix (case insensitive)."""
+        if prefix != self._prefix:
+            self._prefix = prefix
+            self.update()
+
+    def update(self):
+        """Looks up the entries matching the prefix."""
+        self.beginResetModel()
+        self._rows = []
+        if self._source is not None:
+            keys, items = sortedIndex(self._source)
+            prefix = self._prefix.lower()
+            lo = bisect.bisect_left(keys, prefix)
+            hi = bisect.bisect_left(keys, prefix + '\U0010ffff', lo)
+            rows = items[lo:hi]
+            # move the used entries to the front
+            used = sorted(((rank, key) for key, rank in self.used.items()
+                           if key.startswith(prefix)), reverse=True)
+            front = []
+            for rank, key in used:
+                i = bisect.bisect_left(keys, key, lo, hi)
+                if i < hi and keys[i] == key:
+                    front.append(i - lo)
+            if front:
+                skip = set(front)
+                rows = ([rows[i] for i in front]
+                        + [row for i, row in enumerate(rows) if i not in skip])
+            self._rows = rows
+        self.endResetModel()
+
+    def rowCount(self, parent):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role):
+        try:
+            item = self._rows[index.row()]
+            f = self._source._roles[role]
+        except (IndexError, KeyError):
+            return
+        return f(item)
+
+
 class Completer(widgets.completer.Completer):
+    usedCount = 100  # number of used completions to remember
+
     def __init__(self):
         super(Completer, self).__init__()
+        self._counter = itertools.count()
+        self._prefixModel = PrefixModel(self)
+        self.setModel(self._prefixModel)
+        # we do the filtering ourselves
+        self.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
         self.setMaxVisibleItems(16)
         self.popup().setMinimumWidth(100)
         app.settingsChanged.connect(self.readSettings)
@@ -52,11 +155,29 @@ class Completer(widgets.completer.Completer):
             if not model:
                 return
             self._pos = cursor.block().position() + pos
-            if self.model() != model:
-                self.setModel(model)
+            if self._prefixModel.source() != model:
+                self._prefixModel.setSource(model)
         cursor.setPosition(self._pos, QTextCursor.KeepAnchor)
         return cursor
 
+    def setCompletionPrefix(self, prefix):
+        """Reimplemented to filter the model using its index."""
+        self._prefixModel.setPrefix(prefix)
+        super(Completer, self).setCompletionPrefix(prefix)
+
+    def insertCompletion(self, index):
+        """Reimplemented to remember the inserted completion."""
+        text = self.completionModel().data(index, Qt.EditRole)
+        if text:
+            used = self._prefixModel.used
+            key = text.lower()
+            count = used[key][0] if key in used else 0
+            used[key] = (count + 1, next(self._counter))
+            if len(used) > self.usedCount:
+                # forget the least recently used entry
+                del used[min(used, key=lambda k: used[k][1])]
+        super(Completer, self).insertCompletion(index)
+
     def analyzer(self):
         from . import analyzer
         return analyzer.Analyzer()
@@ -22,11 +22,16 @@ Completions data harvested from a Document.
 """
 
 
+import functools
+import heapq
 import itertools
 import os
+import re
 
+import documentinfo
 import listmodel
 import plugin
+import tokeniter
 import ly.words
 import ly.data
 
@@ -40,78 +45,130 @@ def doc(document):
     return DocumentDataSource.instance(document)
 
 
+# groups of words that are combined with the names harvested from a document
+_base_words = {
+    'score': lambda: completiondata.score,
+    'bookpart': lambda: completiondata.bookpart,
+    'book': lambda: completiondata.book,
+    'music': lambda: itertools.chain(
+        ly.words.lilypond_keywords,
+        ly.words.lilypond_music_commands,
+        ly.words.articulations,
+        ly.words.ornaments,
+        ly.words.fermatas,
+        ly.words.instrument_scripts,
+        ly.words.repeat_scripts),
+    'lyric': lambda: ('set stanza = ', 'set', 'override', 'markup', 'notemode', 'repeat'),
+    'markup': lambda: ly.words.markupcommands,
+    'scheme': ly.data.all_scheme_words,
+}
+
+
+@functools.lru_cache()
+def base_words(name):
+    """Returns the named group of words as a sorted tuple, built only once."""
+    return tuple(sorted(set(_base_words[name]())))
+
+
+@functools.lru_cache()
+def _base_set(name):
+    """Returns the named group of words as a frozenset."""
+    return frozenset(base_words(name))
+
+
+def merge(name, words):
+    """Returns a sorted list of the named group of words and the other words."""
+    extra = sorted(set(words).difference(_base_set(name)))
+    return list(heapq.merge(base_words(name), extra))
+
+
+# the word being typed at the end of a text
+_word = re.compile(r'\\?[\w-]*$').search
+
+
+def _scope(self, cursor):
+    """Key function for util.keep() for methods that take a cursor.
+
+    The key does not change while a word is typed at the cursor: it consists
+    of the hash of the tokens in the other blocks (see
+    documentinfo.DocumentInfo.token_hash()), the block number and the text
+    before the word.
+
+    """
+    block = cursor.block()
+    text = block.text()[:cursor.position() - block.position()]
+    text = text[:_word(text).start()]
+    h = documentinfo.info(self.document()).token_hash()
+    h -= (tokeniter.token_hash(block) or 0) & 0xFFFFFFFFFFFFFFFF
+    return h & 0xFFFFFFFFFFFFFFFF, block.blockNumber(), text
+
+
+def _names(self, name, cursor):
+    """Key function for util.keep() for the _commands() method."""
+    return name, self.names(cursor)
+
+
 class DocumentDataSource(plugin.DocumentPlugin):
-    @util.keep
+    @util.keep(util.revision)
     def words(self):
         """Returns the list of words in comments, markup etc."""
         return listmodel.ListModel(
             sorted(set(harvest.words(self.document()))))
 
-    @util.keep
+    @util.keep(util.revision)
     def schemewords(self):
         """Scheme names, including those harvested from document."""
-        schemewords = set(itertools.chain(
-            ly.data.all_scheme_words(),
-            (str(t)
-                for t in harvest.schemewords(self.document())
-                if len(t) > 2),
-            ))
-        return listmodel.ListModel(sorted(schemewords))
-
-    @util.keep
+        return listmodel.ListModel(merge('scheme',
+            (str(t) for t in harvest.schemewords(self.document()) if len(t) > 2)))
+
+    @util.keep(_scope)
     def markup(self, cursor):
         """Completes markup commands and normal text from the document."""
         return listmodel.ListModel(
-            ['\\' + w for w in sorted(ly.words.markupcommands)]
+            ['\\' + w for w in base_words('markup')]
             + [ '\\' + w for w in sorted(set(itertools.chain(
                 harvest.markup_commands(cursor),
                 harvest.include_markup_commands(cursor))))]
             + sorted(set(harvest.words(self.document()))))
 
-    @util.keep
+    @util.keep(_scope)
+    def names(self, cursor):
+        """Returns a frozenset of the names defined until the cursor.
+
+        Includes the names defined in included files.
+
+        """
+        return frozenset(itertools.chain(
+            harvest.include_identifiers(cursor),
+            harvest.names(cursor)))
+
+    @util.keep(_names)
+    def _commands(self, name, cursor):
+        """Returns a model with the named group of words and the defined names.
+
+        This is remembered as long as the set of names does not change.
+
+        """
+        return listmodel.ListModel(merge(name, self.names(cursor)),
+                                   display = util.command)
+
     def scorecommands(self, cursor):
         """Stuff inside \\score { }. """
-        return listmodel.ListModel(sorted(set(itertools.chain(
-            completiondata.score,
-            harvest.include_identifiers(cursor),
-            harvest.names(cursor)))), display = util.command)
+        return self._commands('score', cursor)
 
-    @util.keep
     def bookpartcommands(self, cursor):
         """Stuff inside \\bookpart { }. """
-        return listmodel.ListModel(sorted(set(itertools.chain(
-            completiondata.bookpart,
-            harvest.include_identifiers(cursor),
-            harvest.names(cursor)))), display = util.command)
+        return self._commands('bookpart', cursor)
 
-    @util.keep
     def bookcommands(self, cursor):
         """Stuff inside \\book { }. """
-        return listmodel.ListModel(sorted(set(itertools.chain(
-            completiondata.book,
-            harvest.include_identifiers(cursor),
-            harvest.names(cursor)))), display = util.command)
-
+        return self._commands('book', cursor)
 
-    @util.keep
     def musiccommands(self, cursor):
-        return listmodel.ListModel(sorted(set(itertools.chain(
-            ly.words.lilypond_keywords,
-            ly.words.lilypond_music_commands,
-            ly.words.articulations,
-            ly.words.ornaments,
-            ly.words.fermatas,
-            ly.words.instrument_scripts,
-            ly.words.repeat_scripts,
-            harvest.include_identifiers(cursor),
-            harvest.names(cursor)))), display = util.command)
+        return self._commands('music', cursor)
 
-    @util.keep
     def lyriccommands(self, cursor):
-        return listmodel.ListModel(sorted(set(itertools.chain(
-            ('set stanza = ', 'set', 'override', 'markup', 'notemode', 'repeat'),
-            harvest.include_identifiers(cursor),
-            harvest.names(cursor)))), display = util.command)
+        return self._commands('lyric', cursor)
 
     def includenames(self, cursor, directory=None):
         """Finds files relative to the directory of the cursor's document.
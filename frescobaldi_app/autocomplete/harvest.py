@@ -22,11 +22,15 @@ Harvest strings from document for autocompletion purposes.
 """
 
 
+import collections
 import itertools
 import re
 
+import cursortools
 import documentinfo
-import fileinfo
+import fileindex
+import highlighter
+import plugin
 import tokeniter
 import ly.lex.lilypond
 import ly.lex.scheme
@@ -50,24 +54,22 @@ def markup_commands(cursor):
 
 def schemewords(document):
     """Harvests all schemewords from the document."""
-    for t in tokeniter.all_tokens(document):
-        if type(t) is ly.lex.scheme.Word:
-            yield t
+    return vocabulary(document).schemewords()
 
 
 def include_identifiers(cursor):
     """Harvests identifier definitions from included files."""
     dinfo = documentinfo.info(cursor.document())
-    files = fileinfo.includefiles(get_docinfo(cursor), dinfo.includepath())
-    return itertools.chain.from_iterable(fileinfo.docinfo(f).definitions()
+    files = fileindex.includefiles(get_docinfo(cursor), dinfo.includepath())
+    return itertools.chain.from_iterable(fileindex.definitions(f)
                                          for f in files)
 
 
 def include_markup_commands(cursor):
     """Harvest markup command definitions from included files."""
     dinfo = documentinfo.info(cursor.document())
-    files = fileinfo.includefiles(get_docinfo(cursor), dinfo.includepath())
-    return itertools.chain.from_iterable(fileinfo.docinfo(f).markup_definitions()
+    files = fileindex.includefiles(get_docinfo(cursor), dinfo.includepath())
+    return itertools.chain.from_iterable(fileindex.markup_definitions(f)
                                          for f in files)
 
 
@@ -78,8 +80,111 @@ _word_types = (
 
 def words(document):
     """Harvests words from strings, lyrics, markup and comments."""
-    for t in tokeniter.all_tokens(document):
-        if isinstance(t, _word_types):
-            for m in _words(t):
-                yield m.group()
+    return vocabulary(document).words()
+
 
+def block_words(tokens):
+    """Returns two Counters with the words and schemewords in the tokens."""
+    words = collections.Counter()
+    schemewords = collections.Counter()
+    for t in tokens:
+        if type(t) is ly.lex.scheme.Word:
+            schemewords[t] += 1
+        elif isinstance(t, _word_types):
+            words.update(m.group() for m in _words(t))
+    return words, schemewords
+
+
+def vocabulary(document):
+    """Returns the Vocabulary for the document."""
+    return Vocabulary.instance(document)
+
+
+class Vocabulary(plugin.DocumentPlugin):
+    """Counts the words and schemewords in a document.
+
+    The words of every block are counted when the highlighter tokenizes it
+    and stored in the block's user data. The counts for the whole document
+    are kept up to date by subtracting the old counts of a block and adding
+    the new ones, so only the changed blocks need to be harvested again.
+
+    The user data of all blocks are also kept in a list, in document order.
+    When blocks are removed, the user data in the changed range of the list
+    that are no longer in the document are found without looking at the
+    other blocks, and their counts are subtracted.
+
+    """
+    def __init__(self, document):
+        self._words = collections.Counter()
+        self._schemewords = collections.Counter()
+        self._counted = {}   # id: (words, schemewords) of every counted block
+        self._blocks = []    # the user data of every block
+        self._replaced = []  # user data replaced in _blocks during a change
+        highlighter.highlighter(document).tokensChanged.connect(self.slotTokensChanged)
+        document.contentsChange.connect(self.slotContentsChange)
+        for block in cursortools.all_blocks(document):
+            self.count(block, tokeniter.tokens(block))
+            self._blocks.append(block.userData())
+
+    def words(self):
+        """Returns the words in the document, each word once."""
+        return self._words.keys()
+
+    def schemewords(self):
+        """Returns the schemewords in the document, each word once."""
+        return self._schemewords.keys()
+
+    def count(self, block, tokens):
+        """Replaces the counted words of the block with the words in tokens."""
+        data = cursortools.data(block)
+        old = getattr(data, 'vocabulary', None)
+        if old is not None and self._counted.pop(id(old), None) is old:
+            self.subtract(old)
+        new = data.vocabulary = block_words(tokens)
+        self._counted[id(new)] = new
+        self._words.update(new[0])
+        self._schemewords.update(new[1])
+
+    def subtract(self, counts):
+        """Subtracts the (words, schemewords) counts from the totals."""
+        for total, counter in zip((self._words, self._schemewords), counts):
+            for word, n in counter.items():
+                n = total[word] - n
+                if n > 0:
+                    total[word] = n
+                else:
+                    del total[word]
+
+    def slotTokensChanged(self, block):
+        """Called by the highlighter when a block is (re)tokenized."""
+        self.count(block, highlighter.stored_tokens(block) or ())
+        if len(self._blocks) == block.document().blockCount():
+            # no blocks were added or removed, so the numbers are right
+            num = block.blockNumber()
+            old, self._blocks[num] = self._blocks[num], block.userData()
+            if old is not None and old is not self._blocks[num]:
+                # the block was replaced, check it in slotContentsChange
+                self._replaced.append(old)
+
+    def slotContentsChange(self, position, removed, added):
+        """Called when the document changes, subtracts words of removed blocks."""
+        doc = self.document()
+        first = doc.findBlock(position)
+        last = doc.findBlock(position + added)
+        start = first.blockNumber()
+        end = last.blockNumber() + 1
+        new = []
+        block = first
+        while block.isValid() and block.blockNumber() < end:
+            new.append(block.userData())
+            block = block.next()
+        # the range of the changed blocks before the change
+        old_end = end + len(self._blocks) - doc.blockCount()
+        present = set(map(id, new))
+        replaced, self._replaced = self._replaced, []
+        for data in self._blocks[start:old_end] + replaced:
+            if data is not None and id(data) not in present:
+                counts = getattr(data, 'vocabulary', None)
+                if counts is not None and self._counted.pop(id(counts), None) is counts:
+                    self.subtract(counts)
+        self._blocks[start:old_end] = new
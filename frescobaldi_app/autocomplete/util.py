@@ -22,31 +22,47 @@ Utility functions used in the autocomplete package.
 """
 
 
+import collections
 import functools
-import time
 import weakref
 
 
-def keep(f):
-    """Returns a decorator that remembers its return value for some time."""
-    _delay = 5.0 # sec
-    _cache = weakref.WeakKeyDictionary()
-    @functools.wraps(f)
-    def decorator(self, *args):
-        try:
-            result = _cache[self]
-        except KeyError:
-            pass
-        else:
-            t, ret = result
-            if (time.time() - t) < _delay:
-                return ret
-        ret = f(self, *args)
-        _cache[self] = (time.time(), ret)
-        return ret
+def keep(key):
+    """Returns a decorator that remembers return values of a method.
+
+    The key function is called with the same arguments as the method, and
+    should return a hashable value that changes whenever the result of the
+    method would change, e.g. the document revision. The last few results
+    are remembered for every instance.
+
+    """
+    def decorator(f):
+        _cache = weakref.WeakKeyDictionary()
+        @functools.wraps(f)
+        def wrapper(self, *args):
+            k = key(self, *args)
+            try:
+                cache = _cache[self]
+            except KeyError:
+                cache = _cache[self] = collections.OrderedDict()
+            try:
+                ret = cache[k]
+            except KeyError:
+                ret = cache[k] = f(self, *args)
+                if len(cache) > 8:
+                    cache.popitem(False)
+            else:
+                cache.move_to_end(k)
+            return ret
+        return wrapper
     return decorator
 
 
+def revision(self, *args):
+    """Key function for keep() that returns the revision of the document."""
+    return self.document().revision()
+
+
 # helper functions for displaying data from models
 def command(item):
     """Prepends '\\' to item."""
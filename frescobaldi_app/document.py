@@ -38,6 +38,15 @@ import variables
 import signals
 
 
+def _stat(filename):
+    """Return (size, mtime) of the file, or None if it can't be read."""
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
 class Document(QTextDocument):
 
     urlChanged = signals.Signal() # new url, old url
@@ -46,6 +55,9 @@ class Document(QTextDocument):
     saving = signals.SignalContext()
     saved = signals.Signal()
 
+    _lazyText = None
+    _lazyStat = None
+
     @classmethod
     def load_data(cls, url, encoding=None):
         """Class method to load document contents from an url.
@@ -69,6 +81,17 @@ class Document(QTextDocument):
         text = util.decode(data, encoding)
         return util.universal_newlines(text)
 
+    @classmethod
+    def load_lazy_data(cls, url, encoding=None):
+        """Class method returning a (text, stat) tuple for setLazyText().
+
+        text is read using load_data(), stat describes the file before it
+        was read. This method can be called in a background thread.
+
+        """
+        stat = _stat(url.toLocalFile())
+        return cls.load_data(url, encoding), stat
+
     @classmethod
     def new_from_url(cls, url, encoding=None):
         """Create and return a new document, loaded from url.
@@ -110,6 +133,7 @@ class Document(QTextDocument):
         app.documentModificationChanged(self)
 
     def close(self):
+        self._lazyText = self._lazyStat = None
         self.closed()
         app.documentClosed(self)
         app.documents.remove(self)
@@ -130,6 +154,7 @@ class Document(QTextDocument):
             url = QUrl()
         u = url if not url.isEmpty() else self.url()
         text = self.load_data(u, encoding or self._encoding)
+        self._lazyText = self._lazyStat = None
         if keepUndo:
             c = QTextCursor(self)
             c.select(QTextCursor.Document)
@@ -142,6 +167,54 @@ class Document(QTextDocument):
         self.loaded()
         app.documentLoaded(self)
 
+    def setLazyText(self, text, stat=None):
+        """Set the text that is loaded when the document is needed.
+
+        This is used to restore many documents at once. The text is put in
+        the document by ensureLoaded(), e.g. when the document is shown in a
+        View, and the loaded() signal is emitted then.
+
+        If stat (see load_lazy_data()) is given and the file has changed
+        since, it is read again instead.
+
+        """
+        self._lazyText = text
+        self._lazyStat = stat
+
+    def isLoaded(self):
+        """Return False if the document still has lazy text to load."""
+        return self._lazyText is None
+
+    def ensureLoaded(self):
+        """Put the lazy text in the document, if there is any.
+
+        Call this before accessing the contents of a document that may not
+        be shown yet via cursors or blocks. (This is done for you by
+        app.findDocument(), toPlainText(), save(), lydocument.Document, and
+        when the document is shown in a View or gets a Highlighter.)
+
+        """
+        if self._lazyText is not None:
+            text, stat = self._lazyText, self._lazyStat
+            self._lazyText = self._lazyStat = None
+            if stat is not None and _stat(self.url().toLocalFile()) != stat:
+                # the file has changed since it was read
+                try:
+                    text = self.load_data(self.url(), self._encoding)
+                except IOError:
+                    pass
+            self.setPlainText(text)
+            self.setModified(False)
+            self.loaded()
+            app.documentLoaded(self)
+
+    def isEmpty(self):
+        return self._lazyText is None and super(Document, self).isEmpty()
+
+    def toPlainText(self):
+        self.ensureLoaded()
+        return super(Document, self).toPlainText()
+
     def save(self, url=None, encoding=None):
         """Saves the document to the specified or current url.
 
@@ -163,6 +236,8 @@ class Document(QTextDocument):
         # would fail
         if self.url().isEmpty() and not url.isEmpty():
             self.setUrl(url)
+        # never write a document that is not loaded as empty
+        self.ensureLoaded()
         with self.saving(), app.documentSaving(self):
             with open(filename, "wb") as f:
                 f.write(self.encodedText())
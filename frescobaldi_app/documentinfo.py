@@ -60,6 +60,32 @@ def music(document):
     return info(document).music()
 
 
+def includepath():
+    """Return the configured include path.
+
+    A path is a list of directories.
+
+    If there is a session specific include path, it is used.
+    Otherwise the path is taken from the LilyPond preferences.
+
+    """
+    # get the global include path
+    include_path = qsettings.get_string_list(
+        QSettings(), "lilypond_settings/include_path")
+
+    # get the session specific include path
+    import sessions
+    session_settings = sessions.currentSessionGroup()
+    if session_settings and session_settings.value("set-paths", False, bool):
+        sess_path = qsettings.get_string_list(session_settings, "include-path")
+        if session_settings.value("repl-paths", False, bool):
+            include_path = sess_path
+        else:
+            include_path = sess_path + include_path
+
+    return include_path
+
+
 def mode(document, guess=True):
     """Returns the type of the given document. See DocumentInfo.mode()."""
     return info(document).mode(guess)
@@ -114,14 +140,47 @@ def defaultfilename(document):
 class DocumentInfo(plugin.DocumentPlugin):
     """Computes and caches various information about a Document."""
     def __init__(self, document):
+        self._readers = weakref.WeakSet()
+        document.contentsChange.connect(self._contentsChange)
         document.contentsChanged.connect(self._reset)
-        document.closed.connect(self._reset)
-        self._reset()
+        document.closed.connect(self._closed)
+        self._closed()
 
     def _reset(self):
         """Called when the document is changed."""
         self._lydocinfo = None
+
+    def _closed(self):
+        """Called when the document is closed, also forgets the music tree."""
+        self._reset()
         self._music = None
+        self._change = None
+        self._hashes = None     # the hash of every block, None if not computed
+        self._hash_sum = 0      # the sum of the computed hashes
+        self._pending = []      # blocks tokenized while the document was changing
+
+    def _contentsChange(self, position, removed, added):
+        """Called when the document is changed, records the changed range.
+
+        The range is stored as (start, old_end, new_end), where old_end is
+        the end in the text the music tree was created from. Subsequent
+        changes are combined, so that the music tree can be updated once
+        when it is needed.
+
+        The hashes of the changed blocks are forgotten.
+
+        """
+        if self._hashes is not None:
+            self._forgetHashes(position, added)
+        if self._music is None:
+            return
+        if self._change is None:
+            self._change = (position, position + removed, position + added)
+        else:
+            start, old_end, new_end = self._change
+            end = max(new_end, position + removed)
+            self._change = (min(start, position), old_end + end - new_end,
+                            end + added - removed)
 
     def lydocinfo(self):
         """Return the lydocinfo instance for our document."""
@@ -131,8 +190,77 @@ class DocumentInfo(plugin.DocumentPlugin):
             self._lydocinfo = lydocinfo.DocInfo(doc, v)
         return self._lydocinfo
 
+    def _forgetHashes(self, position, added):
+        """(Internal) Forget the hashes of the blocks changed in the document."""
+        doc = self.document()
+        size = doc.blockCount()
+        first = doc.findBlock(position).blockNumber()
+        count = doc.findBlock(position + added).blockNumber() - first + 1
+        old = count - size + len(self._hashes)
+        self._hash_sum -= sum(h for h in self._hashes[first:first+old] if h is not None)
+        self._hashes[first:first+old] = [None] * count
+        pending, self._pending = self._pending, []
+        for block in pending:
+            if block.isValid():
+                self._forgetHash(block.blockNumber())
+
+    def _forgetHash(self, num):
+        """(Internal) Forget the hash of the block number."""
+        h = self._hashes[num]
+        if h is not None:
+            self._hash_sum -= h
+            self._hashes[num] = None
+
+    def _tokensChanged(self, block):
+        """(Internal) Called when the highlighter has tokenized a block."""
+        if self._hashes is None:
+            return
+        elif len(self._hashes) != block.document().blockCount():
+            # the highlighter runs before _contentsChange() is called
+            self._pending.append(block)
+        else:
+            self._forgetHash(block.blockNumber())
+
+    def token_hash(self):
+        """Return an integer hash for all non-whitespace and non-comment tokens.
+
+        This hash does not change when only comments or whitespace are changed.
+        It is the sum (modulo 2**64) of the hashes the highlighter stores for
+        every block. The hashes of changed blocks are forgotten, and computed
+        again when this method is called, so the other blocks are not visited.
+
+        """
+        doc = self.document()
+        hashes = self._hashes
+        if hashes is None:
+            import highlighter
+            highlighter.highlighter(doc).tokensChanged.connect(self._tokensChanged)
+            hashes = self._hashes = [None] * doc.blockCount()
+            self._hash_sum = 0
+        num = 0
+        while True:
+            try:
+                num = hashes.index(None, num)
+            except ValueError:
+                break
+            h = tokeniter.token_hash(doc.findBlockByNumber(num))
+            h = hashes[num] = 0 if h is None else h & 0xFFFFFFFFFFFFFFFF
+            self._hash_sum += h
+            num += 1
+        return self._hash_sum & 0xFFFFFFFFFFFFFFFF
+
     def music(self):
-        """Return the music.Document instance for our document."""
+        """Return the music.Document instance for our document.
+
+        After a change, only the toplevel nodes touched by the change are
+        read again if possible, see music.Document.update().
+
+        """
+        if self._change is not None:
+            self._stopReaders()
+            if not self._music.update(*self._change):
+                self._music = None
+            self._change = None
         if self._music is None:
             import music
             doc = lydocument.Document(self.document())
@@ -140,6 +268,23 @@ class DocumentInfo(plugin.DocumentPlugin):
         self._music.include_path = self.includepath()
         return self._music
 
+    def addMusicReader(self, thread):
+        """Registers a QThread that reads the music tree in the background.
+
+        Before the tree is updated in place, the interruption of the thread
+        is requested and it is waited for, so the thread never sees a tree
+        that is being changed.
+
+        """
+        self._readers.add(thread)
+
+    def _stopReaders(self):
+        """Interrupts and waits for the threads reading the music tree."""
+        for thread in list(self._readers):
+            thread.requestInterruption()
+            thread.wait()
+        self._readers.clear()
+
     def mode(self, guess=True):
         """Returns the type of document ('lilypond, 'html', etc.).
 
@@ -163,27 +308,10 @@ class DocumentInfo(plugin.DocumentPlugin):
 
         A path is a list of directories.
 
-        If there is a session specific include path, it is used.
-        Otherwise the path is taken from the LilyPond preferences.
-
-        Currently the document does not matter.
+        Currently the document does not matter, see the includepath() function.
 
         """
-        # get the global include path
-        include_path = qsettings.get_string_list(
-            QSettings(), "lilypond_settings/include_path")
-
-        # get the session specific include path
-        import sessions
-        session_settings = sessions.currentSessionGroup()
-        if session_settings and session_settings.value("set-paths", False, bool):
-            sess_path = qsettings.get_string_list(session_settings, "include-path")
-            if session_settings.value("repl-paths", False, bool):
-                include_path = sess_path
-            else:
-                include_path = sess_path + include_path
-
-        return include_path
+        return includepath()
 
     def jobinfo(self, create=False):
         """Returns a two-tuple(filename, includepath).
@@ -19,6 +19,14 @@
 
 """
 Maintains an overview of the structure of a Document.
+
+The outline expression is matched against every line (QTextBlock) separately,
+and the matches are stored in the block's user data. When the document
+changes, only the changed lines are matched again, and the outline is only
+collected again if matches were changed or lines were inserted or removed.
+
+If a pattern can match a newline, the expression is matched against the
+whole text instead, after every change.
 """
 
 
@@ -27,6 +35,7 @@ import re
 from PyQt5.QtCore import QSettings
 
 import app
+import cursortools
 import plugin
 
 
@@ -63,6 +72,13 @@ def _reset_outline_re():
 app.settingsChanged.connect(_reset_outline_re, -999)
 
 
+def is_multiline(rx):
+    """Return True if the expression can match a newline (then it is not matched per line)."""
+    # a newline in a negated character class like [^\n] is harmless
+    pattern = re.sub(r'\[\^(\\.|[^\]\\])*\]', '', rx.pattern)
+    return '\n' in pattern or '\\n' in pattern
+
+
 def create_outline_re():
     """Create and return the expression to look for document outline items."""
     try:
@@ -91,23 +107,106 @@ def create_outline_re():
     return re.compile(rx, re.MULTILINE | re.UNICODE)
 
 
+class Match(object):
+    """An outline match in a block.
+
+    Behaves like a match object, but start() and end() return the position in
+    the document. If the match was done on the whole text, offset is the
+    position of the block at that time.
+
+    """
+    __slots__ = ('block', 'match', 'offset')
+
+    def __init__(self, block, match, offset=0):
+        self.block = block
+        self.match = match
+        self.offset = offset
+
+    def start(self):
+        return self.block.position() - self.offset + self.match.start()
+
+    def end(self):
+        return self.block.position() - self.offset + self.match.end()
+
+    def group(self, *args):
+        return self.match.group(*args)
+
+    def groupdict(self):
+        return self.match.groupdict()
+
+
 class DocumentStructure(plugin.DocumentPlugin):
     def __init__(self, document):
-        self._outline = None
-
-    def invalidate(self):
-        """Called when the document changes or the settings are changed."""
-        self._outline = None
-        app.settingsChanged.disconnect(self.invalidate)
-        self.document().contentsChanged.disconnect(self.invalidate)
+        self._outline_re = None # the expression the blocks were matched with
+        self._multiline = False # whether that expression is matched per line
+        self._outline = None    # the cached outline
+        self._size = 0          # the number of blocks when the lines were matched
+        document.contentsChange.connect(self.slotContentsChange)
+
+    def slotContentsChange(self, position, removed, added):
+        """Called when the document changes, matches the changed lines."""
+        if self._outline_re is None:
+            return
+        elif self._multiline:
+            self._outline = None
+            return
+        doc = self.document()
+        block = doc.findBlock(position)
+        last = doc.findBlock(position + added)
+        size = doc.blockCount()
+        if block != last or size != self._size:
+            # lines were removed or replaced, maybe with matches
+            self._outline = None
+        self._size = size
+        while block.isValid():
+            if self._match(block):
+                self._outline = None
+            if block == last:
+                break
+            block = block.next()
+
+    def _match(self, block):
+        """Store the outline matches of the block in its user data.
+
+        Returns True if the block had or has matches.
+
+        """
+        matches = list(self._outline_re.finditer(block.text()))
+        if matches:
+            cursortools.data(block).outline = matches
+            return True
+        try:
+            del block.userData().outline
+        except AttributeError:
+            return False
+        return True
 
     def outline(self):
-        """Return the document outline as a series of match objects."""
+        """Return the document outline as a list of Match objects."""
+        rx = outline_re()
+        doc = self.document()
+        if rx is not self._outline_re:
+            # the first time, or the settings have changed
+            self._outline_re = rx
+            self._multiline = is_multiline(rx)
+            self._outline = None
+            self._size = doc.blockCount()
+            for block in cursortools.all_blocks(doc):
+                if self._multiline:
+                    try:
+                        del block.userData().outline
+                    except AttributeError:
+                        pass
+                else:
+                    self._match(block)
         if self._outline is None:
-            self._outline = list(outline_re().finditer(self.document().toPlainText()))
-            self.document().contentsChanged.connect(self.invalidate)
-            app.settingsChanged.connect(self.invalidate, -999)
+            if self._multiline:
+                self._outline = result = []
+                for m in rx.finditer(doc.toPlainText()):
+                    block = doc.findBlock(m.start())
+                    result.append(Match(block, m, block.position()))
+            else:
+                self._outline = [Match(block, m)
+                    for block in cursortools.all_blocks(doc)
+                    for m in getattr(block.userData(), 'outline', ())]
         return self._outline
-
-
-
@@ -58,6 +58,7 @@ class Engraver(plugin.MainWindowPlugin):
         ac.engrave_publish.triggered.connect(self.engravePublish)
         ac.engrave_debug.triggered.connect(self.engraveLayoutControl)
         ac.engrave_custom.triggered.connect(self.engraveCustom)
+        ac.engrave_batch.triggered.connect(self.engraveBatch)
         ac.engrave_abort.triggered.connect(self.engraveAbort)
         ac.engrave_autocompile.toggled.connect(self.engraveAutoCompileToggled)
         ac.engrave_open_lilypond_datadir.triggered.connect(self.openLilyPondDatadir)
@@ -167,6 +168,20 @@ class Engraver(plugin.MainWindowPlugin):
             self.saveDocumentIfDesired()
             self.runJob(dlg.getJob(doc), doc)
 
+    def engraveBatch(self):
+        """Opens a dialog to engrave multiple files at once."""
+        try:
+            dlg = self._batchDialog
+        except AttributeError:
+            from . import batch
+            dlg = self._batchDialog = batch.Dialog(self.mainwindow())
+            dlg.addAction(self.mainwindow().actionCollection.help_whatsthis)
+        if not dlg.files():
+            dlg.addDocuments()
+        dlg.show()
+        dlg.raise_()
+        dlg.activateWindow()
+
     def engrave(self, mode='preview', document=None, may_save=True):
         """Starts an engraving job.
 
@@ -196,7 +211,9 @@ class Engraver(plugin.MainWindowPlugin):
         self.runJob(command.defaultJob(doc, args), doc)
 
     def engraveAbort(self):
-        job = jobmanager.job(self.document())
+        doc = self.document()
+        jobmanager.manager(doc).cancel_pending_job()
+        job = jobmanager.job(doc)
         if job and job.is_running():
             job.abort()
 
@@ -239,12 +256,13 @@ class Engraver(plugin.MainWindowPlugin):
         return msgbox.clickedButton() == abort_button
 
     def runJob(self, job, document):
-        """Runs the engraving job on behalf of document."""
+        """Runs the engraving job on behalf of document.
+
+        A running job for the document is aborted, unless the new job is
+        hidden and the running job is not. See the jobmanager module.
+
+        """
         jobattributes.get(job).mainwindow = self.mainwindow()
-        # cancel running job, that would be an autocompile job
-        rjob = jobmanager.job(document)
-        if rjob and rjob.is_running():
-            rjob.abort()
         jobmanager.manager(document).start_job(job)
 
     def stickyToggled(self):
@@ -307,6 +325,7 @@ class Engraver(plugin.MainWindowPlugin):
 
     def slotDocumentClosed(self, doc):
         """Called when the user closes a document. Aborts a running Job."""
+        jobmanager.manager(doc).cancel_pending_job()
         job = jobmanager.job(doc)
         if job and job.is_running():
             job.abort()
@@ -376,6 +395,7 @@ class Actions(actioncollection.ActionCollection):
         self.engrave_publish = QAction(parent)
         self.engrave_debug = QAction(parent)
         self.engrave_custom = QAction(parent)
+        self.engrave_batch = QAction(parent)
         self.engrave_abort = QAction(parent)
         self.engrave_autocompile = QAction(parent)
         self.engrave_autocompile.setCheckable(True)
@@ -392,6 +412,7 @@ class Actions(actioncollection.ActionCollection):
         self.engrave_publish.setIcon(icons.get('lilypond-run'))
         self.engrave_debug.setIcon(icons.get('lilypond-run'))
         self.engrave_custom.setIcon(icons.get('lilypond-run'))
+        self.engrave_batch.setIcon(icons.get('lilypond-run'))
         self.engrave_abort.setIcon(icons.get('process-stop'))
 
 
@@ -402,6 +423,7 @@ class Actions(actioncollection.ActionCollection):
         self.engrave_publish.setText(_("Engrave (&publish)"))
         self.engrave_debug.setText(_("Engrave (&layout control)"))
         self.engrave_custom.setText(_("Engrave (&custom)..."))
+        self.engrave_batch.setText(_("Engrave &Multiple Files..."))
         self.engrave_abort.setText(_("Abort Engraving &Job"))
         self.engrave_autocompile.setText(_("Automatic E&ngrave"))
         self.engrave_open_lilypond_datadir.setText(_("Open LilyPond &Data Directory"))
@@ -94,12 +94,8 @@ class AutoCompiler(plugin.MainWindowPlugin):
         """Called when the autocompile timer expires."""
         eng = engraver(self.mainwindow())
         doc = eng.document()
-        rjob = jobmanager.job(doc)
-        if rjob and rjob.is_running(): # and not jobattributes.get(rjob).hidden:
-            # a real job is running, come back when that is done
-            rjob.done.connect(self.startTimer)
-            return
-
+        # if a job is running, the jobmanager lets our job wait or aborts
+        # the running job if it is a superseded autocompile job
         mgr = AutoCompileManager.instance(doc)
         may_compile = mgr.may_compile()
         if not may_compile:
@@ -138,7 +134,7 @@ class AutoCompileManager(plugin.DocumentPlugin):
             else:
                 ext = '.pdf'
             self._dirty = not resultfiles.results(document).files(ext)
-        self._hash = None if self._dirty else documentinfo.docinfo(document).token_hash()
+        self._hash = None if self._dirty else documentinfo.info(document).token_hash()
 
     def may_compile(self):
         """Return True if we could need to compile the document."""
@@ -149,7 +145,7 @@ class AutoCompileManager(plugin.DocumentPlugin):
                 and (path.endswith('.ly') or path == '')
                 and dinfo.complete()
                 and documentinfo.music(self.document()).has_output()):
-                h = dinfo.token_hash()
+                h = documentinfo.info(self.document()).token_hash()
                 if h != self._hash:
                     self._hash = h
                     if h != hash(tuple()):
@@ -181,6 +177,6 @@ class AutoCompileManager(plugin.DocumentPlugin):
         """Called when an engraving job is started on this document."""
         if self._dirty:
             self._dirty = False
-            self._hash = documentinfo.docinfo(self.document()).token_hash()
+            self._hash = documentinfo.info(self.document()).token_hash()
 
 
@@ -0,0 +1,404 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Engrave multiple files at once.
+
+A Batch runs LilyPond on a list of files, at most jobmanager.maxjobs() at the
+same time. Files that are loaded as a Document are engraved via their
+JobManager, so the music view and log are updated as usual; other files are
+engraved directly from disk. When a job for an open document is replaced by a
+newer job before it could start, the JobManager cancels it, and the file is
+counted as failed.
+
+The Dialog lets the user compose the list of files (e.g. all documents of a
+session or all LilyPond files in a folder), shows the progress and summarizes
+the failed files, with their error messages linked to the source.
+
+"""
+
+
+import glob
+import os
+
+from PyQt5.QtCore import QSettings, QSize, Qt, QUrl
+from PyQt5.QtWidgets import (
+    QAbstractItemView, QComboBox, QDialog, QDialogButtonBox, QFileDialog,
+    QGridLayout, QHBoxLayout, QLabel, QListWidget, QProgressBar, QPushButton,
+    QTreeWidget, QTreeWidgetItem, QVBoxLayout)
+
+import app
+import icons
+import job
+import jobattributes
+import jobmanager
+import qutil
+import signals
+import util
+import widgets
+
+from . import command
+
+
+class Batch(object):
+    """Engraves a list of files, running a limited number of jobs in parallel.
+
+    The finished(filename, job, success) signal is emitted for every file
+    that is done, the done() signal when all files have been engraved or
+    the batch has been aborted.
+
+    """
+    started = signals.Signal()  # filename, Job
+    finished = signals.Signal() # filename, Job, success
+    done = signals.Signal()
+
+    def __init__(self, files, args=None, mainwindow=None):
+        """Initializes the Batch.
+
+        files is a list of (local) filenames, args the arguments for
+        command.defaultJob(), and mainwindow the window the jobs are
+        started on behalf of.
+
+        """
+        self._files = list(files)
+        self._args = args
+        self._mainwindow = mainwindow
+        self._waiting = list(self._files)
+        self._running = {}  # Job -> filename
+        self._results = []  # (filename, Job, success)
+        self._aborted = False
+
+    def files(self):
+        """Returns the list of filenames."""
+        return self._files
+
+    def results(self):
+        """Returns a list of (filename, Job, success) tuples for the finished files."""
+        return self._results
+
+    def failures(self):
+        """Returns a list of (filename, Job) tuples for the files that failed."""
+        return [(f, j) for f, j, success in self._results if not success]
+
+    def is_running(self):
+        """Returns True if there are running or waiting jobs."""
+        return bool(self._running or (self._waiting and not self._aborted))
+
+    def start(self):
+        """Starts engraving."""
+        self._startJobs()
+
+    def abort(self):
+        """Aborts running jobs; files that have not been started are skipped."""
+        self._aborted = True
+        del self._waiting[:]
+        for j in list(self._running):
+            doc = jobattributes.get(j).document
+            if doc:
+                if jobmanager.manager(doc).pending_job() is j:
+                    jobmanager.manager(doc).cancel_pending_job()
+            else:
+                jobmanager.cancel_job(j)
+            if j.is_running():
+                j.abort()
+            elif j.success is None:
+                # the job was still waiting in the job manager
+                del self._running[j]
+        if not self._running:
+            self.done()
+
+    def _startJobs(self):
+        """(Internal) Starts jobs until the maximum is reached."""
+        while self._waiting and len(self._running) < jobmanager.maxjobs():
+            filename = self._waiting.pop(0)
+            j = self._createJob(filename)
+            self._running[j] = filename
+            j.done.connect(self._jobDone)
+            self.started(filename, j)
+            doc = jobattributes.get(j).document
+            if doc:
+                jobmanager.manager(doc).start_job(j)
+            else:
+                jobmanager.start_job(j)
+        if not self._running and not self._waiting:
+            self.done()
+
+    def _createJob(self, filename):
+        """(Internal) Returns a Job for the file, using an open Document if there is one."""
+        doc = app.findDocument(QUrl.fromLocalFile(filename))
+        if doc:
+            j = command.defaultJob(doc, self._args)
+        else:
+            j = command.fileJob(filename, self._args)
+        attrs = jobattributes.get(j)
+        attrs.document = doc
+        attrs.mainwindow = self._mainwindow
+        return j
+
+    def _jobDone(self):
+        """(Internal) Called when one of our jobs has finished."""
+        for j, filename in list(self._running.items()):
+            if j.success is not None:
+                del self._running[j]
+                self._results.append((filename, j, j.success))
+                self.finished(filename, j, j.success)
+        if self._aborted:
+            if not self._running:
+                self.done()
+        else:
+            self._startJobs()
+
+
+def errors(j):
+    """Yields (filename, line, column, message) for the messages a Job reported.
+
+    These are all messages referring to a file position, LilyPond's output
+    may be translated, so errors can't be told apart from warnings.
+    Lines start numbering with 1, columns with 0 (LilyPond convention).
+
+    """
+    from logtool.errors import references
+    for msg, type in j.history(job.STDERR):
+        for url, filename, line, column, message in references(msg):
+            yield filename, line, column, message
+
+
+def lilypondFiles(directory):
+    """Returns a sorted list of the LilyPond files in a directory."""
+    return sorted(glob.glob(os.path.join(directory, '*.ly')))
+
+
+class Dialog(QDialog):
+    """Lets the user select files and engraves them in a Batch."""
+    def __init__(self, mainwindow):
+        super(Dialog, self).__init__(mainwindow)
+        self._batch = None
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        top = QGridLayout()
+        self.filesLabel = QLabel()
+        self.fileList = QListWidget()
+        self.fileList.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.addFilesButton = QPushButton(icons.get('document-open'), '')
+        self.addFolderButton = QPushButton(icons.get('folder-open'), '')
+        self.addDocumentsButton = QPushButton()
+        self.removeButton = QPushButton(icons.get('list-remove'), '')
+        buttons = QVBoxLayout()
+        buttons.addWidget(self.addFilesButton)
+        buttons.addWidget(self.addFolderButton)
+        buttons.addWidget(self.addDocumentsButton)
+        buttons.addWidget(self.removeButton)
+        buttons.addStretch(1)
+        top.addWidget(self.filesLabel, 0, 0, 1, 2)
+        top.addWidget(self.fileList, 1, 0)
+        top.addLayout(buttons, 1, 1)
+        layout.addLayout(top)
+
+        mode = QHBoxLayout()
+        self.modeLabel = QLabel()
+        self.modeCombo = QComboBox()
+        self.modeCombo.addItems(['preview', 'publish'])
+        self.modeLabel.setBuddy(self.modeCombo)
+        mode.addWidget(self.modeLabel)
+        mode.addWidget(self.modeCombo)
+        mode.addStretch(1)
+        layout.addLayout(mode)
+
+        self.progress = QProgressBar()
+        self.summary = QLabel(wordWrap=True)
+        self.results = QTreeWidget(rootIsDecorated=True, headerHidden=True)
+        layout.addWidget(self.progress)
+        layout.addWidget(self.summary)
+        layout.addWidget(self.results)
+
+        layout.addWidget(widgets.Separator())
+        self.buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        self.runButton = self.buttons.addButton('', QDialogButtonBox.ActionRole)
+        self.runButton.setIcon(icons.get('lilypond-run'))
+        self.abortButton = self.buttons.addButton('', QDialogButtonBox.ActionRole)
+        self.abortButton.setIcon(icons.get('process-stop'))
+        layout.addWidget(self.buttons)
+
+        self.addFilesButton.clicked.connect(self.addFiles)
+        self.addFolderButton.clicked.connect(self.addFolder)
+        self.addDocumentsButton.clicked.connect(self.addDocuments)
+        self.removeButton.clicked.connect(self.removeFiles)
+        self.runButton.clicked.connect(self.run)
+        self.abortButton.clicked.connect(self.abort)
+        self.buttons.rejected.connect(self.reject)
+        self.results.itemActivated.connect(self.slotItemActivated)
+        self.fileList.itemSelectionChanged.connect(self.updateButtons)
+
+        app.translateUI(self)
+        qutil.saveDialogSize(self, "engrave/batch/dialog/size", QSize(480, 480))
+        self.progress.hide()
+        self.updateButtons()
+
+    def translateUI(self):
+        self.setWindowTitle(app.caption(_("Engrave Multiple Files")))
+        self.filesLabel.setText(_("Files to engrave:"))
+        self.addFilesButton.setText(_("&Add Files..."))
+        self.addFolderButton.setText(_("Add &Folder..."))
+        self.addDocumentsButton.setText(_("Add Open &Documents"))
+        self.removeButton.setText(_("&Remove"))
+        self.modeLabel.setText(_("Engraving mode:"))
+        self.modeCombo.setItemText(0, _("Preview"))
+        self.modeCombo.setItemText(1, _("Publish"))
+        self.runButton.setText(_("Run LilyPond"))
+        self.abortButton.setText(_("Abort"))
+
+    def files(self):
+        """Returns the list of filenames to engrave."""
+        return [self.fileList.item(i).text() for i in range(self.fileList.count())]
+
+    def setFiles(self, files):
+        """Sets the list of filenames to engrave."""
+        self.fileList.clear()
+        self.addFilenames(files)
+
+    def addFilenames(self, files):
+        """Adds filenames that are not yet in the list."""
+        present = set(self.files())
+        for filename in files:
+            filename = util.normpath(filename)
+            if filename not in present:
+                present.add(filename)
+                self.fileList.addItem(filename)
+        self.updateButtons()
+
+    def directory(self):
+        """Returns a directory to start a file dialog in."""
+        files = self.files()
+        if files:
+            return os.path.dirname(files[-1])
+        doc = self.parent().currentDocument()
+        return os.path.dirname(doc.url().toLocalFile()) if doc else ""
+
+    def addFiles(self):
+        """Called when the user clicks Add Files."""
+        filetypes = "{0} (*.ly *.lyi *.ily)".format(_("LilyPond Files"))
+        files = QFileDialog.getOpenFileNames(self, app.caption(_("Add Files")),
+            self.directory(), filetypes)[0]
+        self.addFilenames(files)
+
+    def addFolder(self):
+        """Called when the user clicks Add Folder."""
+        directory = QFileDialog.getExistingDirectory(self,
+            app.caption(_("Add Folder")), self.directory())
+        if directory:
+            self.addFilenames(lilypondFiles(directory))
+
+    def addDocuments(self):
+        """Called when the user clicks Add Open Documents."""
+        self.addFilenames(d.url().toLocalFile() for d in app.documents
+            if d.url().toLocalFile())
+
+    def removeFiles(self):
+        """Called when the user clicks Remove."""
+        for item in self.fileList.selectedItems():
+            self.fileList.takeItem(self.fileList.row(item))
+        self.updateButtons()
+
+    def updateButtons(self):
+        running = bool(self._batch and self._batch.is_running())
+        self.runButton.setEnabled(not running and self.fileList.count() > 0)
+        self.abortButton.setEnabled(running)
+        self.removeButton.setEnabled(not running
+            and bool(self.fileList.selectedItems()))
+
+    def run(self):
+        """Saves modified documents if desired and starts the Batch."""
+        files = self.files()
+        if not files:
+            return
+        if QSettings().value("lilypond_settings/save_on_run", False, bool):
+            for filename in files:
+                doc = app.findDocument(QUrl.fromLocalFile(filename))
+                if doc and doc.isModified():
+                    try:
+                        doc.save()
+                    except IOError:
+                        pass
+        args = ['-dpoint-and-click'] if self.modeCombo.currentIndex() == 0 else None
+        self.results.clear()
+        self.summary.clear()
+        self.progress.setRange(0, len(files))
+        self.progress.setValue(0)
+        self.progress.show()
+        b = self._batch = Batch(files, args, self.parent())
+        b.finished.connect(self.slotFinished)
+        b.done.connect(self.slotDone)
+        b.start()
+        self.updateButtons()
+
+    def abort(self):
+        """Aborts the running Batch."""
+        if self._batch:
+            self._batch.abort()
+
+    def slotFinished(self, filename, j, success):
+        """Called when a file has been engraved."""
+        self.progress.setValue(self.progress.value() + 1)
+        if success:
+            return
+        item = QTreeWidgetItem(self.results)
+        item.setText(0, filename)
+        item.setIcon(0, icons.get('dialog-error'))
+        item.setData(0, Qt.UserRole, (filename, 0, 0))
+        for errfile, line, column, message in errors(j):
+            child = QTreeWidgetItem(item)
+            child.setText(0, "{0}:{1}:{2}: {3}".format(
+                os.path.basename(errfile), line, column, message))
+            child.setToolTip(0, errfile)
+            child.setData(0, Qt.UserRole, (errfile, line, column))
+        item.setExpanded(True)
+
+    def slotDone(self):
+        """Called when the Batch has finished."""
+        b = self._batch
+        total = len(b.files())
+        failed = len(b.failures())
+        finished = len(b.results())
+        if finished < total:
+            text = _("Aborted: {count} of {total} files engraved.").format(
+                count=finished, total=total)
+        elif failed:
+            text = _("{failed} of {total} files failed to engrave.").format(
+                failed=failed, total=total)
+        else:
+            text = _("All {total} files engraved successfully.").format(total=total)
+        self.summary.setText(text)
+        self.updateButtons()
+
+    def slotItemActivated(self, item):
+        """Opens the file (at the error position) of the activated item."""
+        filename, line, column = item.data(0, Qt.UserRole)
+        from logtool.errors import Reference
+        cursor = Reference(filename, line, column).cursor(True)
+        if cursor:
+            import browseriface
+            browseriface.get(self.parent()).setTextCursor(cursor)
+            self.parent().activateWindow()
+
+    def reject(self):
+        """Does not close the dialog while engraving."""
+        if not (self._batch and self._batch.is_running()):
+            super(Dialog, self).reject()
@@ -28,12 +28,17 @@ from PyQt5.QtCore import QSettings
 
 import job
 import documentinfo
+import fileinfo
 import lilypondinfo
 
 
 def info(document):
     """Returns a LilyPondInfo instance that should be used by default to engrave the document."""
-    version = documentinfo.docinfo(document).version()
+    return _info(documentinfo.docinfo(document).version())
+
+
+def _info(version):
+    """Returns the LilyPondInfo to use for a document with the specified version."""
     if version and QSettings().value("lilypond_settings/autoversion", False, bool):
         return lilypondinfo.suitable(version)
     return lilypondinfo.preferred()
@@ -50,8 +55,22 @@ def defaultJob(document, args=None):
 
     """
     filename, includepath = documentinfo.info(document).jobinfo(True)
+    return _job(filename, includepath, info(document), document.documentName(), args)
+
+
+def fileJob(filename, args=None):
+    """Return a default job for a file that is not loaded as a Document.
+
+    The arguments are handled as in defaultJob().
+
+    """
+    version = fileinfo.docinfo(filename).version()
+    name = os.path.basename(filename)
+    return _job(filename, documentinfo.includepath(), _info(version), name, args)
+
 
-    i = info(document)
+def _job(filename, includepath, i, name, args):
+    """Return a job to run the LilyPondInfo i on the filename."""
     j = job.Job()
 
     command = [i.abscommand() or i.command]
@@ -89,5 +108,5 @@ def defaultJob(document, args=None):
         j.environment['LANG'] = 'C'
         j.environment['LC_ALL'] = 'C'
     j.set_title("{0} {1} [{2}]".format(
-        os.path.basename(i.command), i.versionString(), document.documentName()))
+        os.path.basename(i.command), i.versionString(), name))
     return j
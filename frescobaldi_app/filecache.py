@@ -36,7 +36,18 @@ class FileCache(object):
         self._cache = {}
 
     def __getitem__(self, filename):
+        return self.value(filename)
+
+    def value(self, filename, check=True):
+        """Returns the value for filename, raising KeyError if not available.
+
+        If check is False, the mtime of the file is not checked. This can be
+        used if the file is watched for changes in another way.
+
+        """
         mtime, value = self._cache[filename]
+        if not check:
+            return value
         try:
             if mtime == os.path.getmtime(filename):
                 return value
@@ -0,0 +1,240 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+r"""
+A persistent index of the definitions and includes of LilyPond files.
+
+For every file that is looked up, the names of the definitions, the markup
+command definitions and the \include arguments are stored, keyed by the real
+path of the file and checked against its size and modification time.
+
+The index is saved in Frescobaldi's cache directory on exit, so in a new
+session the included files need not be read and tokenized again. Once an
+entry is checked, the file is watched (see fileinfo.graph()), so it needs
+not be checked again until it changes.
+
+When the index is loaded, entries of files that were removed or changed are
+dropped. At most maxsize files are saved, the least recently used entries
+are dropped first.
+
+"""
+
+
+import json
+import os
+import threading
+
+from PyQt5.QtCore import QThread
+
+import ly.document
+import app
+import fileinfo
+import lydocinfo
+import util
+import variables
+
+
+# the maximum number of files in the saved index
+maxsize = 2000
+
+_index = None       # this can hold the dict of index entries, in order of use
+_changed = False
+_checked = set()    # files that are up to date and watched
+_lock = threading.Lock()
+
+_queue = []         # (filename, args, include_path) tuples waiting to be indexed
+_busy = False       # whether an _Indexer is running
+_indexers = []      # keeps references to running _Indexer instances
+
+
+def _indexfile():
+    """Returns the filename the index is stored in."""
+    return os.path.join(app.cachedir("fileindex"), "index.json")
+
+
+def _stat(filename):
+    """Returns a list [size, mtime] of the file, or None if it does not exist."""
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _load():
+    """Returns the index, loading it from disk the first time.
+
+    Entries of files that were removed or changed are dropped.
+    Must be called with the lock held.
+
+    """
+    global _index, _changed
+    if _index is None:
+        try:
+            with open(_indexfile(), encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        if not isinstance(index, dict):
+            index = {}
+        _index = dict((filename, e) for filename, e in index.items()
+                      if isinstance(e, dict) and e.get("stat") == _stat(filename))
+        _changed = len(_index) != len(index)
+        app.aboutToQuit.connect(_save)
+    return _index
+
+
+def _save():
+    """Writes the index to disk, if changed."""
+    global _changed
+    with _lock:
+        if not _changed:
+            return
+        for filename in list(_index)[:-maxsize]:
+            del _index[filename]
+        data = json.dumps(_index)
+        _changed = False
+    filename = _indexfile()
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename + ".tmp", "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(filename + ".tmp", filename)
+    except OSError:
+        pass
+
+
+def _scan(filename):
+    """Reads the file and returns a new index entry for it."""
+    with open(filename, 'rb') as f:
+        text = util.decode(f.read())
+    v = variables.variables(text)
+    dinfo = lydocinfo.DocInfo(ly.document.Document(text, v.get("mode")), v)
+    return {
+        "definitions": [str(t) for t in dinfo.definitions()],
+        "markup": [str(t) for t in dinfo.markup_definitions()],
+        "includes": dinfo.include_args(),
+    }
+
+
+def entry(filename):
+    """Returns the index entry (a dict) for the file, reading it if needed.
+
+    Returns None if the file can't be read.
+
+    """
+    global _changed
+    filename = os.path.realpath(filename)
+    with _lock:
+        e = _load().pop(filename, None)
+        if e:
+            # keep the most recently used entries at the end
+            _index[filename] = e
+            if filename in _checked:
+                return e
+    # start watching before checking, so no change goes unnoticed
+    g = fileinfo.graph()
+    watched = g is not None and g.watch(filename)
+    stat = _stat(filename)
+    if stat is None:
+        return
+    if not e or e.get("stat") != stat:
+        try:
+            e = _scan(filename)
+        except (IOError, OSError):
+            return
+        e["stat"] = stat
+        with _lock:
+            _index[filename] = e
+            _changed = True
+    if watched:
+        with _lock:
+            _checked.add(filename)
+    return e
+
+
+@fileinfo.changed.connect
+def _fileChanged(filename):
+    """Called when a watched file changes, it must be checked again."""
+    with _lock:
+        _checked.discard(filename)
+
+
+def definitions(filename):
+    """Returns the list of identifiers the file defines."""
+    e = entry(filename)
+    return e["definitions"] if e else []
+
+
+def markup_definitions(filename):
+    """Returns the list of markup commands the file defines."""
+    e = entry(filename)
+    return e["markup"] if e else []
+
+
+def include_args(filename):
+    r"""Returns the list of \include arguments in the file."""
+    e = entry(filename)
+    return e["includes"] if e else []
+
+
+def includefiles(dinfo, include_path=()):
+    """Returns the set of files included by the DocInfo's document.
+
+    This is the same as fileinfo.includefiles(), which also uses the index.
+
+    """
+    return fileinfo.includefiles(dinfo, include_path)
+
+
+def update(document):
+    """Brings the index up to date for the files the document includes.
+
+    This is done in a background thread.
+
+    """
+    global _busy
+    import documentinfo
+    info = documentinfo.info(document)
+    args = info.lydocinfo().include_args()
+    if not args:
+        return
+    filename = document.url().toLocalFile()
+    with _lock:
+        _queue.append((filename, args, info.includepath()))
+        if _busy:
+            return
+        _busy = True
+    indexer = _Indexer()
+    _indexers.append(indexer)
+    indexer.finished.connect(lambda: _indexers.remove(indexer))
+    indexer.start()
+
+
+class _Indexer(QThread):
+    """Indexes the included files of the queued documents."""
+    def run(self):
+        global _busy
+        while True:
+            with _lock:
+                if not _queue:
+                    _busy = False
+                    return
+                filename, args, include_path = _queue.pop(0)
+            fileinfo.resolve_includes(filename, args, include_path, include_args)
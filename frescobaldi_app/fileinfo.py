@@ -19,6 +19,10 @@
 
 """
 Computes and caches various information about files.
+
+The include graph (see graph()) remembers how includes were resolved, and
+watches the files and directories involved, so that lookups need not check
+the file system again as long as nothing changes.
 """
 
 
@@ -27,16 +31,23 @@ import re
 import os
 import atexit
 
+from PyQt5.QtCore import QCoreApplication, QFileSystemWatcher, QThread
+
 import ly.document
 import lydocinfo
 import ly.lex
 import filecache
+import signals
 import util
 import variables
 
 
 _document_cache = filecache.FileCache()
 _suffix_chars_re = re.compile(r'[^-\w]', re.UNICODE)
+_graph = None
+
+# emitted with the real path when a watched file has changed or was removed
+changed = signals.Signal()
 
 
 ### XXX otherwise I get a segfault on shutdown when very large music trees
@@ -57,8 +68,13 @@ class _CachedDocument(object):
 def _cached(filename):
     """Return a _CachedDocument instance for the filename, else creates one."""
     filename = os.path.realpath(filename)
+    g = graph()
+    # no need to check the mtime of a file that was already watched
+    check = not (g and g.is_watched(filename))
+    if g:
+        g.watch(filename)
     try:
-        c = _document_cache[filename]
+        c = _document_cache.value(filename, check)
     except KeyError:
         with open(filename, 'rb') as f:
             text = util.decode(f.read())
@@ -104,7 +120,7 @@ def textmode(text, guess=True):
         return ly.lex.guessMode(text)
 
 
-def includefiles(dinfo, include_path=()):
+def includefiles(dinfo, include_path=(), include_args=None):
     """Returns a set of filenames that are included by the DocInfo's document.
 
     The specified include path is used to find files. The own filename
@@ -115,34 +131,196 @@ def includefiles(dinfo, include_path=()):
     If the document has no local filename, only the include_path is
     searched for files.
 
+    If include_args is given, it is called with a filename and should return
+    the list of include arguments of that file, otherwise they are looked up
+    in the file index (see fileindex.include_args()), so only files that are
+    not in the index or have changed are read.
+
     """
-    filename = dinfo.document.filename
-    basedir = os.path.dirname(filename) if filename else None
-    files = set()
+    return resolve_includes(dinfo.document.filename, dinfo.include_args(),
+                            include_path, include_args)
+
+
+def resolve_includes(filename, args, include_path=(), include_args=None):
+    """Returns the set of files included by filename, that has include args.
 
-    def tryarg(directory, arg):
-        path = os.path.realpath(os.path.join(directory, arg))
-        if path not in files and os.path.isfile(path):
-            files.add(path)
-            args = docinfo(path).include_args()
-            find(args, os.path.dirname(path))
-            return True
+    This does the work for includefiles().
 
-    def find(incl_args, directory):
+    """
+    if include_args is None:
+        import fileindex
+        include_args = fileindex.include_args
+    basedir = os.path.dirname(filename) if filename else None
+    files = set()
+    g = graph()
+    if g:
+        find_file = g.find
+        get_args = lambda path: g.include_args(path, include_args)
+        if filename:
+            filename = os.path.realpath(filename)
+    else:
+        def find_file(path):
+            if os.path.isfile(path):
+                return os.path.realpath(path)
+        get_args = include_args
+
+    def tryarg(parent, directory, arg):
+        path = find_file(os.path.normpath(os.path.join(directory, arg)))
+        if path:
+            if g and parent:
+                g.add_edge(parent, path)
+            if path not in files:
+                files.add(path)
+                find(get_args(path), os.path.dirname(path), path)
+                return True
+
+    def find(incl_args, directory, parent):
         for arg in incl_args:
             # new, recursive, relative include
-            if not (directory and tryarg(directory, arg)):
+            if not (directory and tryarg(parent, directory, arg)):
                 # old include (relative to master file)
-                if not (basedir and tryarg(basedir, arg)):
+                if not (basedir and tryarg(parent, basedir, arg)):
                     # if path is given, also search there:
                     for p in include_path:
-                        if tryarg(p, arg):
+                        if tryarg(parent, p, arg):
                             break
 
-    find(dinfo.include_args(), basedir)
+    find(args, basedir, filename)
     return files
 
 
+def graph():
+    """Returns the global IncludeGraph.
+
+    Returns None if not called from the main thread, the graph and its
+    file system watcher may only be used from there.
+
+    """
+    global _graph
+    app = QCoreApplication.instance()
+    if app is None or QThread.currentThread() is not app.thread():
+        return None
+    if _graph is None:
+        _graph = IncludeGraph()
+    return _graph
+
+
+def includers(filename):
+    """Returns the set of files that were seen including the specified file.
+
+    Only files that were resolved by includefiles() are known.
+
+    """
+    g = graph()
+    return g.includers(os.path.realpath(filename)) if g else set()
+
+
+def masters(filename):
+    """Returns the set of files that (directly or indirectly) include filename."""
+    g = graph()
+    return g.masters(os.path.realpath(filename)) if g else set()
+
+
+class IncludeGraph(object):
+    """Remembers include arguments of files, how they are resolved and by whom.
+
+    The files and directories that are looked at are watched with a
+    QFileSystemWatcher, and the information is forgotten when they change.
+    So as long as nothing changes, no file system access is needed.
+
+    All paths are real paths.
+
+    """
+    def __init__(self):
+        self._args = {}         # path: list of include arguments
+        self._found = {}        # normalized path: real path or None
+        self._parents = {}      # path: set of paths including it
+        self._watched = set()
+        self._watcher = QFileSystemWatcher()
+        self._watcher.fileChanged.connect(self._fileChanged)
+        self._watcher.directoryChanged.connect(self._directoryChanged)
+
+    def is_watched(self, path):
+        """Returns True if path is already being watched."""
+        return path in self._watched
+
+    def watch(self, path):
+        """Starts watching path, returns True if it is watched."""
+        if path not in self._watched:
+            if not self._watcher.addPath(path):
+                return False
+            self._watched.add(path)
+        return True
+
+    def find(self, path):
+        """Returns the real path if the (normalized) path is a file, else None."""
+        try:
+            return self._found[path]
+        except KeyError:
+            pass
+        result = os.path.realpath(path) if os.path.isfile(path) else None
+        # only remember if we'll notice a change
+        if self.watch(os.path.dirname(path)):
+            self._found[path] = result
+        return result
+
+    def include_args(self, path, function):
+        """Returns the include arguments of path, calling function if needed."""
+        try:
+            return self._args[path]
+        except KeyError:
+            args = function(path)
+            if self.watch(path):
+                self._args[path] = args
+            return args
+
+    def add_edge(self, parent, child):
+        """Records that the file parent includes the file child."""
+        self._parents.setdefault(child, set()).add(parent)
+
+    def includers(self, path):
+        """Returns the set of files that include path directly."""
+        return set(self._parents.get(path, ()))
+
+    def masters(self, path):
+        """Returns the set of files that include path directly or indirectly."""
+        result = set()
+        todo = [path]
+        while todo:
+            for parent in self._parents.get(todo.pop(), ()):
+                if parent not in result:
+                    result.add(parent)
+                    todo.append(parent)
+        result.discard(path)
+        return result
+
+    def _fileChanged(self, path):
+        """Called when a watched file changes or is removed."""
+        if path not in self._watcher.files():
+            # the watcher stops watching files that are removed or replaced
+            # (e.g. by renaming another file), watch the new one if possible
+            self._watched.discard(path)
+            if os.path.exists(path):
+                self.watch(path)
+        self._args.pop(path, None)
+        for parents in self._parents.values():
+            parents.discard(path)
+        try:
+            del _document_cache[path]
+        except KeyError:
+            pass
+        changed(path)
+
+    def _directoryChanged(self, path):
+        """Called when files are added to or removed from a directory."""
+        if path not in self._watcher.directories():
+            self._watched.discard(path)
+            if os.path.isdir(path):
+                self.watch(path)
+        for key in [key for key in self._found if os.path.dirname(key) == path]:
+            del self._found[key]
+
+
 def basenames(dinfo, includefiles=(), filename=None, replace_suffix=True):
     """Returns the list of basenames a document is expected to create.
 
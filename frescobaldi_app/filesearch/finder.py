@@ -0,0 +1,207 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Finds the matches of a search in the text of documents and files.
+
+The Searcher searches a number of texts and files using a thread pool, and
+reports the results for every text or file as soon as they are available.
+"""
+
+
+import bisect
+import concurrent.futures
+import mmap
+import os
+import re
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+import ly.lex
+import fileinfo
+import util
+
+
+# which parts of the text are searched
+ALL = 0
+MUSIC = 1
+COMMENTS = 2
+
+
+def pattern(search, regex=False, case=True):
+    """Returns the compiled regular expression for the search.
+
+    Raises re.error if regex is True and the search is not a valid regular
+    expression.
+
+    """
+    flags = re.MULTILINE | re.DOTALL
+    if not case:
+        flags |= re.IGNORECASE
+    if not regex:
+        search = re.escape(search)
+    return re.compile(search, flags)
+
+
+def needle(search, regex=False, case=True):
+    """Returns bytes that must occur in a file that has a match, or None.
+
+    This is only possible for case sensitive plain text searches in ASCII,
+    which have the same bytes in every encoding LilyPond files use (except
+    UTF-16, see read()).
+
+    """
+    if not regex and case:
+        try:
+            return search.encode('ascii')
+        except UnicodeError:
+            pass
+
+
+def read(filename, needle=None):
+    """Returns the decoded text of the file.
+
+    If needle is given and does not occur in the file, None is returned. The
+    file is memory-mapped, so files without the needle are never completely
+    read into memory or decoded.
+
+    """
+    with open(filename, 'rb') as f:
+        try:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # an empty file can't be mapped
+            return None if needle else ''
+        with m:
+            if (needle and m[:2] not in (b'\xff\xfe', b'\xfe\xff')
+                and m.find(needle) == -1):
+                return None
+            data = m[:]
+    return util.decode(data)
+
+
+def tokens(text):
+    """Returns two lists with the positions and classes of the tokens in text."""
+    state = ly.lex.state(fileinfo.textmode(text))
+    positions = []
+    classes = []
+    offset = 0
+    for line in text.split('\n'):
+        for t in state.tokens(line):
+            positions.append(offset + t.pos)
+            classes.append(type(t))
+        offset += len(line) + 1
+    return positions, classes
+
+
+def accept(cls, which):
+    """Returns True if text in a token of class cls is searched."""
+    if which == COMMENTS:
+        return issubclass(cls, ly.lex.Comment)
+    elif which == MUSIC:
+        return not issubclass(cls, (ly.lex.Comment, ly.lex.String))
+    return True
+
+
+def find(text, pattern, which=ALL):
+    """Returns the list of (non-empty) match objects of the pattern in text.
+
+    If which is MUSIC or COMMENTS, the text is tokenized and only matches
+    starting in the requested kind of tokens are returned.
+
+    """
+    matches = [m for m in pattern.finditer(text) if m.end() > m.start()]
+    if which != ALL and matches:
+        positions, classes = tokens(text)
+        def accepted(m):
+            i = bisect.bisect_right(positions, m.start()) - 1
+            return i >= 0 and accept(classes[i], which)
+        matches = list(filter(accepted, matches))
+    return matches
+
+
+def results(text, matches):
+    """Returns a list of (start, end, line, column, linetext) tuples.
+
+    Line and column are zero-based.
+
+    """
+    result = []
+    line = 0
+    linestart = 0
+    for m in matches:
+        start = m.start()
+        while True:
+            newline = text.find('\n', linestart, start)
+            if newline == -1:
+                break
+            line += 1
+            linestart = newline + 1
+        lineend = text.find('\n', start)
+        if lineend == -1:
+            lineend = len(text)
+        result.append((start, m.end(), line, start - linestart, text[linestart:lineend]))
+    return result
+
+
+class Searcher(QThread):
+    """Searches texts and files in a thread pool.
+
+    sources is a list of (text, filename) tuples, if text is None, the file is
+    read. For every source that has matches, the found signal is emitted with
+    the index of the source and the list of results (see results()).
+
+    """
+    found = pyqtSignal(int, object)
+
+    def __init__(self, sources, pattern, which=ALL, needle=None):
+        super(Searcher, self).__init__()
+        self.sources = sources
+        self.pattern = pattern
+        self.which = which
+        self.needle = needle
+
+    def run(self):
+        with concurrent.futures.ThreadPoolExecutor(os.cpu_count() or 1) as pool:
+            futures = [pool.submit(self.search, index)
+                       for index in range(len(self.sources))]
+            for future in concurrent.futures.as_completed(futures):
+                if self.isInterruptionRequested():
+                    for f in futures:
+                        f.cancel()
+                    break
+                index, result = future.result()
+                if result:
+                    self.found.emit(index, result)
+
+    def search(self, index):
+        """Searches the source at index, returns (index, results)."""
+        if self.isInterruptionRequested():
+            return index, None
+        text, filename = self.sources[index]
+        if text is None:
+            try:
+                text = read(filename, self.needle)
+            except (IOError, OSError):
+                text = None
+            if text is None:
+                return index, None
+        return index, results(text, find(text, self.pattern, self.which))
+
+
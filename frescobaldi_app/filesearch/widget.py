@@ -0,0 +1,298 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+The Search in Files widget.
+"""
+
+
+import bisect
+import os
+import re
+
+from PyQt5.QtCore import Qt, QUrl
+from PyQt5.QtGui import QTextCursor
+from PyQt5.QtWidgets import (
+    QCheckBox, QComboBox, QGridLayout, QLabel, QLineEdit, QMessageBox,
+    QPushButton, QTreeWidget, QTreeWidgetItem, QWidget)
+
+import app
+import cursortools
+import documentinfo
+import fileindex
+import fileinfo
+import textformats
+
+from . import finder
+
+
+class Widget(QWidget):
+    def __init__(self, tool):
+        super(Widget, self).__init__(tool)
+        self._searcher = None
+        self._sources = []      # (document, filename) tuples
+        self._items = {}        # index in sources: QTreeWidgetItem
+        self._keys = []         # sorted texts of the file items
+        self._count = 0
+
+        grid = QGridLayout()
+        grid.setContentsMargins(4, 4, 4, 4)
+        self.setLayout(grid)
+
+        self.searchLabel = QLabel()
+        self.searchEntry = QLineEdit(returnPressed=self.slotSearch)
+        self.searchButton = QPushButton(clicked=self.slotSearch)
+        self.caseCheck = QCheckBox(checked=True)
+        self.regexCheck = QCheckBox()
+        self.whichCombo = QComboBox()
+        self.whichCombo.addItems([''] * 3)
+        self.replaceLabel = QLabel()
+        self.replaceEntry = QLineEdit()
+        self.replaceAllButton = QPushButton(clicked=self.slotReplaceAll)
+        self.statusLabel = QLabel()
+        self.results = QTreeWidget(headerHidden=True)
+        self.results.itemActivated.connect(self.slotItemActivated)
+
+        grid.addWidget(self.searchLabel, 0, 0)
+        grid.addWidget(self.searchEntry, 0, 1)
+        grid.addWidget(self.searchButton, 0, 2)
+        grid.addWidget(self.caseCheck, 0, 3)
+        grid.addWidget(self.regexCheck, 0, 4)
+        grid.addWidget(self.whichCombo, 0, 5)
+        grid.addWidget(self.replaceLabel, 1, 0)
+        grid.addWidget(self.replaceEntry, 1, 1)
+        grid.addWidget(self.replaceAllButton, 1, 2)
+        grid.addWidget(self.statusLabel, 1, 3, 1, 3)
+        grid.addWidget(self.results, 2, 0, 1, 6)
+
+        app.settingsChanged.connect(self.readSettings)
+        self.readSettings()
+        app.translateUI(self)
+        self.updateButtons()
+
+    def translateUI(self):
+        self.searchLabel.setText(_("Search:"))
+        self.searchButton.setText(_("&Find All"))
+        self.searchButton.setToolTip(_(
+            "Searches all open documents and the files they include."))
+        self.caseCheck.setText(_("&Case"))
+        self.caseCheck.setToolTip(_("Case Sensitive"))
+        self.regexCheck.setText(_("&Regex"))
+        self.regexCheck.setToolTip(_("Regular Expression"))
+        self.whichCombo.setItemText(finder.ALL, _("Everywhere"))
+        self.whichCombo.setItemText(finder.MUSIC, _("Only in Music"))
+        self.whichCombo.setItemText(finder.COMMENTS, _("Only in Comments"))
+        self.replaceLabel.setText(_("Replace:"))
+        self.replaceAllButton.setText(_("Replace &All"))
+        self.replaceAllButton.setToolTip(_(
+            "Replaces all occurrences in the documents and files that were found. "
+            "Files that are not open are opened, so you can review the changes "
+            "before saving them."))
+        self.updateStatus()
+
+    def readSettings(self):
+        data = textformats.formatData('editor')
+        self.searchEntry.setFont(data.font)
+        self.replaceEntry.setFont(data.font)
+        self.results.setFont(data.font)
+
+    def pattern(self):
+        """Returns the compiled search, or None if there is no valid search."""
+        search = self.searchEntry.text()
+        if search:
+            try:
+                return finder.pattern(search,
+                    self.regexCheck.isChecked(), self.caseCheck.isChecked())
+            except re.error:
+                pass
+
+    def sources(self):
+        """Returns a list of (document, filename) tuples to search.
+
+        These are the open documents and the files they include that are
+        not open. For files document is None. Documents that are not loaded
+        yet (see document.Document.setLazyText()) are searched as files, so
+        they need not be loaded.
+
+        """
+        sources = []
+        filenames = set()
+        for doc in app.documents:
+            filename = doc.url().toLocalFile()
+            if filename:
+                filenames.add(os.path.realpath(filename))
+            if doc.isLoaded():
+                sources.append((doc, filename))
+            elif filename:
+                sources.append((None, filename))
+        included = set()
+        for doc in app.documents:
+            info = documentinfo.info(doc)
+            if doc.isLoaded():
+                included.update(info.includefiles())
+            else:
+                filename = doc.url().toLocalFile()
+                if filename:
+                    included.update(fileinfo.resolve_includes(filename,
+                        fileindex.include_args(filename), info.includepath()))
+        sources.extend((None, f) for f in sorted(included - filenames))
+        return sources
+
+    def slotSearch(self):
+        """Starts searching."""
+        self.stop()
+        self.results.clear()
+        self._items = {}
+        self._keys = []
+        self._count = 0
+        pattern = self.pattern()
+        if not pattern:
+            self._sources = []
+            self.updateStatus()
+            return
+        self._sources = self.sources()
+        # take a snapshot of the text of the open documents
+        sources = [(doc.toPlainText() if doc else None, filename)
+                   for doc, filename in self._sources]
+        needle = finder.needle(self.searchEntry.text(),
+            self.regexCheck.isChecked(), self.caseCheck.isChecked())
+        self._searcher = s = finder.Searcher(sources, pattern,
+            self.whichCombo.currentIndex(), needle)
+        s.found.connect(lambda index, results: self.slotFound(s, index, results))
+        s.finished.connect(lambda: self.slotFinished(s))
+        s.start()
+        self.updateStatus()
+        self.updateButtons()
+
+    def stop(self):
+        """Stops a running search."""
+        if self._searcher:
+            self._searcher.requestInterruption()
+            self._searcher.wait()
+            self._searcher = None
+
+    def slotFound(self, searcher, index, results):
+        """Called when a document or file has results."""
+        if searcher is not self._searcher:
+            return  # from a stopped search
+        doc, filename = self._sources[index]
+        name = doc.documentName() if doc else os.path.basename(filename)
+        item = self._items[index] = QTreeWidgetItem()
+        item.setText(0, "{0} ({1})".format(name, len(results)))
+        # keep the files sorted, the results in the order they were found
+        i = bisect.bisect(self._keys, item.text(0))
+        self._keys.insert(i, item.text(0))
+        self.results.insertTopLevelItem(i, item)
+        item.setToolTip(0, filename or name)
+        for start, end, line, column, text in results:
+            child = QTreeWidgetItem(item)
+            child.setText(0, "{0}:{1}: {2}".format(line + 1, column + 1, text.strip()))
+            child.setData(0, Qt.UserRole, (index, line, column, end - start))
+        self._count += len(results)
+        self.updateStatus()
+
+    def slotFinished(self, searcher):
+        """Called when the search has finished."""
+        if searcher is not self._searcher:
+            return
+        self._searcher = None
+        self.updateStatus()
+        self.updateButtons()
+
+    def updateStatus(self):
+        """Shows the number of matches found."""
+        files = len(self._items)
+        if self._searcher:
+            text = _("Searching... {count} matches in {files} files").format(
+                count=self._count, files=files)
+        elif self._sources:
+            text = _("{count} matches in {files} files").format(
+                count=self._count, files=files)
+        else:
+            text = ''
+        self.statusLabel.setText(text)
+
+    def updateButtons(self):
+        """Enables the Replace All button if there are results."""
+        self.replaceAllButton.setEnabled(not self._searcher and bool(self._items))
+
+    def document(self, index):
+        """Returns the document for the source at index, opening it if needed."""
+        doc, filename = self._sources[index]
+        if doc is None or doc not in app.documents:
+            doc = app.openUrl(QUrl.fromLocalFile(filename))
+            self._sources[index] = (doc, filename)
+        return doc
+
+    def slotItemActivated(self, item):
+        """Shows the match of the activated item in the editor."""
+        data = item.data(0, Qt.UserRole)
+        if not data:
+            return
+        index, line, column, length = data
+        try:
+            doc = self.document(index)
+        except IOError:
+            return
+        block = doc.findBlockByNumber(line)
+        if not block.isValid():
+            return
+        cursor = QTextCursor(block)
+        position = min(block.position() + column, block.position() + block.length() - 1)
+        cursor.setPosition(position)
+        cursor.setPosition(min(position + length, doc.characterCount() - 1), QTextCursor.KeepAnchor)
+        import browseriface
+        browseriface.get(self.parentWidget().mainwindow()).setTextCursor(cursor)
+
+    def slotReplaceAll(self):
+        """Replaces all matches in the documents and files with results."""
+        pattern = self.pattern()
+        if not pattern or not self._items:
+            return
+        if QMessageBox.question(self, app.caption(_("Replace All")), _(
+            "Replace {count} matches in {files} documents and files?\n\n"
+            "Files that are not open will be opened, the changes are not "
+            "saved automatically.").format(count=self._count, files=len(self._items))
+            ) != QMessageBox.Yes:
+            return
+        replace = self.replaceEntry.text()
+        regex = self.regexCheck.isChecked()
+        which = self.whichCombo.currentIndex()
+        for index in sorted(self._items):
+            try:
+                doc = self.document(index)
+            except IOError:
+                continue
+            # search again, the text may have changed
+            matches = finder.find(doc.toPlainText(), pattern, which)
+            if not matches:
+                continue
+            cursor = QTextCursor(doc)
+            with cursortools.compress_undo(cursor):
+                for m in reversed(matches):
+                    text = replace
+                    if regex:
+                        try:
+                            text = m.expand(replace)
+                        except re.error:
+                            continue
+                    cursor.setPosition(m.start())
+                    cursor.setPosition(m.end(), QTextCursor.KeepAnchor)
+                    cursor.insertText(text)
+        self.slotSearch()
@@ -26,8 +26,8 @@ The sidebar/ manages the visibility of the folding area.
 
 
 import cursortools
+import nesting
 import tokeniter
-import ly.lex
 import widgets.folding
 
 
@@ -35,14 +35,21 @@ line_painter = widgets.folding.LinePainter()
 
 
 class Folder(widgets.folding.Folder):
+    # the nesting index keeps the depth, no need to cache it
+    cache_depth_lines = 0
+
     def fold_events(self, block):
         """Provides folding information by looking at indent/dedent tokens."""
         for t in tokeniter.tokens(block):
-            if isinstance(t, (ly.lex.Indent, ly.lex.BlockCommentStart)):
+            if isinstance(t, nesting.FOLD_START):
                 yield widgets.folding.START
-            elif isinstance(t, (ly.lex.Dedent, ly.lex.BlockCommentEnd)):
+            elif isinstance(t, nesting.FOLD_STOP):
                 yield widgets.folding.STOP
 
+    def depth(self, block):
+        """Return the number of active regions at the start of this block."""
+        return nesting.index(self.document()).depth(nesting.FOLD, block)
+
     def mark(self, block, state=None):
         if state is None:
             try:
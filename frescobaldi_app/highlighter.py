@@ -24,6 +24,9 @@ about a document's contents.
 
 
 
+import array
+
+from PyQt5.QtCore import QSettings, QTimer
 from PyQt5.QtGui import (
     QColor, QSyntaxHighlighter, QTextBlockUserData, QTextCharFormat,
     QTextCursor, QTextDocument)
@@ -37,6 +40,7 @@ import cursortools
 import textformats
 import metainfo
 import plugin
+import signals
 import variables
 import documentinfo
 
@@ -57,6 +61,19 @@ def mapping(data):
                                 for cls in style.classes)
 
 
+def token_hash(tokens):
+    """Return a hash for the non-whitespace and non-comment tokens.
+
+    Returns None if there are no such tokens, so that blank lines and lines
+    with only comments can be skipped when combining the hashes of blocks.
+
+    """
+    tokens = tuple(t for t in tokens
+                   if not isinstance(t, (ly.lex.Space, ly.lex.Comment)))
+    if tokens:
+        return hash(tokens)
+
+
 def highlighter(document):
     """Return the Highlighter for this document."""
     return Highlighter.instance(document)
@@ -83,6 +100,85 @@ def _reset_highlight_mapping():
 app.settingsChanged.connect(_reset_highlight_mapping, -100) # before all others
 
 
+def compact_tokens():
+    """Return True if the tokens should be stored in the compact form.
+
+    See pack_tokens().
+
+    """
+    global _compact_tokens
+    try:
+        return _compact_tokens
+    except NameError:
+        _compact_tokens = QSettings().value(
+            "editor_highlighting/compact_tokens", False, bool)
+        return _compact_tokens
+
+
+def _reset_compact_tokens():
+    """Re-read the compact tokens setting next time."""
+    global _compact_tokens
+    try:
+        del _compact_tokens
+    except NameError:
+        pass
+
+app.settingsChanged.connect(_reset_compact_tokens, -100)
+
+
+# token classes seen by pack_tokens(), and their index in the list
+_token_classes = []
+_token_class_ids = {}
+
+
+def pack_tokens(tokens):
+    """Return the tokens as an array of (pos, length, class id) integers.
+
+    This needs much less memory than the token objects. Use unpack_tokens()
+    with the text of the line to get the tokens back.
+
+    """
+    a = array.array('i')
+    for t in tokens:
+        cls = type(t)
+        try:
+            i = _token_class_ids[cls]
+        except KeyError:
+            i = _token_class_ids[cls] = len(_token_classes)
+            _token_classes.append(cls)
+        a.extend((t.pos, len(t), i))
+    return a
+
+
+def unpack_tokens(packed, text):
+    """Return a tuple of tokens from an array created by pack_tokens()."""
+    return tuple(_token_classes[i](text[pos:pos+length], pos)
+        for pos, length, i in zip(packed[::3], packed[1::3], packed[2::3]))
+
+
+def stored_tokens(block):
+    """Return the tokens the Highlighter stored for the block, or None."""
+    data = block.userData()
+    try:
+        return data.tokens
+    except AttributeError:
+        pass
+    try:
+        packed = data.packed_tokens
+    except AttributeError:
+        return None
+    return unpack_tokens(packed, block.text())
+
+
+def _forget_tokens(data):
+    """Remove the stored tokens from the block user data."""
+    for name in ('tokens', 'packed_tokens', 'hash'):
+        try:
+            delattr(data, name)
+        except AttributeError:
+            pass
+
+
 class Highlighter(plugin.Plugin, QSyntaxHighlighter):
     """A QSyntaxHighlighter that can highlight a QTextDocument.
 
@@ -94,15 +190,47 @@ class Highlighter(plugin.Plugin, QSyntaxHighlighter):
     The Highlighter automatically re-reads the highlighting settings if they
     are changed.
 
+    When many lines are inserted at once (e.g. when a large document is
+    loaded), only the first chunkSize lines are lexed immediately. The other
+    lines are lexed in chunks from a timer, so the event loop keeps running.
+    Use lexUntil() to have the lines up to a certain block lexed right now.
+
+    When only the formats change (e.g. a different color scheme is chosen),
+    reformat() re-applies them using the stored tokens, without lexing.
+
+    The tokensChanged signal is emitted with the QTextBlock whenever the
+    stored tokens of a block are replaced or forgotten. Information derived
+    from the tokens can be kept up to date this way.
+
     """
+    tokensChanged = signals.Signal() # QTextBlock
+
+    # if more lines than this are inserted, lex them in chunks
+    chunkThreshold = 2000
+
+    # the number of lines to lex at a time
+    chunkSize = 200
+
     def __init__(self, document):
-        QSyntaxHighlighter.__init__(self, document)
+        QSyntaxHighlighter.__init__(self, None)
         self._fridge = ly.lex.Fridge()
-        app.settingsChanged.connect(self.rehighlight)
+        self._frontier = None   # QTextCursor at the first block not yet lexed
+        self._chunkTimer = QTimer(self, singleShot=True, interval=0)
+        self._chunkTimer.timeout.connect(self._lexChunk)
+        self._reformatting = False
+        # the highlighter must see the text of a document that is not loaded
+        if hasattr(document, 'ensureLoaded'):
+            document.ensureLoaded()
+        # connect before QSyntaxHighlighter does, so we can defer lexing
+        document.contentsChange.connect(self._contentsChange)
+        self.setDocument(document)
+        app.settingsChanged.connect(self.reformat)
         self._initialState = None
         self._highlighting = True
         self._mode = None
         self.initializeDocument()
+        if document.blockCount() > self.chunkThreshold:
+            self._deferFrom(document.firstBlock())
 
     def initializeDocument(self):
         """This method is always called by the __init__ method.
@@ -132,8 +260,71 @@ class Highlighter(plugin.Plugin, QSyntaxHighlighter):
         """Switch highlighting on or off depending on saved metainfo."""
         self.setHighlighting(metainfo.info(self.document()).highlighting)
 
+    def _contentsChange(self, position, removed, added):
+        """Called when the document changes, before the lines are highlighted."""
+        if removed != added:    # not when only formats changed
+            doc = self.document()
+            first = doc.findBlock(position)
+            last = doc.findBlock(position + added)
+            if last.blockNumber() - first.blockNumber() > self.chunkThreshold:
+                self._deferFrom(first)
+
+    def _deferFrom(self, block):
+        """Lexes chunkSize lines from block on, the remaining lines later."""
+        block = self.document().findBlockByNumber(block.blockNumber() + self.chunkSize)
+        if block.isValid() and (self._frontier is None
+                or block.blockNumber() < self._frontier.blockNumber()):
+            self._frontier = QTextCursor(block)
+            self._chunkTimer.start()
+
+    def _lexChunk(self):
+        """Called from the timer to lex the next chunk of lines."""
+        if self._frontier is not None:
+            num = self._frontier.blockNumber() + self.chunkSize - 1
+            block = self.document().findBlockByNumber(num)
+            self.lexUntil(block if block.isValid() else self.document().lastBlock())
+            if self._frontier is not None:
+                self._chunkTimer.start()
+
+    def lexUntil(self, block):
+        """Ensure the lines up to and including block are lexed.
+
+        This is only needed while lines are lexed in chunks, use tokeniter
+        to get the tokens, which calls this method if needed.
+
+        """
+        if self._frontier is None:
+            return
+        start = self._frontier.block()
+        if block.blockNumber() < start.blockNumber():
+            return
+        end = block.next()
+        self._frontier = QTextCursor(end) if end.isValid() else None
+        self.rehighlightBlock(start)
+
+    def isLexing(self):
+        """Return True if some lines still need to be lexed."""
+        return self._frontier is not None
+
     def highlightBlock(self, text):
         """Called by Qt when the highlighting of the current line needs updating."""
+        if (self._frontier is not None and
+            self.currentBlock().blockNumber() >= self._frontier.blockNumber()):
+            # will be lexed later, forget the old tokens
+            data = self.currentBlockUserData()
+            if data:
+                _forget_tokens(data)
+                self.tokensChanged(self.currentBlock())
+            self.setCurrentBlockState(-1)
+            return
+
+        if self._reformatting:
+            # use the stored tokens if there are any, the state is unchanged
+            tokens = stored_tokens(self.currentBlock())
+            if tokens is not None:
+                self._applyFormats(tokens)
+                return
+
         # find the state of the previous line
         prev = self.previousBlockState()
         state = self._fridge.thaw(prev)
@@ -143,13 +334,23 @@ class Highlighter(plugin.Plugin, QSyntaxHighlighter):
 
         # collect and save the tokens
         tokens = tuple(state.tokens(text))
-        cursortools.data(self.currentBlock()).tokens = tokens
+        data = cursortools.data(self.currentBlock())
+        _forget_tokens(data)
+        if compact_tokens():
+            data.packed_tokens = pack_tokens(tokens)
+        else:
+            data.tokens = tokens
+        data.hash = token_hash(tokens)
+        self.tokensChanged(self.currentBlock())
 
         # if blank thus far, keep the highlighter coming back
         # because the parsing state is not yet known; else save the state
         self.setCurrentBlockState(prev - 1 if blank else self._fridge.freeze(state))
 
-        # apply highlighting if desired
+        self._applyFormats(tokens)
+
+    def _applyFormats(self, tokens):
+        """Apply highlighting to the tokens of the current block if desired."""
         if self._highlighting:
             setFormat = lambda f: self.setFormat(token.pos, len(token), f)
             mapping = highlight_mapping()
@@ -158,12 +359,25 @@ class Highlighter(plugin.Plugin, QSyntaxHighlighter):
                 if f:
                     setFormat(f)
 
+    def reformat(self):
+        """Re-apply the highlighting formats to the whole document.
+
+        Unlike rehighlight(), this does not lex the document again, but uses
+        the tokens stored by earlier runs of highlightBlock().
+
+        """
+        self._reformatting = True
+        try:
+            self.rehighlight()
+        finally:
+            self._reformatting = False
+
     def setHighlighting(self, enable):
         """Enable or disable highlighting."""
         changed = enable != self._highlighting
         self._highlighting = enable
         if changed:
-            self.rehighlight()
+            self.reformat()
 
     def isHighlighting(self):
         """Return whether highlighting is active."""
@@ -174,6 +174,18 @@ class Job(object):
             else:
                 self._process.terminate()
 
+    def cancel(self):
+        """Ends a job that has not been started and will not be started.
+
+        The job is marked as aborted and the done() signal is emitted with
+        False, so that everybody waiting for the job is released.
+
+        """
+        if not self._process and self.success is None:
+            self._aborted = True
+            self.success = False
+            self.done(False)
+
     def is_aborted(self):
         """Returns True if the job was aborted by calling abort()."""
         return self._aborted
@@ -21,16 +21,38 @@
 A JobManager exists for every Document, and ensures no two jobs are running
 at the same time.
 
+All JobManagers share a global queue: at most maxjobs() jobs run at the same
+time across all documents. When a job is started while another job of the
+same document is running or waiting, only the newest job is kept waiting;
+running hidden jobs (e.g. from the autocompiler) are aborted because they
+are superseded. Waiting jobs that are not hidden are started before hidden
+ones.
+
+Jobs that do not belong to a document (e.g. when engraving files that are
+not open) can be started with start_job(); they wait in the same queue.
+
 It also sends the app-wide signals jobStarted() and jobFinished().
 
 """
 
 
+import os
+
+from PyQt5.QtCore import QSettings
+
 import app
+import jobattributes
 import plugin
 import signals
 
 
+# JobManagers (or _Detached jobs) that have a pending job, in order of submission
+_waiting = []
+
+# running _Detached jobs
+_detached = []
+
+
 def manager(document):
     return JobManager.instance(document)
 
@@ -45,6 +67,75 @@ def is_running(document):
     return False
 
 
+def maxjobs():
+    """Returns the maximum number of jobs that may run at the same time."""
+    s = QSettings()
+    s.beginGroup("lilypond_settings")
+    return max(1, s.value("max_jobs", os.cpu_count() or 1, int))
+
+
+def running_jobs():
+    """Returns the number of jobs that are running, for all documents."""
+    return (sum(1 for mgr in JobManager.instances() if mgr._job and mgr._job.is_running())
+            + sum(1 for d in _detached if d._job.is_running()))
+
+
+def start_job(job):
+    """Starts a Job that does not belong to a document.
+
+    The job waits in the global queue if the maximum number of running
+    jobs is reached.
+
+    """
+    _waiting.append(_Detached(job))
+    _start_waiting_jobs()
+
+
+def cancel_job(job):
+    """Removes a Job started with start_job() from the queue if it is waiting."""
+    for d in _waiting:
+        if d._pending is job:
+            _waiting.remove(d)
+            break
+
+
+def _start_waiting_jobs():
+    """(Internal) Starts waiting jobs as long as the maximum is not reached."""
+    count = running_jobs()
+    while _waiting and count < maxjobs():
+        # jobs that are not hidden go first
+        ready = [mgr for mgr in _waiting
+                 if not (mgr._job and mgr._job.is_running())]
+        if not ready:
+            break
+        for mgr in ready:
+            if not jobattributes.get(mgr._pending).hidden:
+                break
+        else:
+            mgr = ready[0]
+        _waiting.remove(mgr)
+        job, mgr._pending = mgr._pending, None
+        mgr._run(job)
+        count += 1
+
+
+class _Detached(object):
+    """(Internal) Runs a Job that does not belong to a document."""
+    def __init__(self, job):
+        self._job = None
+        self._pending = job
+
+    def _run(self, job):
+        self._job = job
+        _detached.append(self)
+        job.done.connect(self._finished)
+        job.start()
+
+    def _finished(self, success):
+        _detached.remove(self)
+        _start_waiting_jobs()
+
+
 class JobManager(plugin.DocumentPlugin):
 
     started = signals.Signal()  # Job
@@ -52,28 +143,68 @@ class JobManager(plugin.DocumentPlugin):
 
     def __init__(self, document):
         self._job = None
+        self._pending = None
 
     def start_job(self, job):
-        """Starts a Job on our behalf."""
-        if not self.is_running():
-            self._job = job
-            job.done.connect(self._finished)
-            job.start()
-            self.started(job)
-            app.jobStarted(self.document(), job)
+        """Starts a Job on our behalf.
+
+        If a job for our document is already running, it is aborted if it is
+        hidden or if the new job is not hidden, and the new job waits until
+        it has finished. A job that was already waiting is replaced with the
+        new one, unless the new job is hidden and the waiting one is not; the
+        job that is not run is cancelled (see job.Job.cancel()). The job also
+        waits if the maximum number of running jobs is reached.
+
+        """
+        hidden = jobattributes.get(job).hidden
+        pending = self._pending
+        if pending is not None and hidden and not jobattributes.get(pending).hidden:
+            # a waiting job started by the user goes first
+            job.cancel()
+            return
+        rjob = self._job
+        if rjob and rjob.is_running():
+            if not rjob.is_aborted() and (jobattributes.get(rjob).hidden
+                                          or not hidden):
+                rjob.abort()
+        self._pending = job
+        if pending is None:
+            _waiting.append(self)
+        else:
+            pending.cancel()
+        _start_waiting_jobs()
+
+    def cancel_pending_job(self):
+        """Removes our waiting job, if any."""
+        if self._pending is not None:
+            self._pending = None
+            _waiting.remove(self)
+
+    def _run(self, job):
+        """(Internal) Really starts the job."""
+        self._job = job
+        job.done.connect(self._finished)
+        job.start()
+        self.started(job)
+        app.jobStarted(self.document(), job)
 
     def _finished(self, success):
+        job = self._job
         self.finished(job, success)
-        app.jobFinished(self.document(), self._job, success)
+        app.jobFinished(self.document(), job, success)
+        _start_waiting_jobs()
 
     def job(self):
         """Returns the last job if any."""
         return self._job
 
+    def pending_job(self):
+        """Returns the job that is waiting to be started, if any."""
+        return self._pending
+
     def is_running(self):
         """Returns True when a job is running."""
         if self._job:
             return self._job.is_running() and not self._job.is_aborted()
 
 
-
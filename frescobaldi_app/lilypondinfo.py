@@ -24,6 +24,7 @@ Settings stuff and handling for different LilyPond versions.
 
 import glob
 import codecs
+import json
 import os
 import sys
 import re
@@ -43,6 +44,9 @@ _scheduler = process.Scheduler()
 
 _infos = None   # this can hold a list of configured LilyPondInfo instances
 
+_probes = None  # this can hold a dict of stored results of running LilyPond
+_probes_changed = False
+
 
 def infos():
     """Returns all configured LilyPondInfo for the different used LilyPond versions."""
@@ -61,6 +65,10 @@ def infos():
             if info.abscommand():
                 _infos.append(info)
         app.aboutToQuit.connect(saveinfos)
+        # read stored results or, if a command changed, run it in the background
+        for info in _infos:
+            info.versionString.start()
+            info.datadir.start()
     return _infos
 
 
@@ -129,6 +137,72 @@ def suitable(version):
     return preferred()
 
 
+def _probefile():
+    """Returns the filename the results of running LilyPond are stored in."""
+    return os.path.join(app.cachedir("lilypondinfo"), "probes.json")
+
+
+def _stat(command):
+    """Returns a list [size, mtime] of the command, or None if it does not exist."""
+    try:
+        st = os.stat(command)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _probe(command):
+    """Returns a dict with stored results of running the LilyPond command.
+
+    The results are only returned if the command did not change since they
+    were stored. Otherwise an empty dict is returned.
+
+    """
+    global _probes
+    if _probes is None:
+        try:
+            with open(_probefile(), encoding="utf-8") as f:
+                _probes = json.load(f)
+        except (OSError, ValueError):
+            _probes = {}
+        if not isinstance(_probes, dict):
+            _probes = {}
+        app.aboutToQuit.connect(_saveprobes)
+    d = _probes.get(command)
+    if d and d.get("stat") == _stat(command):
+        return d
+    return {}
+
+
+def _storeprobe(command, name, value):
+    """Stores the result of running the LilyPond command under name."""
+    global _probes_changed
+    stat = _stat(command)
+    if stat is None:
+        return
+    d = _probe(command)
+    if not d:
+        d = _probes[command] = {"stat": stat}
+    d[name] = value
+    _probes_changed = True
+
+
+def _saveprobes():
+    """Writes the stored results of running LilyPond to disk, if changed."""
+    global _probes_changed
+    if not _probes_changed:
+        return
+    filename = _probefile()
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(_probes, f)
+        os.replace(filename + ".tmp", filename)
+    except OSError:
+        return
+    _probes_changed = False
+
+
 class CachedProperty(cachedproperty.CachedProperty):
     def wait(self, msg=None, timeout=0):
         """Returns the value for the property, waiting for it to be computed.
@@ -223,10 +297,16 @@ class LilyPondInfo(object):
 
     @CachedProperty.cachedproperty(depends=abscommand)
     def versionString(self):
-        if not self.abscommand():
+        command = self.abscommand()
+        if not command:
             return ""
 
-        p = process.Process([self.abscommand(), '--version'])
+        # stored from an earlier run if the command did not change
+        probe = _probe(command)
+        if "version" in probe:
+            return probe["version"]
+
+        p = process.Process([command, '--version'])
 
         @p.done.connect
         def done(success):
@@ -234,6 +314,7 @@ class LilyPondInfo(object):
                 output = codecs.decode(p.process.readLine(), 'latin1', 'replace')
                 m = re.search(r"\d+\.\d+(.\d+)?", output)
                 self.versionString = m.group() if m else ""
+                _storeprobe(command, "version", self.versionString.get())
             else:
                 self.versionString = ""
 
@@ -267,11 +348,17 @@ class LilyPondInfo(object):
         If this method returns False, the datadir could not be determined.
 
         """
-        if not self.abscommand():
+        command = self.abscommand()
+        if not command:
             return False
 
+        # stored from an earlier run if the command did not change
+        d = _probe(command).get("datadir")
+        if d and os.path.isdir(d):
+            return d
+
         # First ask LilyPond itself.
-        p = process.Process([self.abscommand(), '-e',
+        p = process.Process([command, '-e',
             "(display (ly:get-option 'datadir)) (newline) (exit)"])
         @p.done.connect
         def done(success):
@@ -279,6 +366,7 @@ class LilyPondInfo(object):
                 d = codecs.decode(p.process.readLine(), 'latin1', 'replace').strip('\n')
                 if os.path.isabs(d) and os.path.isdir(d):
                     self.datadir = d
+                    _storeprobe(command, "datadir", d)
                     return
 
             # Then find out via the prefix.
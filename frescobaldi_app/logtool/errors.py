@@ -47,6 +47,24 @@ def errors(document):
     return Errors.instance(document)
 
 
+def references(message):
+    """Yields (url, filename, line, column, text) for the file references in message.
+
+    message is job output as a (unicode) string, url is the matched
+    filename:line:column expression, text is the rest of the line after it.
+    Lines start numbering with 1, columns with 0 (LilyPond convention).
+
+    """
+    enc = sys.getfilesystemencoding()
+    data = message.encode('latin1', 'replace')
+    for m in message_re.finditer(data):
+        end = data.find(b'\n', m.end())
+        text = data[m.end()+1:end if end != -1 else None].strip()
+        filename = util.normpath(m.group(2).decode(enc))
+        yield (m.group(1).decode(enc), filename, int(m.group(3)),
+               int(m.group(4) or 0), text.decode(enc, 'replace'))
+
+
 class Errors(plugin.DocumentPlugin):
     """Maintains the list of references (errors/warnings) to documents after a Job run."""
 
@@ -89,12 +107,7 @@ class Errors(plugin.DocumentPlugin):
 
         """
         if type == job.STDERR:
-            enc = sys.getfilesystemencoding()
-            for m in message_re.finditer(message.encode('latin1')):
-                url = m.group(1).decode(enc)
-                filename = m.group(2).decode(enc)
-                filename = util.normpath(filename)
-                line, column = int(m.group(3)), int(m.group(4) or 0)
+            for url, filename, line, column, text in references(message):
                 self._refs[url] = Reference(filename, line, column)
 
     def cursor(self, url, load=False):
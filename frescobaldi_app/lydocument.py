@@ -109,6 +109,8 @@ class Document(ly.document.DocumentBase):
     """
 
     def __init__(self, document):
+        if hasattr(document, 'ensureLoaded'):
+            document.ensureLoaded()
         self._d = document
         super(Document, self).__init__()
         self.combine_undo = None
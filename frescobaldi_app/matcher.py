@@ -29,7 +29,8 @@ from PyQt5.QtWidgets import QAction
 import app
 import plugin
 import ly.lex
-import lydocument
+import nesting
+import tokeniter
 import viewhighlighter
 import actioncollection
 import actioncollectionmanager
@@ -142,64 +143,82 @@ def matches(cursor, view=None):
 
     If view is given, only the visible part of the document is searched.
 
+    The matching token is first looked for in the same line, then the
+    nesting index is used to find the line it is in.
+
     """
     block = cursor.block()
     column = cursor.position() - block.position()
-    tokens = lydocument.Runner(lydocument.Document(cursor.document()))
-    tokens.move_to_block(block)
-
-    if view is not None:
-        first_block = view.firstVisibleBlock()
-        bottom = view.contentOffset().y() + view.viewport().height()
-        pred_forward = lambda: view.blockBoundingGeometry(tokens.block).top() <= bottom
-        pred_backward = lambda: tokens.block >= first_block
-    else:
-        pred_forward = lambda: True
-        pred_backward = lambda: True
-
-    source = None
-    for token in tokens.forward_line():
+    tokens = tokeniter.tokens(block)
+    for i, token in enumerate(tokens):
         if token.pos <= column <= token.end:
-            if isinstance(token, ly.lex.MatchStart):
-                match, other = ly.lex.MatchStart, ly.lex.MatchEnd
-                def source_gen():
-                    while pred_forward():
-                        for t in tokens.forward_line():
-                            yield t
-                        if not tokens.next_block():
-                            break
-                source = source_gen()
-                break
-            elif isinstance(token, ly.lex.MatchEnd):
-                match, other = ly.lex.MatchEnd, ly.lex.MatchStart
-                def source_gen():
-                    while pred_backward():
-                        for t in tokens.backward_line():
-                            yield t
-                        if not tokens.previous_block():
-                            break
-                source = source_gen()
+            if isinstance(token, (ly.lex.MatchStart, ly.lex.MatchEnd)):
                 break
         elif token.pos > column:
-            break
-    cursors = []
-    if source:
-        # we've found a matcher item
-        cursors.append(tokens.cursor())
-        nest = 0
-        for token2 in source:
-            if isinstance(token2, other) and token2.matchname == token.matchname:
-                if nest == 0:
-                    # we've found the matching item!
-                    cursors.append(tokens.cursor())
-                    break
-                else:
-                    nest -= 1
-            elif isinstance(token2, match) and token2.matchname == token.matchname:
-                nest += 1
+            return []
+    else:
+        return []
+    cursors = [tokeniter.cursor(block, token)]
+    name = token.matchname
+    if isinstance(token, ly.lex.MatchStart):
+        # search forward
+        match, other = ly.lex.MatchStart, ly.lex.MatchEnd
+        token2 = _find(tokens[i+1:], name, match, other, 1, 0)
+        if not token2:
+            idx = nesting.index(block.document())
+            depth = idx.depth(name, block) + _depth(tokens[:i+1], name)
+            block = idx.find_forward(name, block, depth - 1)
+            if not block.isValid() or (view is not None and
+                    view.blockBoundingGeometry(block).top() >
+                    view.contentOffset().y() + view.viewport().height()):
+                return cursors
+            token2 = _find(tokeniter.tokens(block), name, match, other,
+                           idx.depth(name, block), depth - 1)
+    else:
+        # search backward
+        match, other = ly.lex.MatchEnd, ly.lex.MatchStart
+        token2 = _find(tokens[i-1::-1] if i else (), name, match, other, 1, 0)
+        if not token2:
+            idx = nesting.index(block.document())
+            depth = idx.depth(name, block) + _depth(tokens[:i], name)
+            block = idx.find_backward(name, block, depth - 1)
+            if not block.isValid() or (view is not None and
+                    block < view.firstVisibleBlock()):
+                return cursors
+            token2 = _find(tokeniter.tokens(block)[::-1], name, match, other,
+                           idx.depth(name, block.next()), depth - 1)
+    if token2:
+        cursors.append(tokeniter.cursor(block, token2))
     return cursors
 
 
+def _depth(tokens, name):
+    """Return the sum of the matching tokens with the name in tokens."""
+    depth = 0
+    for t in tokens:
+        if isinstance(t, ly.lex.MatchStart) and t.matchname == name:
+            depth += 1
+        elif isinstance(t, ly.lex.MatchEnd) and t.matchname == name:
+            depth -= 1
+    return depth
+
+
+def _find(tokens, name, match, other, depth, target):
+    """Return the token where the depth drops to target.
+
+    Tokens of the match class with the name raise the depth, tokens of the
+    other class lower it. Returns None if the target depth is not reached.
+
+    """
+    for t in tokens:
+        if isinstance(t, other) and t.matchname == name:
+            depth -= 1
+            if depth <= target:
+                return t
+        elif isinstance(t, match) and t.matchname == name:
+            depth += 1
+
+
 
 app.mainwindowCreated.connect(Matcher.instance)
 
@@ -269,6 +269,7 @@ def menu_lilypond(mainwindow):
     m.addAction(ac.engrave_publish)
     m.addAction(ac.engrave_debug)
     m.addAction(ac.engrave_custom)
+    m.addAction(ac.engrave_batch)
     m.addAction(ac.engrave_abort)
     m.addSeparator()
     m.addMenu(menu_lilypond_generated_files(mainwindow))
@@ -22,13 +22,179 @@ Frescobaldi's extensions of ly.music.
 """
 
 
+import bisect
+import itertools
 
+import ly.document
+import ly.lex
+import ly.music.event
 import ly.music.items
+import ly.music.read
 import fileinfo
 
 
 class Document(ly.music.items.Document):
-    """music.Document type that caches music trees using fileinfo."""
+    """music.Document type that caches music trees using fileinfo.
+
+    After the text has changed, update() can be used to read only the
+    toplevel nodes that were touched by the change again.
+
+    The durations of the children of music nodes are cached as cumulative
+    sums, so that computing a time position only needs to walk the nodes
+    from the toplevel down to the position. The cache is cleared on update().
+
+    """
+    def __init__(self, doc):
+        # this does what ly.music.items.Document.__init__() does, but
+        # remembers the reader and lexer state before every toplevel node
+        super(ly.music.items.Document, self).__init__()
+        self.document = doc
+        self.include_node = None
+        self.include_path = []
+        self.relative_includes = True
+        items, self._readerstates, self._endstate = self._read(0)[:3]
+        self.extend(items)
+        self._lexstates = [self._lexstate(n.position) for n in items]
+        self._offsets = {}
+
+    def _read(self, start, end=None, state=None):
+        """Read toplevel items from start on.
+
+        If end is given, reading stops before the first item that starts at
+        or after end. state is the (language, duration) state of the reader
+        to start with. Returns a tuple (items, states, endstate, stop):
+        the list of items, the list of reader states before every item,
+        the reader state after the last item and the position reading
+        stopped at (None if the end of the document was reached).
+
+        """
+        c = ly.document.Cursor(self.document, start)
+        source = ly.document.Source(c, True, tokens_with_position=True)
+        r = ly.music.read.Reader(source)
+        if state:
+            r.language, r.prev_duration = state
+        items, states = [], []
+        before = r.language, r.prev_duration
+        for t in ly.music.read.skip(source):
+            if end is not None and t.pos >= end:
+                return items, states, before, t.pos
+            item = r.read_item(t)
+            if item:
+                items.append(item)
+                states.append(before)
+                before = r.language, r.prev_duration
+        return items, states, before, None
+
+    def _lexstate(self, position):
+        """Return the frozen lexer state at the start of the line of position."""
+        return self.document.state(self.document.block(position)).freeze()
+
+    def _linestart(self, position):
+        """Return the position of the start of the line of position."""
+        return self.document.position(self.document.block(position))
+
+    def update(self, start, old_end, new_end):
+        """Update the tree after the text from start to old_end was replaced.
+
+        The new text ends at new_end. The toplevel nodes touched by the
+        change are read again, extending the range to whole lines, and the
+        nodes after it are moved. Returns False if the tree could not be
+        updated, because the change also affects the nodes after it (e.g.
+        when a brace or a block comment was opened). In that case the tree
+        must be created again.
+
+        """
+        delta = new_end - old_end
+        count = len(self)
+        positions = [n.position for n in self]
+
+        # find the first toplevel node touched by the change, and the lines
+        # to read, they may not contain parts of other nodes
+        i = max(0, bisect.bisect_right(positions, start) - 1)
+        if i < count and self[i].end_position() < start:
+            i += 1
+        j = bisect.bisect_right(positions, old_end, i)
+        while True:
+            rstart = self._linestart(min(start, positions[i]) if i < count else start)
+            if i > 0 and self[i - 1].end_position() >= rstart:
+                i -= 1
+            else:
+                break
+
+        # read until the line of the first node after the change that
+        # is not touched and has its line to itself, and check that the
+        # node is lexed and read the same way as before
+        rend = None
+        while j < count:
+            rend = self._linestart(positions[j] + delta)
+            if rend >= new_end:
+                end = self[j - 1].end_position() if j > i else -1
+                if (end + delta if end >= old_end else end) <= rend:
+                    break
+            j += 1
+        else:
+            rend = None
+        if j < count and self._lexstates[j] != self._lexstate(rend):
+            return False
+
+        state = self._readerstates[i] if i < count else self._endstate
+        items, states, endstate, stop = self._read(rstart, rend, state)
+        if j < count:
+            if stop != positions[j] + delta or endstate != self._readerstates[j]:
+                return False
+            if delta:
+                seen = set()
+                for node in self[j:]:
+                    _move(node, delta, positions[j], seen)
+        else:
+            self._endstate = endstate
+        self[i:j] = items
+        self._readerstates[i:j] = states
+        self._lexstates[i:j] = [self._lexstate(n.position) for n in items]
+        # durations may depend on other nodes, e.g. via variable references
+        self._offsets = {}
+        return True
+
+    def time_position(self, position, cancelled=None):
+        """Return the time position in the music at the specified cursor position.
+
+        The value is a fraction. If None is returned, we are not in a music
+        expression. This gives the same result as the method of
+        ly.music.items.Document, but uses the cached durations.
+
+        If cancelled is given, it is called regularly and if it returns True,
+        the computation is stopped and None is returned.
+
+        """
+        offsets = self._offsets
+        time = 0
+        scaling = 1
+        events = self.music_events_til_position(position)
+        if not events:
+            return
+        e = ly.music.event.Events()
+        for parent, nodes, s in events:
+            scaling *= s
+            if not nodes:
+                continue
+            count = len(nodes)
+            if count <= len(parent) and nodes[0] is parent[0] and nodes[-1] is parent[count - 1]:
+                # the nodes are the first children of the parent
+                try:
+                    sums = offsets[parent]
+                except KeyError:
+                    sums = [0]
+                    for node in parent:
+                        if cancelled and cancelled():
+                            return
+                        sums.append(sums[-1] + e.traverse(node, 0, 1))
+                    offsets[parent] = sums
+                time += sums[count] * scaling
+            else:
+                for node in nodes:
+                    time = e.traverse(node, time, scaling)
+        return time
+
     def get_included_document_node(self, node):
         """Return a Document for the Include node."""
         filename = node.filename()
@@ -45,3 +211,25 @@ class Document(ly.music.items.Document):
                     return d
 
 
+def _move(item, delta, minimum, seen):
+    """Add delta to the positions of the item, its descendants and tokens.
+
+    Only positions from minimum on are changed. The set seen contains the
+    id of every item and token that was already moved.
+
+    """
+    stack = [item]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or item.position < minimum:
+            continue
+        seen.add(id(item))
+        item.position += delta
+        for value in itertools.chain((item.token,), item.tokens, vars(item).values(), item):
+            if isinstance(value, ly.lex.Token):
+                if id(value) not in seen and value.pos >= minimum:
+                    seen.add(id(value))
+                    value.pos += delta
+                    value.end += delta
+            elif isinstance(value, ly.music.items.Item):
+                stack.append(value)
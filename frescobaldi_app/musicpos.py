@@ -19,10 +19,14 @@
 
 """
 Shows the time position of the text cursor in the music.
+
+The position is computed in a background thread, so that the editor does
+not stutter in large documents. Results are remembered per document revision
+and cursor position.
 """
 
 
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
 from PyQt5.QtWidgets import QLabel
 
 import weakref
@@ -32,8 +36,36 @@ import plugin
 import cursortools
 
 
+class Calculator(QThread):
+    """Computes the time position or length in a music tree in a background thread.
+
+    The key is a (revision, start, end) tuple, if end is None the time position
+    at start is computed, otherwise the length of the music between start and
+    end. When done, the result (a fraction or None) is in the result attribute.
+
+    The thread must be registered with DocumentInfo.addMusicReader(), so that
+    the tree is not updated while it is being read.
+
+    """
+    def __init__(self, music, key):
+        super(Calculator, self).__init__()
+        self.music = music
+        self.key = key
+        self.result = None
+
+    def run(self):
+        revision, start, end = self.key
+        if end is None:
+            self.result = self.music.time_position(start, self.isInterruptionRequested)
+        else:
+            self.result = self.music.time_length(start, end)
+
+
 class MusicPosition(plugin.ViewSpacePlugin):
     def __init__(self, space):
+        self._calculator = None
+        self._pending = None
+        self._results = {}
         self._timer = QTimer(singleShot=True, timeout=self.slotTimeout)
         self._waittimer = QTimer(singleShot=True, timeout=self.slotTimeout)
         self._label = QLabel()
@@ -48,6 +80,7 @@ class MusicPosition(plugin.ViewSpacePlugin):
         old = self._view()
         if old:
             self.disconnectView(old)
+        self._results = {}
         self._view = weakref.ref(view)
         self.connectView(view)
         self.startTimer()
@@ -62,34 +95,86 @@ class MusicPosition(plugin.ViewSpacePlugin):
 
     def startWaitTimer(self):
         """Called when the document changes, waits longer to prevent stutter."""
+        self.cancel()
         self._waittimer.start(900)
         self._timer.stop()
 
     def startTimer(self):
         """Called when the cursor moves."""
+        self.cancel()
         if not self._waittimer.isActive():
             self._timer.start(100)
 
-    def slotTimeout(self):
-        """Called when one of the timers fires."""
+    def cancel(self):
+        """Stops a running computation, its result will not be shown."""
+        self._pending = None
+        if self._calculator:
+            self._calculator.requestInterruption()
+
+    def currentKey(self):
+        """Returns the (revision, start, end) tuple for the current view."""
         view = self._view()
         if view:
-            d = view.document()
             c = view.textCursor()
-            import documentinfo
-            m = documentinfo.music(d)
-            import ly.duration
+            revision = view.document().revision()
             if c.hasSelection():
                 cursortools.strip_selection(c)
-                length = m.time_length(c.selectionStart(), c.selectionEnd())
-                text = _("Length: {length}").format(
-                    length=ly.duration.format_fraction(length)) if length is not None else ''
+                return revision, c.selectionStart(), c.selectionEnd()
+            return revision, c.position(), None
+
+    def slotTimeout(self):
+        """Called when one of the timers fires."""
+        key = self.currentKey()
+        if key is None:
+            return
+        if self._results and next(iter(self._results))[0] != key[0]:
+            # the document has changed
+            self._results = {}
+        try:
+            self.showResult(key, self._results[key])
+        except KeyError:
+            if self._calculator:
+                # wait till the running computation has stopped
+                self._pending = key
             else:
-                pos = m.time_position(c.position())
-                text = _("Pos: {pos}").format(
-                    pos=ly.duration.format_fraction(pos)) if pos is not None else ''
-            self._label.setText(text)
-            self._label.setVisible(bool(text))
+                self.startCalculator(key)
+
+    def startCalculator(self, key):
+        """Starts a background computation for the (revision, start, end) key."""
+        import documentinfo
+        # reading or updating the music tree happens in the main thread
+        info = documentinfo.info(self._view().document())
+        self._calculator = c = Calculator(info.music(), key)
+        info.addMusicReader(c)
+        c.finished.connect(self.slotFinished)
+        c.start()
+
+    def slotFinished(self):
+        """Called when the background computation is done."""
+        c, self._calculator = self._calculator, None
+        c.wait()
+        current = self.currentKey()
+        if current is None:
+            return
+        if not c.isInterruptionRequested() and c.key[0] == current[0]:
+            self._results[c.key] = c.result
+            if c.key == current:
+                self.showResult(c.key, c.result)
+        key, self._pending = self._pending, None
+        if key and key == current:
+            self.startCalculator(key)
+
+    def showResult(self, key, result):
+        """Displays the position or length in our label."""
+        import ly.duration
+        if result is None:
+            text = ''
+        elif key[2] is None:
+            text = _("Pos: {pos}").format(pos=ly.duration.format_fraction(result))
+        else:
+            text = _("Length: {length}").format(length=ly.duration.format_fraction(result))
+        self._label.setText(text)
+        self._label.setVisible(bool(text))
 
 
 app.viewSpaceCreated.connect(MusicPosition.instance)
@@ -19,67 +19,15 @@
 
 """
 Handles Point and Click.
+
+The links are read by the generic pointandclick module.
 """
 
 from __future__ import absolute_import
 
-import re
-import os
-import sys
-import weakref
-
-import qpopplerview
-
-import util
-import textedit
 import pointandclick
 
 
-# cache point and click handlers for poppler documents
-_cache = weakref.WeakKeyDictionary()
-
-
-def links(document):
-    try:
-        return _cache[document]
-    except KeyError:
-        l = _cache[document] = Links()
-        with l:
-            import popplerqt5
-            with qpopplerview.lock(document):
-                for num in range(document.numPages()):
-                    page = document.page(num)
-                    for link in page.links():
-                        if isinstance(link, popplerqt5.Poppler.LinkBrowse):
-                            t = textedit.link(link.url())
-                            if t:
-                                filename = util.normpath(t.filename)
-                                l.add_link(filename, t.line, t.column, (num, link.linkArea()))
-        return l
-
-
-class Links(pointandclick.Links):
-    """Stores all the links of a Poppler document sorted by URL and text position.
-
-    Only textedit:// urls are stored.
-
-    """
-    def cursor(self, link, load=False):
-        """Returns the destination of a link as a QTextCursor of the destination document.
-
-        If load (defaulting to False) is True, the document is loaded if it is not yet loaded.
-        Returns None if the url was not valid or the document could not be loaded.
-
-        """
-        import popplerqt5
-        if not isinstance(link, popplerqt5.Poppler.LinkBrowse) or not link.url():
-            return
-        t = textedit.link(link.url())
-        if t:
-            filename = util.normpath(t.filename)
-            return super(Links, self).cursor(filename, t.line, t.column, load)
-
+links = pointandclick.poppler_links
 
 positions = pointandclick.positions
-
-
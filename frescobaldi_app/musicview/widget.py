@@ -113,7 +113,7 @@ class MusicView(QWidget):
         self._currentDocument = doc
         document = doc.document()
         if document:
-            self._links = pointandclick.links(document)
+            self._links = pointandclick.links(document, doc.filename())
             self.view.load(document)
             position = self._positions.get(doc, (0, 0, 0))
             self.view.setPosition(position, True)
@@ -0,0 +1,344 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+
+"""
+Keeps track of the nesting of matching tokens such as { and }, << and >>.
+
+For every text block, the highlighter's tokens are summarized: for every
+kind of matching token (the matchname) the sum of the opening (+1) and
+closing (-1) tokens is stored, together with the lowest depth that is
+reached in the block, relative to the depth at the start of the block.
+
+These summaries are kept in a chunked list per matchname, where every chunk
+of blocks is summarized as well, so the nesting depth at the start of any
+block, and the first or last block where the depth drops below a certain
+level, are found without looking at all the tokens in between. When lines
+are inserted or removed, only the chunks containing them are updated.
+
+The folding events (see the folding module) are kept under the FOLD key.
+
+"""
+
+
+import ly.lex
+import cursortools
+import highlighter
+import plugin
+
+
+# key for the folding events
+FOLD = None
+
+# tokens that start or stop a fold region
+FOLD_START = (ly.lex.Indent, ly.lex.BlockCommentStart)
+FOLD_STOP = (ly.lex.Dedent, ly.lex.BlockCommentEnd)
+
+
+def index(document):
+    """Return the NestingIndex for the document."""
+    return NestingIndex.instance(document)
+
+
+def summarize(tokens):
+    """Return a dict mapping key to a (sum, minimum) tuple for the tokens.
+
+    The key is the matchname of MatchStart and MatchEnd tokens, or FOLD.
+    The minimum is the lowest depth reached (relative to the start, so
+    never greater than zero.)
+
+    """
+    result = {}
+    for t in tokens:
+        for key, delta in _events(t):
+            total, minimum = result.get(key, (0, 0))
+            total += delta
+            result[key] = (total, min(total, minimum))
+    return result
+
+
+def _events(token):
+    """Yield (key, delta) tuples for the token."""
+    if isinstance(token, ly.lex.MatchStart):
+        yield token.matchname, 1
+    elif isinstance(token, ly.lex.MatchEnd):
+        yield token.matchname, -1
+    if isinstance(token, FOLD_START):
+        yield FOLD, 1
+    elif isinstance(token, FOLD_STOP):
+        yield FOLD, -1
+
+
+class NestingIndex(plugin.DocumentPlugin):
+    """Maintains the nesting depth of the matching tokens in a document.
+
+    The summary of every block is updated when the highlighter tokenizes
+    it. When blocks are inserted or removed, only the changed range is
+    updated.
+
+    """
+    def __init__(self, document):
+        self._trees = None
+        self._size = 0
+        self._pending = []  # blocks tokenized while the document was changing
+        highlighter.highlighter(document).tokensChanged.connect(self.slotTokensChanged)
+        document.contentsChange.connect(self.slotContentsChange)
+
+    def slotTokensChanged(self, block):
+        """Called by the highlighter when a block is (re)tokenized."""
+        counts = cursortools.data(block).nesting = summarize(
+            highlighter.stored_tokens(block) or ())
+        if self._trees is None:
+            return
+        elif self._size != block.document().blockCount():
+            # the highlighter runs before slotContentsChange() is called
+            self._pending.append(block)
+            return
+        self._set(block.blockNumber(), counts)
+
+    def slotContentsChange(self, position, removed, added):
+        """Called when the document changes, updates the changed blocks."""
+        pending, self._pending = self._pending, []
+        if self._trees is None:
+            return
+        doc = self.document()
+        size = doc.blockCount()
+        first = doc.findBlock(position).blockNumber()
+        last = doc.findBlock(position + added).blockNumber()
+        count = last - first + 1
+        old = count - size + self._size
+        for tree in self._trees.values():
+            tree.remove(first, old)
+            tree.insert(first, [(0, 0)] * count)
+        self._size = size
+        block = doc.findBlockByNumber(first)
+        for num in range(first, last + 1):
+            self._set(num, _counts(block))
+            block = block.next()
+        for block in pending:
+            if block.isValid():
+                self._set(block.blockNumber(), _counts(block))
+
+    def _set(self, num, counts):
+        """(Internal) Store the counts of the block number in the trees."""
+        for key in set(self._trees).union(counts):
+            try:
+                tree = self._trees[key]
+            except KeyError:
+                tree = self._trees[key] = _Chunks([(0, 0)] * self._size)
+            tree.set(num, *counts.get(key, (0, 0)))
+
+    def trees(self, block):
+        """Return the dictionary of trees, building it if needed.
+
+        The lines up to and including block are lexed first, so the trees
+        are valid up to that block.
+
+        """
+        doc = self.document()
+        highlighter.highlighter(doc).lexUntil(block)
+        if self._trees is None or self._size != doc.blockCount():
+            summaries = [_counts(block) for block in cursortools.all_blocks(doc)]
+            self._size = len(summaries)
+            self._trees = {}
+            for key in set().union(*summaries):
+                self._trees[key] = _Chunks(
+                    counts.get(key, (0, 0)) for counts in summaries)
+        return self._trees
+
+    def depth(self, key, block):
+        """Return the depth of the key at the start of the block."""
+        tree = self.trees(block.previous()).get(key)
+        return tree.prefix(block.blockNumber()) if tree else 0
+
+    def find_forward(self, key, block, depth):
+        """Return the first block after block where the depth drops to depth.
+
+        If there is no such block, an invalid QTextBlock is returned.
+
+        While the highlighter is still lexing the document in chunks, only
+        the lines up to the found block are lexed.
+
+        """
+        doc = block.document()
+        hl = highlighter.highlighter(doc)
+        end = block.blockNumber()
+        while True:
+            end += hl.chunkSize
+            until = doc.findBlockByNumber(end)
+            tree = self.trees(until if until.isValid() else doc.lastBlock()).get(key)
+            num = tree.first(block.blockNumber() + 1, depth) if tree else -1
+            if num != -1 or not hl.isLexing():
+                return doc.findBlockByNumber(num)
+
+    def find_backward(self, key, block, depth):
+        """Return the last block before block where the depth drops to depth.
+
+        If there is no such block, an invalid QTextBlock is returned.
+
+        """
+        tree = self.trees(block).get(key)
+        num = tree.last(block.blockNumber(), depth) if tree else -1
+        return block.document().findBlockByNumber(num)
+
+
+def _counts(block):
+    """Return the summary of the block, computing it if needed."""
+    counts = getattr(block.userData(), 'nesting', None)
+    if counts is None:
+        counts = summarize(highlighter.stored_tokens(block) or ())
+        if counts:
+            cursortools.data(block).nesting = counts
+    return counts
+
+
+class _Chunks(object):
+    """A list of (sum, minimum) tuples, kept in chunks.
+
+    Every chunk stores the sum of its items and the lowest prefix sum reached
+    within its items, so searching can skip whole chunks, while items can be
+    inserted and removed by changing only one chunk.
+
+    """
+    # the number of items in a chunk; a chunk is split at twice this size
+    size = 64
+
+    def __init__(self, items=()):
+        items = list(items)
+        self._chunks = [items[i:i+self.size]
+                        for i in range(0, len(items), self.size)] or [[]]
+        self._sums = []
+        self._mins = []
+        for chunk in self._chunks:
+            total, minimum = _summarize(chunk)
+            self._sums.append(total)
+            self._mins.append(minimum)
+
+    def _update(self, c):
+        """Recompute the summary of chunk c."""
+        self._sums[c], self._mins[c] = _summarize(self._chunks[c])
+
+    def _locate(self, index):
+        """Return the chunk number and the offset in the chunk of index."""
+        chunks = self._chunks
+        for c, chunk in enumerate(chunks):
+            if index < len(chunk):
+                return c, index
+            index -= len(chunk)
+        return len(chunks) - 1, index + len(chunks[-1])
+
+    def set(self, index, total, minimum):
+        """Set the sum and minimum of the item at index."""
+        c, i = self._locate(index)
+        self._chunks[c][i] = (total, minimum)
+        self._update(c)
+
+    def insert(self, index, items):
+        """Insert the items at index."""
+        if not items:
+            return
+        c, i = self._locate(index)
+        chunk = self._chunks[c]
+        chunk[i:i] = items
+        if len(chunk) < self.size * 2:
+            self._update(c)
+            return
+        pieces = [chunk[j:j+self.size] for j in range(0, len(chunk), self.size)]
+        summaries = [_summarize(piece) for piece in pieces]
+        self._chunks[c:c+1] = pieces
+        self._sums[c:c+1] = [total for total, minimum in summaries]
+        self._mins[c:c+1] = [minimum for total, minimum in summaries]
+
+    def remove(self, index, count):
+        """Remove count items from index on."""
+        while count > 0:
+            c, i = self._locate(index)
+            chunk = self._chunks[c]
+            n = min(count, len(chunk) - i)
+            if n <= 0:
+                break
+            del chunk[i:i+n]
+            count -= n
+            if chunk or len(self._chunks) == 1:
+                self._update(c)
+            else:
+                del self._chunks[c], self._sums[c], self._mins[c]
+
+    def prefix(self, index):
+        """Return the sum of the items before index."""
+        c, i = self._locate(index)
+        return sum(self._sums[:c]) + sum(t for t, m in self._chunks[c][:i])
+
+    def first(self, index, depth):
+        """Return the first item from index on where depth is reached.
+
+        Returns -1 if there is no such item.
+
+        """
+        c, i = self._locate(index)
+        offset = sum(self._sums[:c])
+        start = index - i
+        for c in range(c, len(self._chunks)):
+            chunk = self._chunks[c]
+            if offset + self._mins[c] <= depth:
+                for j, (total, minimum) in enumerate(chunk):
+                    if j >= i and offset + minimum <= depth:
+                        return start + j
+                    offset += total
+            else:
+                offset += self._sums[c]
+            start += len(chunk)
+            i = 0
+        return -1
+
+    def last(self, index, depth):
+        """Return the last item before index where depth is reached.
+
+        Returns -1 if there is no such item.
+
+        """
+        c, i = self._locate(index)
+        offset = sum(self._sums[:c])
+        start = index - i
+        while c >= 0:
+            # the minimum of a chunk only applies when all its items are searched
+            if i < len(self._chunks[c]) or offset + self._mins[c] <= depth:
+                found = -1
+                prefix = offset
+                for j, (total, minimum) in enumerate(self._chunks[c][:i]):
+                    if prefix + minimum <= depth:
+                        found = j
+                    prefix += total
+                if found != -1:
+                    return start + found
+            c -= 1
+            if c >= 0:
+                i = len(self._chunks[c])
+                offset -= self._sums[c]
+                start -= i
+        return -1
+
+
+def _summarize(items):
+    """Return the sum and the lowest prefix sum of the (sum, minimum) items."""
+    total = minimum = 0
+    for t, m in items:
+        minimum = min(minimum, total + m)
+        total += t
+    return total, minimum
@@ -22,6 +22,8 @@ The document outline tool widget.
 """
 
 
+import difflib
+
 from PyQt5.QtCore import QEvent, QTimer
 from PyQt5.QtGui import QBrush, QFont, QTextCursor
 from PyQt5.QtWidgets import QTreeWidget, QTreeWidgetItem
@@ -64,31 +66,36 @@ class Widget(QTreeWidget):
             self._timer.start(2000)
 
     def updateView(self):
-        """Recreate the items in the view."""
+        """Update the items in the view.
+
+        Existing items are kept if they are still in the outline, only the
+        items that changed are removed or inserted.
+
+        """
         with qutil.signalsBlocked(self):
-            self.clear()
             doc = self.parent().mainwindow().currentDocument()
             if not doc:
+                self.clear()
                 return
             view_cursor_position = self.parent().mainwindow().textCursor().position()
             structure = documentstructure.DocumentStructure.instance(doc)
-            last_item = None
+            root = last_item = Entry(None, 0, 0)
             current_item = None
             last_block = None
             for i in structure.outline():
                 position = i.start()
-                block = doc.findBlock(position)
+                block = i.block
                 depth = tokeniter.state(block).depth()
                 if block == last_block:
                     parent = last_item
                 elif last_block is None or depth == 1:
                     # a toplevel item anyway
-                    parent = self
+                    parent = root
                 else:
-                    while last_item and depth <= last_item.depth:
-                        last_item = last_item.parent()
-                    if not last_item:
-                        parent = self
+                    while last_item is not root and depth <= last_item.depth:
+                        last_item = last_item.parent
+                    if last_item is root:
+                        parent = root
                     else:
                         # the item could belong to a parent item, but see if they
                         # really are in the same (toplevel) state
@@ -96,54 +103,93 @@ class Widget(QTreeWidget):
                         while b < block:
                             depth2 = tokeniter.state(b).depth()
                             if depth2 == 1:
-                                parent = self
+                                parent = root
                                 break
-                            while last_item and depth2 <= last_item.depth:
-                                last_item = last_item.parent()
-                            if not last_item:
-                                parent = self
+                            while last_item is not root and depth2 <= last_item.depth:
+                                last_item = last_item.parent
+                            if last_item is root:
+                                parent = root
                                 break
                             b = b.next()
                         else:
                             parent = last_item
 
-                item = last_item = QTreeWidgetItem(parent)
+                item = last_item = Entry(parent, depth, position)
 
                 # set item text and display style bold if 'title' was used
                 for name, text in i.groupdict().items():
                     if text:
                         if name.startswith('title'):
-                            font = item.font(0)
-                            font.setWeight(QFont.Bold)
-                            item.setFont(0, font)
+                            item.style = 'title'
                             break
                         elif name.startswith('alert'):
-                            color = item.foreground(0).color()
-                            color = qutil.addcolor(color, 128, 0, 0)
-                            item.setForeground(0, QBrush(color))
-                            font = item.font(0)
-                            font.setStyle(QFont.StyleItalic)
-                            item.setFont(0, font)
+                            item.style = 'alert'
                         elif name.startswith('text'):
                             break
                 else:
                     text = i.group()
-                item.setText(0, text)
+                item.text = text
 
                 # remember whether is was collapsed by the user
                 try:
-                    collapsed = block.userData().collapsed
+                    item.collapsed = block.userData().collapsed
                 except AttributeError:
-                    collapsed = False
-                item.setExpanded(not collapsed)
-                item.depth = depth
-                item.position = position
+                    pass
                 last_block = block
                 # scroll to the item at the view's cursor later
                 if position <= view_cursor_position:
                     current_item = item
+            self.applyEntries(self.invisibleRootItem(), root.children)
             if current_item:
-                self.scrollToItem(current_item)
+                self.scrollToItem(current_item.item)
+
+    def applyEntries(self, parent, entries):
+        """Make the children of the parent QTreeWidgetItem reflect the entries.
+
+        Items that are unchanged are kept (and updated recursively), only
+        the other items are removed or created.
+
+        """
+        items = [parent.child(i) for i in range(parent.childCount())]
+        matcher = difflib.SequenceMatcher(None,
+            [(item.text(0), item.style) for item in items],
+            [(entry.text, entry.style) for entry in entries], False)
+        # work backwards so the indices of the old items stay valid
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == 'equal':
+                for item, entry in zip(items[i1:i2], entries[j1:j2]):
+                    item.depth = entry.depth
+                    item.position = entry.position
+                    entry.item = item
+                    self.applyEntries(item, entry.children)
+            else:
+                for i in range(i2 - 1, i1 - 1, -1):
+                    parent.takeChild(i)
+                for i, entry in enumerate(entries[j1:j2], i1):
+                    item = self.createItem(entry)
+                    parent.insertChild(i, item)
+                    self.applyEntries(item, entry.children)
+                    item.setExpanded(not entry.collapsed)
+
+    def createItem(self, entry):
+        """Return a new QTreeWidgetItem for the entry."""
+        item = entry.item = QTreeWidgetItem()
+        item.setText(0, entry.text)
+        if entry.style == 'title':
+            font = item.font(0)
+            font.setWeight(QFont.Bold)
+            item.setFont(0, font)
+        elif entry.style == 'alert':
+            color = item.foreground(0).color()
+            color = qutil.addcolor(color, 128, 0, 0)
+            item.setForeground(0, QBrush(color))
+            font = item.font(0)
+            font.setStyle(QFont.StyleItalic)
+            item.setFont(0, font)
+        item.style = entry.style
+        item.depth = entry.depth
+        item.position = entry.position
+        return item
 
     def cursorForItem(self, item):
         """Returns a cursor for the specified item.
@@ -193,3 +239,17 @@ class Widget(QTreeWidget):
         documenttooltip.show(self.cursorForItem(item))
 
 
+class Entry(object):
+    """An item of the outline, before it is shown in the tree."""
+    text = ''
+    style = None        # 'title' or 'alert'
+    collapsed = False
+    item = None         # the QTreeWidgetItem showing this entry
+
+    def __init__(self, parent, depth, position):
+        self.parent = parent
+        self.depth = depth
+        self.position = position
+        self.children = []
+        if parent:
+            parent.children.append(self)
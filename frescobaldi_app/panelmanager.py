@@ -59,6 +59,7 @@ class PanelManager(plugin.MainWindowPlugin):
         self.loadPanel("charmap.CharMap")
         self.loadPanel("doclist.DocumentList")
         self.loadPanel("outline.OutlinePanel")
+        self.loadPanel("filesearch.FileSearchPanel")
         self.loadPanel("layoutcontrol.LayoutControlOptions")
 
         # The Object editor is highly experimental and should be
@@ -19,26 +19,80 @@
 
 """
 Generic Point and Click handling.
+
+The textedit links of Poppler documents, shown by the music view and the
+viewers, are also read here (see poppler_links()).
 """
 
 
+import array
+import bisect
 import os
-import collections
+import re
+import weakref
 
-from PyQt5.QtCore import QUrl
+from PyQt5.QtCore import pyqtSignal, QRectF, QThread, QUrl
 from PyQt5.QtGui import QTextCursor
 
 import app
 import scratchdir
+import textedit
+import util
 import ly.lex.lilypond
 import ly.document
 import lydocument
 
 
+class LinkList(object):
+    """Stores the links to one source file in compact arrays.
+
+    Every link has a line and a column, and a destination, which is stored
+    by add_destination() and retrieved by index using destination().
+    Inherit to store destinations of a specific type more compactly.
+
+    """
+    def __init__(self):
+        self.lines = array.array('i')
+        self.columns = array.array('i')
+        self._destinations = []
+
+    def __len__(self):
+        return len(self.lines)
+
+    def append(self, line, column, destination):
+        """Adds a link."""
+        self.lines.append(line)
+        self.columns.append(column)
+        self.add_destination(destination)
+
+    def add_destination(self, destination):
+        """Stores the destination of a new link."""
+        self._destinations.append(destination)
+
+    def destination(self, index):
+        """Returns the destination of the link at index."""
+        return self._destinations[index]
+
+    def group(self, index):
+        """Returns the group of the link at index, see BoundLinks.
+
+        The default implementation puts all links in one group.
+
+        """
+        return 0
+
+
 class Links(object):
-    """Stores point and click links grouped by filename."""
+    """Stores point and click links grouped by filename.
+
+    The links to each filename are stored in a LinkList instance, you can
+    set another LinkList class in the LinkList class attribute.
+
+    """
+    LinkList = LinkList
+
     def __init__(self):
-        self._links = collections.defaultdict(lambda: collections.defaultdict(list))
+        self._links = {}
         self._docs = {}
 
     def add_link(self, filename, line, column, destination):
@@ -49,22 +103,44 @@ class Links(object):
         destination can be any object that describes where the link points to.
 
         """
-        self._links[filename][(line, column)].append(destination)
+        try:
+            links = self._links[filename]
+        except KeyError:
+            links = self._links[filename] = self.LinkList()
+        links.append(line, column, destination)
+
+    def update(self, previous=None):
+        """Call this after adding links, if you are going to add more later.
+
+        This method tries to bind() already loaded documents and adds the
+        new links to documents that are already bound.
+
+        If previous is given, it should be a Links instance (e.g. for an
+        older version of the same PDF document). The QTextCursors it has
+        created are reused for the new links, if they still point to the
+        same line and column.
+
+        """
+        for filename in self._links:
+            bound = self._docs.get(filename)
+            if bound:
+                bound.update(previous and previous._docs.get(filename))
+            else:
+                d = scratchdir.findDocument(filename)
+                if d:
+                    self.bind(filename, d, previous)
 
     def finish(self):
         """Call this when you are done with adding links.
 
-        This method tries to bind() already loaded documents and starts
-        monitoring document open/close events.
+        This method calls update() and starts monitoring document open/close
+        events.
 
         You can also use the links as a context manager and then add links.
         On exit, finish() is automatically called.
 
         """
-        for filename in self._links:
-            d = scratchdir.findDocument(filename)
-            if d:
-                self.bind(filename, d)
+        self.update()
         app.documentLoaded.connect(self.slotDocumentLoaded)
         app.documentClosed.connect(self.slotDocumentClosed)
 
@@ -74,16 +150,19 @@ class Links(object):
     def __exit__(self, exc_type, exc_value, traceback):
         self.finish()
 
-    def bind(self, filename, doc):
+    def bind(self, filename, doc, previous=None):
         """Binds the given filename to the given document.
 
         When the document disappears, the binding is removed automatically.
         While a document is bound, textedit links are stored as QTextCursors,
         so they keep their position even if the user changes the document.
 
+        If previous is a Links instance, its cursors are reused if possible.
+
         """
         if filename not in self._docs:
-            self._docs[filename] = BoundLinks(doc, self._links[filename])
+            self._docs[filename] = BoundLinks(doc, self._links[filename],
+                previous and previous._docs.get(filename))
 
     def slotDocumentLoaded(self, doc):
         """Called when a new document is loaded, it maybe possible to bind to it."""
@@ -125,29 +204,211 @@ class Links(object):
 
 
 class BoundLinks(object):
-    """Stores links as QTextCursors for a document."""
-    def __init__(self, doc, links):
-        """Creates QTextCursor instances for every link, keeps a reference to the document."""
+    """Stores links as QTextCursors for a document.
+
+    The QTextCursors are created lazily, for all links of a group at once
+    (see LinkList.group(); for a PDF document a group is a page): when a link
+    is requested with cursor(), or when the links at the text cursor are
+    looked up with indices().
+
+    Until all links are bound, the edits to the document are recorded, so
+    that the cursors still point to the right place when they are created.
+
+    """
+    # if more edits need to be recorded, all links are bound at once
+    maxEdits = 500
+
+    def __init__(self, doc, links, previous=None):
+        """Keeps a reference to the document and the LinkList.
+
+        If previous is a BoundLinks instance for the same document, its
+        cursors are reused if possible, see update().
+
+        """
         self.document = doc
-        # make a sorted list of cursors with their [destination, ...] destinations list
-        self._cursor_dict = d = {}              # mapping from (line, col) to QTextCursor
-        self._cursors = cursors = []            # sorted list of the cursors
-        self._destinations = destinations = []  # corresponding list of destinations
-        for pos, dest in sorted(links.items()):
-            line, column = pos
-            b = doc.findBlockByNumber(line - 1)
+        self._links = links
+        self._count = 0             # the number of links in the LinkList already seen
+        self._cursor_dict = {}      # mapping from (line, col) to QTextCursor
+        self._indices = {}          # mapping from (line, col) to indices in the LinkList
+        self._unbound = {}          # mapping from group to (line, col) tuples not yet bound
+        self._previous = {}         # mapping from group to weakref to previous BoundLinks
+        self._lines = {}            # mapping from line to the groups having links there
+        self._text = None           # the text of the document when links were added
+        self._starts = None         # the positions of the lines in that text
+        self._edits = []            # the edits since then: (position, removed, added)
+        self._slot = None           # our slot connected to contentsChange
+        self._cursors = None        # sorted list of the cursors
+        self._destinations = None   # corresponding list of destinations
+        self.update(previous)
+
+    def update(self, previous=None):
+        """Registers links that were added to the LinkList.
+
+        If previous is a BoundLinks instance for the same document, a cursor
+        it has for the same line and column is reused when the link is bound,
+        if it still points to that line and column.
+
+        """
+        links = self._links
+        count = len(links)
+        if count == self._count:
+            return
+        if previous and previous.document is not self.document:
+            previous = None
+        if not self._unbound:
+            self._text = self.document.toPlainText()
+            self._starts = None
+            self._edits = []
+        for i in range(self._count, count):
+            pos = links.lines[i], links.columns[i]
+            group = links.group(i)
+            self._indices.setdefault(pos, []).append(i)
+            self._unbound.setdefault(group, []).append(pos)
+            self._lines.setdefault(pos[0], set()).add(group)
+            if previous:
+                self._previous[group] = weakref.ref(previous)
+        self._count = count
+        self._cursors = self._destinations = None
+        if not self._slot:
+            def slot(position, removed, added, selfref=weakref.ref(self), doc=self.document):
+                self = selfref()
+                if self:
+                    self._contentsChange(position, removed, added)
+                else:
+                    doc.contentsChange.disconnect(slot)
+            self.document.contentsChange.connect(slot)
+            self._slot = slot
+
+    def _contentsChange(self, position, removed, added):
+        """(Internal) Records an edit of the document, while links are unbound."""
+        if not self._unbound:
+            return
+        if self._starts is None:
+            # the positions of the lines before the first edit
+            text, self._text = self._text, None
+            self._starts = array.array('i', [0])
+            self._starts.extend(m.end() for m in re.finditer('\n', text))
+        edits = self._edits
+        if edits and removed == 0 and position == edits[-1][0] + edits[-1][2]:
+            # typing text
+            p, r, a = edits[-1]
+            edits[-1] = p, r, a + added
+        else:
+            edits.append((position, removed, added))
+            if len(edits) > self.maxEdits:
+                self._bindAll()
+
+    def _position(self, line, column):
+        """(Internal) Returns the current position in the document of line, column.
+
+        Returns None if the line does not exist.
+
+        """
+        if self._starts is None:
+            b = self.document.findBlockByNumber(line - 1)
             if b.isValid():
-                c = d[pos] = QTextCursor(doc)
-                c.setPosition(b.position() + column)
-                cursors.append(c)
-                destinations.append(dest)
+                return b.position() + column
+            return
+        if line > len(self._starts):
+            return
+        pos = self._starts[line - 1] + column
+        for position, removed, added in self._edits:
+            if pos >= position + removed:
+                pos += added - removed
+            elif pos >= position and removed != added:
+                # the text at the link was removed
+                pos = position + added
+        return min(pos, self.document.characterCount() - 1)
+
+    def _lineRange(self, first, last):
+        """(Internal) Returns the range of original lines of the given blocks."""
+        if self._starts is None:
+            return range(first + 1, last + 2)
+        doc = self.document
+        lo = doc.findBlockByNumber(first).position()
+        b = doc.findBlockByNumber(last)
+        hi = b.position() + b.length() - 1
+        for position, removed, added in reversed(self._edits):
+            if lo >= position + added:
+                lo += removed - added
+            elif lo >= position:
+                lo = position
+            if hi >= position + added:
+                hi += removed - added
+            elif hi >= position:
+                hi = position + removed
+        return range(bisect.bisect_right(self._starts, lo),
+                     bisect.bisect_right(self._starts, hi) + 1)
+
+    def _bind(self, group):
+        """(Internal) Creates the QTextCursors for the links in the group."""
+        positions = self._unbound.pop(group, None)
+        if not positions:
+            return
+        previous = self._previous.pop(group, None)
+        previous = previous and not self._edits and previous()
+        doc = self.document
+        for pos in positions:
+            if pos in self._cursor_dict:
+                continue
+            c = previous and previous.reusableCursor(*pos)
+            if not c:
+                p = self._position(*pos)
+                if p is None:
+                    continue
+                c = QTextCursor(doc)
+                c.setPosition(p)
+            self._cursor_dict[pos] = c
+        self._cursors = self._destinations = None
+        if not self._unbound:
+            self._text = self._starts = None
+            self._edits = []
+            self._previous.clear()
+            doc.contentsChange.disconnect(self._slot)
+            self._slot = None
+
+    def _bindAll(self):
+        """(Internal) Creates the QTextCursors for all links."""
+        for group in list(self._unbound):
+            self._bind(group)
+
+    def _bindLines(self, first, last):
+        """(Internal) Binds the groups that have links in the given blocks."""
+        if self._unbound:
+            for line in self._lineRange(first, last):
+                for group in self._lines.get(line, ()):
+                    self._bind(group)
+
+    def _sort(self):
+        """(Internal) Builds the sorted list of cursors and their destinations."""
+        positions = sorted(self._cursor_dict)
+        self._cursors = [self._cursor_dict[pos] for pos in positions]
+        self._destinations = Destinations(self._links,
+                                          [self._indices[pos] for pos in positions])
 
     def cursor(self, line, column):
         """Returns the QTextCursor for the give line/col."""
-        return self._cursor_dict.get((line, column))
+        pos = line, column
+        if pos not in self._cursor_dict:
+            for i in self._indices.get(pos, ()):
+                self._bind(self._links.group(i))
+        return self._cursor_dict.get(pos)
+
+    def reusableCursor(self, line, column):
+        """Returns the QTextCursor for the line/col if it still points there.
+
+        Returns None if there is no cursor or the text document was changed
+        so that the cursor moved to another line or column.
+
+        """
+        c = self._cursor_dict.get((line, column))
+        if c and c.blockNumber() == line - 1 and c.positionInBlock() == column:
+            return c
 
     def cursors(self):
-        """Return the list of cursors, sorted on cursor position."""
+        """Return the list of bound cursors, sorted on cursor position."""
+        if self._cursors is None:
+            self._sort()
         return self._cursors
 
     def destinations(self):
@@ -160,6 +421,8 @@ class BoundLinks(object):
         document.
 
         """
+        if self._destinations is None:
+            self._sort()
         return self._destinations
 
     def indices(self, cursor):
@@ -174,8 +437,13 @@ class BoundLinks(object):
         This method performs quite a bit trickery: it also returns the destination when a cursor
         points to the _ending_ point of a slur, beam or phrasing slur.
 
+        The links in the lines the cursor is in are bound first.
+
         """
-        cursors = self._cursors
+        doc = self.document
+        self._bindLines(doc.findBlock(cursor.selectionStart()).blockNumber(),
+                        doc.findBlock(cursor.selectionEnd()).blockNumber())
+        cursors = self.cursors()
 
         def findlink(pos):
             # binary search in list of cursors
@@ -231,6 +499,8 @@ class BoundLinks(object):
                                 nest += 1
                         break
             if found:
+                self._bindLines(tokens.block.blockNumber(), tokens.block.blockNumber())
+                cursors = self.cursors()
                 index = findlink(tokens.block.position() + token.pos)
                 if index < 0 or cursors[index].block() != tokens.block:
                     return
@@ -240,6 +510,25 @@ class BoundLinks(object):
         return slice(index, index+1)
 
 
+class Destinations(object):
+    """A sequence of destination lists, corresponding with BoundLinks.cursors().
+
+    The destination lists are created from the LinkList when requested.
+
+    """
+    def __init__(self, links, indices):
+        self._links = links
+        self._indices = indices
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return [self._links.destination(i) for i in self._indices[index]]
+
+
 def positions(cursor):
     """Return a list of QTextCursors describing the grob the cursor points at.
 
@@ -306,3 +595,160 @@ def positions(cursor):
     cur.setPosition(end, QTextCursor.KeepAnchor)
     return cursors
 
+
+
+# Point and click links of Poppler documents, used by the music view and
+# the viewers.
+
+# cache point and click handlers for poppler documents
+_cache = weakref.WeakKeyDictionary()
+
+# the most recent point and click handlers for PDF filenames, kept as long
+# as their Poppler document is alive
+_latest = weakref.WeakValueDictionary()
+
+
+def poppler_links(document, filename=None):
+    """Returns the PopplerLinks for the Poppler document.
+
+    The first time, the links are extracted page by page in a background
+    thread, and the PopplerLinks object is updated as the pages are finished.
+
+    If the filename of the PDF document is given, the PopplerLinks of a
+    previously loaded version of the same file are used to speed up binding
+    the links: for pages that have the same links, existing cursors are reused.
+
+    """
+    try:
+        return _cache[document]
+    except KeyError:
+        l = _cache[document] = PopplerLinks()
+        previous = None
+        if filename:
+            previous = _latest.get(filename)
+            _latest[filename] = l
+        l.extract(document, previous)
+        return l
+
+
+class LinkExtractor(QThread):
+    """Reads the textedit links of a Poppler document in a background thread.
+
+    For every page the pageFinished signal is emitted with the page number,
+    a fingerprint of the links on the page and a list of (filename, line,
+    column, linkArea) tuples.
+
+    """
+    pageFinished = pyqtSignal(int, object, object)
+
+    def __init__(self, document):
+        super(LinkExtractor, self).__init__()
+        self.document = document
+
+    def run(self):
+        import popplerqt5
+        import qpopplerview
+        document = self.document
+        for num in range(document.numPages()):
+            if self.isInterruptionRequested():
+                break
+            # only lock the document while reading one page, so that
+            # rendering is not blocked during the whole extraction
+            with qpopplerview.lock(document):
+                page_links = document.page(num).links()
+            result = []
+            fingerprint = []
+            for link in page_links:
+                if isinstance(link, popplerqt5.Poppler.LinkBrowse):
+                    t = textedit.link(link.url())
+                    if t:
+                        filename = util.normpath(t.filename)
+                        result.append((filename, t.line, t.column, link.linkArea()))
+                        fingerprint.append((link.url(), link.linkArea().getRect()))
+            self.pageFinished.emit(num, hash(tuple(fingerprint)), result)
+
+
+class PageLinkList(LinkList):
+    """Stores (pageNumber, QRectF) destinations in arrays.
+
+    The links are grouped by page number.
+
+    """
+    def __init__(self):
+        super(PageLinkList, self).__init__()
+        self._pages = array.array('i')
+        self._rects = array.array('d')
+
+    def add_destination(self, destination):
+        pageNum, rect = destination
+        self._pages.append(pageNum)
+        self._rects.extend(rect.getRect())
+
+    def destination(self, index):
+        i = index * 4
+        return self._pages[index], QRectF(*self._rects[i:i+4])
+
+    def group(self, index):
+        return self._pages[index]
+
+
+class PopplerLinks(Links):
+    """Stores all the links of a Poppler document sorted by URL and text position.
+
+    Only textedit:// urls are stored.
+
+    """
+    LinkList = PageLinkList
+    _extractor = None
+    _previous = None
+
+    def __init__(self):
+        super(PopplerLinks, self).__init__()
+        self._fingerprints = {}
+
+    def extract(self, document, previous=None):
+        """Starts reading the links from the Poppler document in the background.
+
+        If previous is given, it should be the PopplerLinks of an older
+        version of the PDF document. For pages that have the same links, the
+        cursors of the previous PopplerLinks are reused.
+
+        """
+        self._previous = previous
+        self._extractor = e = LinkExtractor(document)
+        e.pageFinished.connect(self.slotPageFinished)
+        e.finished.connect(self.slotExtractionFinished)
+        e.start()
+
+    def slotPageFinished(self, num, fingerprint, page_links):
+        """Called when the links of a page have been read."""
+        self._fingerprints[num] = fingerprint
+        for filename, line, column, rect in page_links:
+            self.add_link(filename, line, column, (num, rect))
+        if page_links:
+            previous = self._previous
+            if previous and previous._fingerprints.get(num) != fingerprint:
+                previous = None
+            self.update(previous)
+
+    def slotExtractionFinished(self):
+        """Called when all links have been read."""
+        self._extractor.wait()
+        self._extractor = None
+        self._previous = None
+        self.finish()
+
+    def cursor(self, link, load=False):
+        """Returns the destination of a link as a QTextCursor of the destination document.
+
+        If load (defaulting to False) is True, the document is loaded if it is not yet loaded.
+        Returns None if the url was not valid or the document could not be loaded.
+
+        """
+        import popplerqt5
+        if not isinstance(link, popplerqt5.Poppler.LinkBrowse) or not link.url():
+            return
+        t = textedit.link(link.url())
+        if t:
+            filename = util.normpath(t.filename)
+            return super(PopplerLinks, self).cursor(filename, t.line, t.column, load)
@@ -30,6 +30,7 @@ from PyQt5.QtCore import QSettings
 import app
 import textformats
 import qpopplerview
+import qpopplerview.diskcache
 
 
 # global setup of background color
@@ -46,6 +47,23 @@ _setbackground()
 qpopplerview.cache.options().setOversampleThreshold(96)
 
 
+# keep rendered pages on disk if desired
+def _setdiskcache():
+    s = QSettings()
+    s.beginGroup("musicview")
+    if s.value("disk_cache", False, bool):
+        maxsize = s.value("disk_cache_size", 500, int) * 1048576
+        diskcache = qpopplerview.cache.diskcache()
+        if not diskcache or diskcache.maxsize() != maxsize:
+            path = app.cachedir("pages")
+            qpopplerview.cache.setdiskcache(qpopplerview.diskcache.DiskCache(path, maxsize))
+    else:
+        qpopplerview.cache.setdiskcache(None)
+
+app.settingsChanged.connect(_setdiskcache, -1)
+_setdiskcache()
+
+
 class View(qpopplerview.View):
     def __init__(self, parent=None):
         super(View, self).__init__(parent)
@@ -119,6 +119,9 @@ class Highlighting(preferences.Group):
             layout.addWidget(l, row, 0)
             layout.addWidget(e, row, 1)
 
+        self.compactTokens = QCheckBox(toggled=page.changed)
+        layout.addWidget(self.compactTokens, layout.rowCount(), 0, 1, 2)
+
         app.translateUI(self)
 
     def items(self):
@@ -141,18 +144,25 @@ class Highlighting(preferences.Group):
             self.entries[name].setPrefix(prefix)
             self.entries[name].setSuffix(suffix)
             self.labels[name].setText(title)
+        self.compactTokens.setText(_("Use less memory for highlighting"))
+        self.compactTokens.setToolTip(_(
+            "If checked, the parsed contents of every line are stored in a\n"
+            "compact form. This saves memory with large documents, but makes\n"
+            "some editing functions a bit slower."))
 
     def loadSettings(self):
         s = QSettings()
         s.beginGroup("editor_highlighting")
         for name, title, default in self.items():
             self.entries[name].setValue(s.value(name, default, int))
+        self.compactTokens.setChecked(s.value("compact_tokens", False, bool))
 
     def saveSettings(self):
         s= QSettings()
         s.beginGroup("editor_highlighting")
         for name, title, default in self.items():
             s.setValue(name, self.entries[name].value())
+        s.setValue("compact_tokens", self.compactTokens.isChecked())
 
 
 class Indenting(preferences.Group):
@@ -29,7 +29,7 @@ from PyQt5.QtCore import QSettings, Qt
 from PyQt5.QtWidgets import (
     QAbstractItemView, QCheckBox, QDialog, QDialogButtonBox, QFileDialog,
     QGridLayout, QHBoxLayout, QLabel, QLineEdit, QListWidgetItem,
-    QPushButton, QRadioButton, QTabWidget, QVBoxLayout, QWidget)
+    QPushButton, QRadioButton, QSpinBox, QTabWidget, QVBoxLayout, QWidget)
 
 import app
 import userguide
@@ -311,6 +311,15 @@ class Running(preferences.Group):
         layout.addWidget(self.deleteFiles)
         layout.addWidget(self.embedSourceCode)
         layout.addWidget(self.noTranslation)
+        hbox = QHBoxLayout()
+        self.maxJobsLabel = QLabel()
+        self.maxJobs = QSpinBox(valueChanged=self.changed)
+        self.maxJobs.setRange(1, 64)
+        self.maxJobsLabel.setBuddy(self.maxJobs)
+        hbox.addWidget(self.maxJobsLabel)
+        hbox.addWidget(self.maxJobs)
+        hbox.addStretch(1)
+        layout.addLayout(hbox)
         layout.addWidget(self.includeLabel)
         layout.addWidget(self.include)
         app.translateUI(self)
@@ -333,6 +342,10 @@ class Running(preferences.Group):
         self.noTranslation.setToolTip(_(
             "If checked, LilyPond's output messages will be in English.\n"
             "This can be useful for bug reports."))
+        self.maxJobsLabel.setText(_("Maximum number of simultaneous jobs:"))
+        self.maxJobsLabel.setToolTip(_(
+            "The number of LilyPond processes that may run at the same time,\n"
+            "for all documents together."))
         self.includeLabel.setText(_("LilyPond include path:"))
 
     def loadSettings(self):
@@ -341,6 +354,7 @@ class Running(preferences.Group):
         self.deleteFiles.setChecked(s.value("delete_intermediate_files", True, bool))
         self.embedSourceCode.setChecked(s.value("embed_source_code", False, bool))
         self.noTranslation.setChecked(s.value("no_translation", False, bool))
+        self.maxJobs.setValue(s.value("max_jobs", os.cpu_count() or 1, int))
         include_path = qsettings.get_string_list(s, "include_path")
         self.include.setValue(include_path)
 
@@ -350,6 +364,7 @@ class Running(preferences.Group):
         s.setValue("delete_intermediate_files", self.deleteFiles.isChecked())
         s.setValue("embed_source_code", self.embedSourceCode.isChecked())
         s.setValue("no_translation", self.noTranslation.isChecked())
+        s.setValue("max_jobs", self.maxJobs.value())
         s.setValue("include_path", self.include.value())
 
 
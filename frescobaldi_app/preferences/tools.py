@@ -159,6 +159,18 @@ class MusicView(preferences.Group):
         layout.addWidget(self.enableKineticScrolling)
         self.showScrollbars = QCheckBox(toggled=self.changed)
         layout.addWidget(self.showScrollbars)
+        self.diskCache = QCheckBox(toggled=self.changed)
+        layout.addWidget(self.diskCache)
+        self.diskCacheSizeLabel = QLabel()
+        self.diskCacheSize = QSpinBox(valueChanged=self.changed)
+        self.diskCacheSize.setRange(10, 10000)
+        self.diskCacheSize.setSingleStep(50)
+        self.diskCacheSizeLabel.setBuddy(self.diskCacheSize)
+        self.diskCache.toggled.connect(self.diskCacheSize.setEnabled)
+        self.diskCache.toggled.connect(self.diskCacheSizeLabel.setEnabled)
+        row = layout.rowCount()
+        layout.addWidget(self.diskCacheSizeLabel, row, 0)
+        layout.addWidget(self.diskCacheSize, row, 1, 1, 2)
         app.translateUI(self)
 
     def translateUI(self):
@@ -179,6 +191,15 @@ class MusicView(preferences.Group):
         # L10N: "Kinetic Scrolling" is a checkbox label, as in "Enable Kinetic Scrolling"
         self.enableKineticScrolling.setText(_("Kinetic Scrolling"))
         self.showScrollbars.setText(_("Show Scrollbars"))
+        self.diskCache.setText(_("Keep rendered pages on disk"))
+        self.diskCache.setToolTip(_(
+            "If checked, rendered pages of PDF documents are stored on disk, so\n"
+            "they are displayed immediately when an unchanged document is shown again."))
+        self.diskCacheSizeLabel.setText(_("Disk cache size:"))
+        self.diskCacheSizeLabel.setToolTip(_(
+            "The maximum size of the rendered pages stored on disk."))
+        # L10N: as in "500 MB", appended after number in spinbox, note the leading space
+        self.diskCacheSize.setSuffix(_(" MB"))
 
     def loadSettings(self):
         s = popplerview.MagnifierSettings.load()
@@ -193,6 +214,11 @@ class MusicView(preferences.Group):
         self.enableKineticScrolling.setChecked(kineticScrollingActive)
         showScrollbars = s.value("show_scrollbars", True, bool)
         self.showScrollbars.setChecked(showScrollbars)
+        diskCache = s.value("disk_cache", False, bool)
+        self.diskCache.setChecked(diskCache)
+        self.diskCacheSize.setValue(s.value("disk_cache_size", 500, int))
+        self.diskCacheSize.setEnabled(diskCache)
+        self.diskCacheSizeLabel.setEnabled(diskCache)
 
     def saveSettings(self):
         s = popplerview.MagnifierSettings()
@@ -205,6 +231,8 @@ class MusicView(preferences.Group):
         s.setValue("newer_files_only", self.newerFilesOnly.isChecked())
         s.setValue("kinetic_scrolling", self.enableKineticScrolling.isChecked())
         s.setValue("show_scrollbars", self.showScrollbars.isChecked())
+        s.setValue("disk_cache", self.diskCache.isChecked())
+        s.setValue("disk_cache_size", self.diskCacheSize.value())
 
 
 class CharMap(preferences.Group):
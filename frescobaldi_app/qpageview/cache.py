@@ -21,100 +21,134 @@
 Cache logic.
 """
 
+import collections
 import weakref
-import time
 
 
 class ImageEntry:
-    def __init__(self, image):
+    def __init__(self, image, location):
         self.image = image
         self.bcount = image.byteCount()
-        self.time = time.time()
+        self.location = location
 
 
 class ImageCache:
     """Cache generated images.
 
-    Store and retrieve them under a key (see render.Renderer.key()).
+    Store and retrieve them under a key (see render.Renderer.key()) and a
+    tile (see render.Renderer.tiles()).
+
+    When the total size of the images exceeds maxsize, the least recently
+    used images are removed. The hits, misses and evictions counters can be
+    inspected for diagnostics.
 
 
     """
     maxsize = 104857600 # 100M
     currentsize = 0
+    hits = 0
+    misses = 0
+    evictions = 0
 
     def __init__(self):
         self._cache = weakref.WeakKeyDictionary()
+        self._lru = collections.OrderedDict()   # least recently used first
 
     def clear(self):
         """Remove all cached images."""
         self._cache.clear()
+        self._lru.clear()
+        self.currentsize = 0
 
-    def __getitem__(self, key):
-        """Retrieve the exact image.
+    def __getitem__(self, key_tile):
+        """Retrieve the exact image of a (key, tile) tuple.
 
-        Raises a KeyError when there is no cached image for the key.
+        Raises a KeyError when there is no cached image for the key and tile.
 
         """
-        return self._cache[key.group][key.page][key.size].image
+        key, tile = key_tile
+        try:
+            entry = self._cache[key.group][key.page][key.size][tile]
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        self._lru.move_to_end(entry)
+        return entry.image
 
-    def __setitem__(self, key, image):
-        """Store the image.
+    def __setitem__(self, key_tile, image):
+        """Store the image for a (key, tile) tuple.
 
-        Automatically removes the oldest cached images to keep the cache
-        under maxsize.
+        Automatically removes the least recently used images to keep the
+        cache under maxsize.
 
         """
+        key, tile = key_tile
         try:
-            self.currentsize -= self._cache[key.group][key.page][key.size].bcount
+            groupd = self._cache[key.group]
+        except KeyError:
+            groupd = self._cache[key.group] = {}
+            weakref.finalize(key.group, self._groupDied, groupd)
+        sized = groupd.setdefault(key.page, {}).setdefault(key.size, {})
+        try:
+            old = sized[tile]
         except KeyError:
             pass
+        else:
+            del self._lru[old]
+            self.currentsize -= old.bcount
 
-        purgeneeded = self.currentsize > self.maxsize
-
-        e = ImageEntry(image)
+        e = sized[tile] = ImageEntry(image, (groupd, key.page, key.size, tile))
+        self._lru[e] = True
         self.currentsize += e.bcount
+        self.purge()
 
-        self._cache.setdefault(key.group, {}).setdefault(key.page, {})[key.size] = e
+    def purge(self):
+        """Remove the least recently used images until the cache fits in maxsize.
 
-        if not purgeneeded:
-            return
+        The most recently stored image is always kept.
 
-        # purge old images if needed,
-        # cache groups may have disappeared so count all images
-        items = []
-        items.extend(sorted(
-            (entry.time, entry.bcount, group, page, size)
-            for group, groupd in self._cache.items()
-                for page, paged in groupd.items()
-                    for size, entry in sorted(paged.items())[1:]))
-        # smallest for each page last
-        items.extend(sorted(
-            (entry.time, entry.bcount, group, page, size)
-            for group, groupd in self._cache.items()
-                for page, paged in groupd.items()
-                    for size, entry in sorted(paged.items())[:1]))
-
-        # now count the newest images until maxsize ...
-        items = reversed(items)
-        currentsize = 0
-        for time, bcount, group, page, size in items:
-            currentsize += bcount
-            if currentsize > self.maxsize:
-                break
-        self.currentsize = currentsize
-        # ... and delete the remaining images, deleting empty dicts as well
-        for time, bcount, group, page, size in items:
-            del self._cache[group][page][size]
-            if not self._cache[group][page]:
-                del self._cache[group][page]
-                if not self._cache[group]:
-                    del self._cache[group]
+        """
+        while self.currentsize > self.maxsize and len(self._lru) > 1:
+            entry = self._lru.popitem(False)[0]
+            self.currentsize -= entry.bcount
+            self.evictions += 1
+            # remove it from the cache, deleting empty dicts as well
+            groupd, page, size, tile = entry.location
+            paged = groupd[page]
+            sized = paged[size]
+            del sized[tile]
+            if not sized:
+                del paged[size]
+                if not paged:
+                    del groupd[page]
+
+    def _groupDied(self, groupd):
+        """(Internal) Called when a group has been garbage collected."""
+        for paged in groupd.values():
+            for sized in paged.values():
+                for entry in sized.values():
+                    if self._lru.pop(entry, False):
+                        self.currentsize -= entry.bcount
+
+    def tileset(self, key):
+        """Return a dictionary mapping the cached tiles of the key to their image.
+
+        The dictionary is empty if no tile was cached yet.
+
+        """
+        try:
+            entries = self._cache[key.group][key.page][key.size]
+        except KeyError:
+            return {}
+        return dict((tile, e.image) for tile, e in entries.items())
 
     def closest(self, key):
-        """Retrieve the correct image but with a different size.
+        """Retrieve the correct image tiles but with a different size.
 
-        This can be used for interim display while the real image is being
-        rendered.
+        This can be used for interim display while the real tiles are being
+        rendered. Returns a two-tuple (size, tileset), or None if no other
+        size is available. The tileset maps the tiles to their image.
 
         """
         try:
@@ -122,8 +156,8 @@ class ImageCache:
         except KeyError:
             return
         # find the closest size (assuming aspect ratio has not changed)
-        if entries:
+        sizes = [s for s in entries if s != key.size]
+        if sizes:
             width = key.size[0]
-            sizes = sorted(entries, key=lambda s: abs(1 - s[0] / width))
-            return entries[sizes[0]].image
-
+            size = min(sizes, key=lambda s: abs(1 - s[0] / width))
+            return size, dict((tile, e.image) for tile, e in entries[size].items())
@@ -24,7 +24,10 @@ Only this module depends on popplerqt5.
 
 """
 
-from PyQt5.QtCore import Qt
+import threading
+import weakref
+
+from PyQt5.QtCore import QByteArray, Qt
 
 import popplerqt5
 
@@ -37,6 +40,29 @@ from .constants import (
 )
 
 
+# maps Poppler.Document instances loaded with load() to their PDF data
+_sources = weakref.WeakKeyDictionary()
+
+
+def load(source):
+    """Load a Poppler.Document from a filename or from bytes or a QByteArray.
+
+    The PDF data are remembered, so that the rendering threads can each
+    load their own copy of the document and render pages in parallel.
+    Returns None if the document could not be loaded.
+
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            data = f.read()
+    else:
+        data = bytes(source)
+    doc = popplerqt5.Poppler.Document.loadFromData(QByteArray(data))
+    if doc:
+        _sources[doc] = data
+        return doc
+
+
 class PopplerPage(page.AbstractPage):
     """A Page capable of displaying one page of a Poppler.Document instance.
 
@@ -65,8 +91,14 @@ class PopplerPage(page.AbstractPage):
         return [cls(document, num, renderer) for num in range(document.numPages())]
 
     def mutex(self):
-        """No two pages of same Poppler document are rendered at the same time."""
-        return self.document
+        """No two pages of same Poppler document are rendered at the same time.
+
+        This is not needed for documents loaded with load(), because every
+        rendering thread then uses its own copy of the document.
+
+        """
+        if self.document not in _sources:
+            return self.document
 
 
 class Renderer(render.AbstractImageRenderer):
@@ -77,6 +109,34 @@ class Renderer(render.AbstractImageRenderer):
     renderBackend = popplerqt5.Poppler.Document.SplashBackend
     oversampleThreshold = 96
 
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    def document(self, page):
+        """Return the Poppler.Document to render the page with.
+
+        If the page's document was loaded using load(), a copy of the document
+        is returned that is private to the current thread, so no thread has to
+        wait for another to finish rendering.
+
+        """
+        doc = page.document
+        try:
+            data = _sources[doc]
+        except KeyError:
+            return doc
+        try:
+            documents = self._local.documents
+        except AttributeError:
+            documents = self._local.documents = weakref.WeakKeyDictionary()
+        try:
+            return documents[doc]
+        except KeyError:
+            copy = documents[doc] = popplerqt5.Poppler.Document.loadFromData(
+                QByteArray(data))
+            return copy
+
     def key(self, page):
         """Reimplemented to keep a reference to the poppler document."""
         key = super().key(page)
@@ -85,9 +145,9 @@ class Renderer(render.AbstractImageRenderer):
             (page.pageNumber, page.computedRotation),
             key.size)
 
-    def render(self, page):
-        """Generate an image for this Page."""
-        doc = page.document
+    def render(self, page, tile):
+        """Generate an image for the tile of this Page."""
+        doc = self.document(page)
         num = page.pageNumber
         p = doc.page(num)
         s = page.pageSize()
@@ -99,10 +159,11 @@ class Renderer(render.AbstractImageRenderer):
         multiplier = 2 if xres < self.oversampleThreshold else 1
         image = self.render_poppler_image(doc, num,
             xres * multiplier, yres * multiplier,
-            0, 0, page.width * multiplier, page.height * multiplier,
+            tile.x * multiplier, tile.y * multiplier,
+            tile.w * multiplier, tile.h * multiplier,
             page.computedRotation, page.paperColor or self.paperColor)
         if multiplier == 2:
-            image = image.scaledToWidth(page.width, Qt.SmoothTransformation)
+            image = image.scaledToWidth(tile.w, Qt.SmoothTransformation)
         image.setDotsPerMeterX(xres * 39.37)
         image.setDotsPerMeterY(yres * 39.37)
         return image
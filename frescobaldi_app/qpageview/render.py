@@ -23,48 +23,141 @@ Infrastructure for rendering and caching Page images.
 
 import collections
 import itertools
+import os
+import queue
+import threading
 import weakref
 import time
+import traceback
 
-from PyQt5.QtCore import QRectF, Qt, QThread
+from PyQt5.QtCore import pyqtSignal, QObject, QRect, QRectF, Qt
 from PyQt5.QtGui import QColor, QImage
 
 from . import cache
 
 
 cache_key = collections.namedtuple('cache_key', 'group page size')
+tile = collections.namedtuple('tile', 'x y w h')
 
 
-# the maximum number of concurrent jobs (at global level)
-maxjobs = 4
+# the maximum number of concurrent jobs (at global level), which is also
+# the maximum number of rendering threads in the pool
+maxjobs = os.cpu_count() or 4
 
-# we use a global dict to keep running jobs in, so a thread is never
+# we use a global dict to keep running jobs in, so a job is never
 # deallocated when a renderer dies.
 _jobs = {}
 
+# the global Pool, created on first use
+_pool = None
 
-class Job(QThread):
-    image = None
+
+def pool():
+    """Return the global Pool of rendering threads."""
+    global _pool
+    if _pool is None:
+        _pool = Pool()
+    return _pool
+
+
+class Job:
+    """Renders a set of tiles of a Page in a Worker thread.
+
+    The tiles to render are in the tiles attribute, the cache_key they
+    belong to is in the key attribute. Both are set by the renderer when
+    the job is scheduled. When finished, the images dictionary maps every
+    rendered tile to its image.
+
+    Waiting jobs are started in order of their priority (lower values first,
+    0 is used for visible tiles) and then the time they were last scheduled
+    (newest first).
+
+    """
     running = False
     def __init__(self, renderer, page):
-        super().__init__()
         self.renderer = renderer
         self.page = page
         self.time = time.time()
+        self.priority = 0
+        self.key = None
+        self.tiles = set()
+        self.images = {}
         self.callbacks = set()
-        self.finished.connect(self._slotFinished)
 
     def start(self):
+        """Hand the job over to a Worker thread."""
         self.page_copy = self.page.copy()
-        self.key = self.renderer.key(self.page)
+        if self.renderer.key(self.page_copy) != self.key:
+            # the page changed since scheduling, the tiles are not valid
+            # anymore; the callbacks will cause a repaint and reschedule.
+            self.tiles = set()
         self.running = True
-        super().start()
+        pool().start(self)
+
+    def run(self):
+        """Called in the Worker thread to render the tiles."""
+        self.images = dict((t, self.renderer.render(self.page_copy, t))
+                           for t in self.tiles)
+
+
+class Worker(threading.Thread):
+    """A persistent thread rendering the jobs the Pool hands over to it."""
+    def __init__(self, pool):
+        super().__init__(daemon=True)
+        self.pool = pool
+        self.job = None
+        self._queue = queue.Queue()
+        self.start()
+
+    def render(self, job):
+        """Start rendering the job. Called in the main thread."""
+        self.job = job
+        self._queue.put(job)
 
     def run(self):
-        self.image = self.renderer.render(self.page_copy)
+        while True:
+            job = self._queue.get()
+            try:
+                job.run()
+            except Exception:
+                # keep the thread alive; the tiles are not rendered
+                traceback.print_exc()
+            finally:
+                self.pool.finished.emit(self, job)
 
-    def _slotFinished(self):
-        self.renderer.finish(self)
+
+class Pool(QObject):
+    """Manages up to maxjobs persistent Worker threads.
+
+    Threads are created when needed and then reused, avoiding the cost of
+    starting a thread for every job.
+
+    """
+    finished = pyqtSignal(object, object)
+
+    def __init__(self):
+        super().__init__()
+        self.workers = []
+        self.finished.connect(self._slotFinished)
+
+    def runningJobs(self):
+        """Return the list of jobs that are being rendered."""
+        return [w.job for w in self.workers if w.job]
+
+    def start(self, job):
+        """Let an idle worker render the job, creating one if needed."""
+        for w in self.workers:
+            if w.job is None:
+                break
+        else:
+            w = Worker(self)
+            self.workers.append(w)
+        w.render(job)
+
+    def _slotFinished(self, worker, job):
+        """Called in the main thread when a worker has finished a job."""
+        worker.job = None
+        job.renderer.finish(job)
 
 
 class AbstractImageRenderer:
@@ -81,6 +174,10 @@ class AbstractImageRenderer:
     You must inherit from this class and at least implement the
     render() method.
 
+    Pages are split in tiles (see the tiles() method), and only the tiles
+    that need to be painted are rendered and cached. So at high zoom levels
+    only the visible part of a page occupies memory.
+
     Instance attributes:
 
         `paperColor`    Paper color. If possible this background color is used
@@ -89,12 +186,22 @@ class AbstractImageRenderer:
                         used. If a Page specifies its own paperColor, that color
                         prevails.
 
+        `tileWidth`     The width of a tile in pixels (512). If 0, a tile is
+                        as wide as the page.
+
+        `tileHeight`    The height of a tile in pixels (512). If 0, a tile is
+                        as high as the page.
+
 
     """
 
     # default paper color to use (if possible, and when drawing an empty page)
     paperColor = QColor(Qt.white)
 
+    # default tile size; setting both to 0 renders every page in one image
+    tileWidth = 512
+    tileHeight = 512
+
     def __init__(self):
         self.cache = cache.ImageCache()
 
@@ -122,48 +229,125 @@ class AbstractImageRenderer:
             page.computedRotation,
             (page.width, page.height))
 
-    def render(self, page):
-        """Reimplement this method to generate an image for this Page."""
+    def tiles(self, width, height, rect=None):
+        """Yield tile instances that divide a page of the given size.
+
+        A tile is a four-tuple (x, y, w, h) describing a rectangle on the page.
+        If a QRect is given, only the tiles intersecting with it are yielded.
+
+        """
+        tw = self.tileWidth or width
+        th = self.tileHeight or height
+        if tw <= 0 or th <= 0:
+            return
+        left, top, right, bottom = 0, 0, width, height
+        if rect is not None:
+            left = max(rect.left(), 0) // tw * tw
+            top = max(rect.top(), 0) // th * th
+            right = min(rect.right() + 1, width)
+            bottom = min(rect.bottom() + 1, height)
+        for y in range(top, bottom, th):
+            for x in range(left, right, tw):
+                yield tile(x, y, min(tw, width - x), min(th, height - y))
+
+    def render(self, page, tile):
+        """Reimplement this method to generate an image for the tile of this Page.
+
+        The tile is a four-tuple (x, y, w, h) and the returned image should
+        have the width and height of the tile.
+
+        """
         return QImage()
 
     def paint(self, page, painter, rect, callback=None):
         """Paint a page.
 
         The Page calls this method by default in the paint() method.
-        This method tries to fetch an image from the cache and paint that.
-        If no image is available, render() is called in the background to
-        generate one. If it is ready, the callback is called with the Page
-        as argument. An interim image may be painted in the meantime (e.g.
-        scaled from another size).
+        This method tries to fetch the images of the tiles that are touched
+        by the rect from the cache and paint those. For tiles that are not
+        available, render() is called in the background to generate them.
+        If they are ready, the callback is called with the Page as argument.
+        An interim image is painted in the meantime (e.g. scaled from another
+        size).
 
         """
         key = self.key(page)
-        try:
-            image = self.cache[key]
-        except KeyError:
-            image = self.cache.closest(key)
-            if image:
-                hscale = image.width() / page.width
-                vscale = image.height() / page.height
-                image_rect = QRectF(rect.x() * hscale, rect.y() * vscale,
-                                    rect.width() * hscale, rect.height() * vscale)
-                painter.drawImage(QRectF(rect), image, image_rect)
+        missing = []
+        for t in self.tiles(int(page.width), int(page.height), rect):
+            try:
+                image = self.cache[key, t]
+            except KeyError:
+                missing.append(t)
             else:
-                color = page.paperColor or self.paperColor or QColor(Qt.white)
-                painter.fillRect(rect, color)
-            self.schedule(page, painter, callback)
-        else:
-            painter.drawImage(rect, image, rect)
+                r = QRect(*t) & rect
+                painter.drawImage(r, image, r.translated(-t.x, -t.y))
+        if missing:
+            self.fallback(page, painter, key, [QRect(*t) & rect for t in missing])
+            self.schedule(page, key, missing, callback)
+
+    def fallback(self, page, painter, key, rects):
+        """Paint interim images in the list of rects, while rendering.
+
+        The default implementation fills the rects with the paper color,
+        and then scales the tiles of the cached image with the closest size,
+        if any.
 
-    def schedule(self, page, painter, callback):
-        """Start a new rendering job."""
+        """
+        color = page.paperColor or self.paperColor or QColor(Qt.white)
+        for r in rects:
+            painter.fillRect(r, color)
+        result = self.cache.closest(key)
+        if result:
+            size, tileset = result
+            hscale = page.width / size[0]
+            vscale = page.height / size[1]
+            for t, image in tileset.items():
+                target = QRectF(t.x * hscale, t.y * vscale, t.w * hscale, t.h * vscale)
+                for r in rects:
+                    r = target & QRectF(r)
+                    if not r.isEmpty():
+                        source = QRectF(
+                            (r.x() - target.x()) / hscale,
+                            (r.y() - target.y()) / vscale,
+                            r.width() / hscale, r.height() / vscale)
+                        painter.drawImage(r, image, source)
+
+    def prefetch(self, page, rect, callback):
+        """Schedule rendering the tiles of the page in the rect in advance.
+
+        Only tiles that are not cached yet are scheduled, and they are
+        rendered after the tiles that are needed for painting. The View
+        uses this to render the region it will probably scroll to next.
+
+        """
+        key = self.key(page)
+        tileset = self.cache.tileset(key)
+        tiles = [t for t in self.tiles(int(page.width), int(page.height), rect)
+                   if t not in tileset]
+        if tiles:
+            self.schedule(page, key, tiles, callback, 1)
+
+    def schedule(self, page, key, tiles, callback, priority=0):
+        """Start a new rendering job for the tiles of the page.
+
+        Jobs with a lower priority value are started first.
+
+        """
         try:
             job = _jobs.setdefault(self, {})[page]
         except KeyError:
             job = _jobs[self][page] = Job(self, page)
+        if not job.running:
+            if job.key != key:
+                job.key = key
+                job.tiles.clear()
+                job.priority = priority
+            else:
+                job.priority = min(job.priority, priority)
+            job.tiles.update(tiles)
+            job.time = time.time()
         job.callbacks.add(callback)
         self.checkstart()
-
     def unschedule(self, page, callback):
         """Unschedule a possible pending rendering job.
 
@@ -185,17 +369,24 @@ class AbstractImageRenderer:
     def checkstart(self):
         """Check whether there are jobs that need to be started."""
         try:
-            ourjobs = _jobs[self].values()
+            ourjobs = _jobs[self]
         except KeyError:
             return
+        # cancel waiting jobs that became stale, e.g. because the zoom changed
+        for page, job in list(ourjobs.items()):
+            if not job.running and self.key(page) != job.key:
+                del ourjobs[page]
+        if not ourjobs:
+            del _jobs[self]
+            return
         # count the total number of running jobs
-        runningjobs = [j for jobs in _jobs.values()
-                         for j in jobs.values() if j.running]
-        waitingjobs = sorted((j for j in ourjobs if not j.running),
-                             key=lambda j: j.time, reverse=True)
-        jobcount = len(runningjobs)
+        runningjobs = pool().runningJobs()
+        waitingjobs = sorted((j for j in ourjobs.values() if not j.running),
+                             key=lambda j: (j.priority, -j.time))
 
-        for job in waitingjobs[:maxjobs-jobcount]:
+        for job in waitingjobs:
+            if len(runningjobs) >= maxjobs:
+                break
             mutex = job.page.mutex()
             if mutex is None or not any(mutex is j.page.mutex() for j in runningjobs):
                 runningjobs.append(job)
@@ -203,16 +394,15 @@ class AbstractImageRenderer:
 
     def finish(self, job):
         """Called by the job when finished."""
-        self.cache[job.key] = job.image
-        # if page already was resized during rendering, immediately rerender...
-        if job.page.size() != job.page_copy.size():
-            job.start()
+        for t, image in job.images.items():
+            self.cache[job.key, t] = image
+        # if the page was resized during rendering, or more tiles became
+        # visible, the callbacks cause a repaint that schedules a new job.
+        for cb in job.callbacks:
+            cb(job.page)
+        del _jobs[self][job.page]
+        if not _jobs[self]:
+            del _jobs[self]
         else:
-            for cb in job.callbacks:
-                cb(job.page)
-            del _jobs[self][job.page]
-            if not _jobs[self]:
-                del _jobs[self]
-            else:
-                self.checkstart()
+            self.checkstart()
 
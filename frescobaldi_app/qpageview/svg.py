@@ -85,11 +85,12 @@ class Renderer(render.AbstractImageRenderer):
     # QImage format to use
     imageFormat = QImage.Format_ARGB32_Premultiplied
 
-    def render(self, page):
-        """Generate an image for this Page."""
-        i = QImage(page.width, page.height, self.imageFormat)
+    def render(self, page, tile):
+        """Generate an image for the tile of this Page."""
+        i = QImage(tile.w, tile.h, self.imageFormat)
         i.fill(page.paperColor or self.paperColor or QColor(Qt.white))
         painter = QPainter(i)
+        painter.translate(-tile.x, -tile.y)
         rect = QRect(0, 0, page.width, page.height)
         painter.translate(rect.center())
         painter.rotate(page.computedRotation * 90)
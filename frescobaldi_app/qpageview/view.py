@@ -61,6 +61,7 @@ class View(scrollarea.ScrollArea):
     def __init__(self, parent=None, **kwds):
         super().__init__(parent, **kwds)
         self._prev_pages_to_paint = set()
+        self._scrollDirection = QPoint(0, 1)
         self._viewMode = FixedScale
         self._pageLayout = layout.PageLayout()
         self._magnifier = None
@@ -72,9 +73,8 @@ class View(scrollarea.ScrollArea):
 
     def loadPdf(self, filename):
         """Convenience method to load the specified PDF file."""
-        import popplerqt5
         from . import poppler
-        doc = popplerqt5.Poppler.Document.load(filename)
+        doc = poppler.load(filename)
         renderer = poppler.Renderer()
         self.pageLayout()[:] = poppler.PopplerPage.createPages(doc, renderer)
         self.updatePageLayout()
@@ -178,6 +178,8 @@ class View(scrollarea.ScrollArea):
         """Reimplemented to move the rubberband as well."""
         if self._rubberband:
             self._rubberband.scrollBy(QPoint(dx, dy))
+        # remember the direction we are scrolling in, for prefetching
+        self._scrollDirection = QPoint((dx < 0) - (dx > 0), (dy < 0) - (dy > 0))
         self.viewport().update()
 
     def _fitLayout(self):
@@ -411,6 +413,15 @@ class View(scrollarea.ScrollArea):
 
         # TODO paint highlighting
 
+        # render the region we will probably scroll to next in advance
+        visible = self.visibleRect()
+        d = self._scrollDirection
+        ahead = visible.translated(d.x() * visible.width(), d.y() * visible.height())
+        for p in self._pageLayout.pagesAt(ahead):
+            if p.renderer:
+                rect = (p.rect() & ahead).translated(-p.pos())
+                p.renderer.prefetch(p, rect, self.repaintPage)
+
         # remove pending render jobs for pages that were visible, but are not
         # visible now
         margin = 50
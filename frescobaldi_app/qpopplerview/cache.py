@@ -22,7 +22,8 @@
 Caching of generated images.
 """
 
-import time
+import collections
+import concurrent.futures
 import weakref
 
 try:
@@ -37,21 +38,32 @@ from . import render
 from . import rectangles
 from .locking import lock
 
-__all__ = ['maxsize', 'setmaxsize', 'image', 'generate', 'clear', 'links', 'options']
+__all__ = ['maxsize', 'setmaxsize', 'image', 'generate', 'clear', 'links', 'options', 'stats',
+           'diskcache', 'setdiskcache']
 
 
 _cache = weakref.WeakKeyDictionary()
 _schedulers = weakref.WeakKeyDictionary()
 _options = weakref.WeakKeyDictionary()
 _links = weakref.WeakKeyDictionary()
+_lru = collections.OrderedDict()    # entries, least recently used first
 
 
 # cache size
 _maxsize = 104857600 # 100M
 _currentsize = 0
 
+# counters for diagnostics
+_hits = 0
+_misses = 0
+_evictions = 0
+
 _globaloptions = None
 
+# stores rendered images in the disk cache, one at a time
+_storer = None
+_diskcache = None
+
 
 def setmaxsize(maxsize):
     """Sets the maximum cache size in Megabytes."""
@@ -65,16 +77,50 @@ def maxsize():
     return _maxsize / 1048576
 
 
+def setdiskcache(diskcache):
+    """Sets a diskcache.DiskCache instance to use for storing images persistently.
+
+    Use None to stop using a disk cache.
+
+    """
+    global _diskcache
+    _diskcache = diskcache
+
+
+def diskcache():
+    """Returns the diskcache.DiskCache instance in use, if any."""
+    return _diskcache
+
+
+def stats():
+    """Returns a dictionary with the cache size and hit/miss/eviction counters.
+
+    Only requests for exactly sized images are counted as hits or misses.
+
+    """
+    return {
+        'size': _currentsize,
+        'maxsize': _maxsize,
+        'count': len(_lru),
+        'hits': _hits,
+        'misses': _misses,
+        'evictions': _evictions,
+    }
+
+
 def clear(document=None):
     """Clears the whole cache or the cache for the given Poppler.Document."""
+    global _currentsize
     if document:
         try:
-            del _cache[document]
+            pageKeys = _cache.pop(document)
         except KeyError:
             pass
+        else:
+            _forget(pageKeys)
     else:
         _cache.clear()
-        global _currentsize
+        _lru.clear()
         _currentsize = 0
 
 
@@ -91,13 +137,16 @@ def image(page, exact=True):
     sizeKey = (page.physWidth(), page.physHeight())
 
     if exact:
+        global _hits, _misses
         try:
             entry = _cache[document][pageKey][sizeKey]
         except KeyError:
+            _misses += 1
             return
         else:
-            entry[1] = time.time()
-            return entry[0]
+            _hits += 1
+            _lru.move_to_end(entry)
+            return entry.image
     try:
         sizes = _cache[document][pageKey].keys()
     except KeyError:
@@ -105,7 +154,7 @@ def image(page, exact=True):
     # find the closest size (assuming aspect ratio has not changed)
     if sizes:
         sizes = sorted(sizes, key=lambda s: abs(1 - s[0] / float(page.physWidth())))
-        return _cache[document][pageKey][sizes[0]][0]
+        return _cache[document][pageKey][sizes[0]].image
 
 
 def generate(page):
@@ -120,44 +169,67 @@ def generate(page):
     scheduler.schedulejob(page)
 
 
+class Entry(object):
+    """(Internal) An image in the cache, remembering where it is stored."""
+    def __init__(self, image, pageKeys, pageKey, sizeKey):
+        self.image = image
+        self.byteCount = image.byteCount()
+        self.location = (pageKeys, pageKey, sizeKey)
+
+
 def add(image, document, pageNumber, rotation, width, height):
     """(Internal) Adds an image to the cache."""
+    global _currentsize
     pageKey = (pageNumber, rotation)
     sizeKey = (width, height)
-    _cache.setdefault(document, {}).setdefault(pageKey, {})[sizeKey] = [image, time.time()]
+    try:
+        pageKeys = _cache[document]
+    except KeyError:
+        pageKeys = _cache[document] = {}
+        # forget the images when the document is garbage collected
+        weakref.finalize(document, _forget, pageKeys)
+    sizeKeys = pageKeys.setdefault(pageKey, {})
+    try:
+        old = sizeKeys[sizeKey]
+    except KeyError:
+        pass
+    else:
+        del _lru[old]
+        _currentsize -= old.byteCount
+    entry = sizeKeys[sizeKey] = Entry(image, pageKeys, pageKey, sizeKey)
+    _lru[entry] = True
 
     # maintain cache size
-    global _maxsize, _currentsize
-    _currentsize += image.byteCount()
+    _currentsize += entry.byteCount
     if _currentsize > _maxsize:
         purge()
 
 
 def purge():
-    """Removes old images from the cache to limit the space used.
+    """Removes the least recently used images from the cache to limit the space used.
 
     (Not necessary to call, as the cache will monitor its size automatically.)
 
     """
-    # make a list of the images, sorted on time, newest first
-    images = iter(sorted((
-        (time, document, pageKey, sizeKey, image.byteCount())
-            for document, pageKeys in _cache.items()
-            for pageKey, sizeKeys in pageKeys.items()
-            for sizeKey, (image, time) in sizeKeys.items()),
-                reverse=True))
-
-    # sum the size of the newest images
-    global _maxsize, _currentsize
-    byteCount = 0
-    for item in images:
-        byteCount += item[4]
-        if byteCount > _maxsize:
-            break
-    _currentsize = byteCount
-    # delete the other images
-    for time, document, pageKey, sizeKey, byteCount in images:
-        del _cache[document][pageKey][sizeKey]
+    global _currentsize, _evictions
+    while _currentsize > _maxsize and _lru:
+        entry = _lru.popitem(False)[0]
+        _currentsize -= entry.byteCount
+        _evictions += 1
+        pageKeys, pageKey, sizeKey = entry.location
+        sizeKeys = pageKeys[pageKey]
+        del sizeKeys[sizeKey]
+        if not sizeKeys:
+            del pageKeys[pageKey]
+
+
+def _forget(pageKeys):
+    """(Internal) Removes the images of a document from the LRU bookkeeping."""
+    global _currentsize
+    for sizeKeys in pageKeys.values():
+        for entry in sizeKeys.values():
+            if _lru.pop(entry, False):
+                _currentsize -= entry.byteCount
 
 
 def links(page):
@@ -208,6 +280,18 @@ def setoptions(options, document=None):
             pass
 
 
+def _optionskey(document):
+    """(Internal) Returns a tuple describing the options used to render the document."""
+    o, d = options(), options(document)
+    hint = d.renderHint() if d.renderHint() is not None else o.renderHint()
+    color = d.paperColor() if d.paperColor() is not None else o.paperColor()
+    return (
+        None if hint is None else int(hint),
+        None if color is None else color.rgba(),
+        o.oversampleThreshold() or d.oversampleThreshold(),
+    )
+
+
 class Scheduler(object):
     """Manages running rendering jobs in sequence for a Document."""
     def __init__(self):
@@ -280,6 +364,24 @@ class Runner(QThread):
 
     def run(self):
         """Main method of this thread, called by Qt on start()."""
+        self.store = None
+        diskcache = _diskcache
+        if diskcache:
+            key = diskcache.key(self.document, self.job.pageNumber, self.job.rotation,
+                                self.job.width, self.job.height, _optionskey(self.document))
+            if key:
+                self.image = diskcache.image(key)
+                if self.image is None:
+                    self.render()
+                    if not self.failed:
+                        # store it after the image has been shown
+                        self.store = diskcache, key
+                return
+        self.render()
+
+    def render(self):
+        """Renders the image for the job."""
+        self.failed = False
         page = self.document.page(self.job.pageNumber)
         pageSize = page.pageSize()
         if self.job.rotation & 1:
@@ -294,6 +396,7 @@ class Runner(QThread):
             self.image = page.renderToImage(xres * multiplier, yres * multiplier, 0, 0, self.job.width * multiplier, self.job.height * multiplier, self.job.rotation)
 
         if self.image.isNull():
+            self.failed = True
             self.image = QImage( self.job.width, self.job.height, QImage.Format_RGB32 )
             self.image.fill( Qt.white )
             p = QPainter(self.image)
@@ -305,7 +408,13 @@ class Runner(QThread):
 
     def slotFinished(self):
         """Called when the thread has completed."""
+        global _storer
         add(self.image, self.document, self.job.pageNumber, self.job.rotation, self.job.width, self.job.height)
         self.scheduler.done(self.job)
         self.scheduler.checkStart()
+        if self.store:
+            diskcache, key = self.store
+            if _storer is None:
+                _storer = concurrent.futures.ThreadPoolExecutor(1)
+            _storer.submit(diskcache.store, key, self.image)
 
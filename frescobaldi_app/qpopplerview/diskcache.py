@@ -0,0 +1,168 @@
+# This file is part of the qpopplerview package.
+#
+# Copyright (c) 2010 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Persistent caching of rendered page images on disk.
+
+Images are stored as PNG files under a key that is computed from a hash of
+the PDF data, the page number, rotation, size and rendering options. So an
+unchanged PDF document (e.g. after reopening it or after a recompile that
+produced the same output) does not need to be rendered again.
+
+The PDF data of a Poppler.Document must be registered using register(),
+images of unregistered documents are not cached on disk.
+
+"""
+
+import hashlib
+import os
+import threading
+import weakref
+
+from PyQt5.QtGui import QImage
+
+
+__all__ = ['register', 'DiskCache']
+
+
+_digests = weakref.WeakKeyDictionary()
+
+
+def register(document, data):
+    """Registers the PDF data (bytes or QByteArray) the Poppler.Document was loaded from."""
+    _digests[document] = hashlib.sha1(bytes(data)).hexdigest()
+
+
+def digest(document):
+    """Returns the hash of the PDF data of the document, or None if not registered."""
+    return _digests.get(document)
+
+
+class DiskCache(object):
+    """Stores rendered images in a directory.
+
+    When the total size of the images exceeds maxsize (in bytes), the least
+    recently used images are removed, using the modification time of the files.
+    All methods may be called from a rendering thread.
+
+    """
+    def __init__(self, path, maxsize=524288000):
+        self._path = path
+        self._maxsize = maxsize
+        self._currentsize = None    # counted on first store
+        self._lock = threading.Lock()
+
+    def path(self):
+        """Returns the directory the images are stored in."""
+        return self._path
+
+    def maxsize(self):
+        """Returns the maximum size of the cache in bytes."""
+        return self._maxsize
+
+    def key(self, document, pageNumber, rotation, width, height, options=()):
+        """Returns a key for the image of a page, or None if the document is not registered.
+
+        The options should be a tuple describing the rendering options.
+
+        """
+        d = digest(document)
+        if d:
+            s = repr((d, pageNumber, rotation, width, height, options))
+            return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+    def filename(self, key):
+        """Returns the filename for the key."""
+        return os.path.join(self._path, key + '.png')
+
+    def image(self, key):
+        """Returns the image stored under the key, or None."""
+        filename = self.filename(key)
+        image = QImage()
+        if not image.load(filename, 'PNG'):
+            return
+        try:
+            os.utime(filename, None) # mark as recently used
+        except OSError:
+            pass
+        return image
+
+    def store(self, key, image):
+        """Stores the image under the key."""
+        filename = self.filename(key)
+        temp = '{0}.{1}.tmp'.format(filename, threading.get_ident())
+        try:
+            os.makedirs(self._path, exist_ok=True)
+            if not image.save(temp, 'PNG'):
+                return
+            os.replace(temp, filename)
+            size = os.path.getsize(filename)
+        except OSError:
+            return
+        with self._lock:
+            if self._currentsize is None:
+                self._currentsize = sum(size for mtime, size, name in self._files())
+            else:
+                self._currentsize += size
+            if self._currentsize > self._maxsize:
+                self._purge()
+
+    def clear(self):
+        """Removes all stored images."""
+        with self._lock:
+            for mtime, size, name in self._files():
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+            self._currentsize = 0
+
+    def _files(self):
+        """(Internal) Yields (mtime, size, filename) for all stored images."""
+        try:
+            names = os.listdir(self._path)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.png'):
+                name = os.path.join(self._path, name)
+                try:
+                    s = os.stat(name)
+                except OSError:
+                    continue
+                yield s.st_mtime, s.st_size, name
+
+    def _purge(self):
+        """(Internal) Removes the least recently used images.
+
+        A tenth of the space is freed extra, so that not every store needs a purge.
+
+        """
+        files = sorted(self._files())
+        total = sum(f[1] for f in files)
+        limit = self._maxsize * 9 // 10
+        for mtime, size, name in files:
+            if total <= limit:
+                break
+            try:
+                os.remove(name)
+            except OSError:
+                continue
+            total -= size
+        self._currentsize = total
@@ -46,10 +46,10 @@ def findDocument(filename):
 
     """
     for d in app.documents:
-        if d.url().toLocalFile() == filename:
-            return d
         s = ScratchDir.instance(d)
-        if s.directory() and util.equal_paths(filename, s.path()):
+        if (d.url().toLocalFile() == filename or
+            (s.directory() and util.equal_paths(filename, s.path()))):
+            d.ensureLoaded()
             return d
 
 
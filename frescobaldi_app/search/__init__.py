@@ -19,14 +19,21 @@
 
 """
 Widget for search and replace.
+
+The search results are kept as arrays of start and end positions. The
+document is searched in chunks from a timer, and after a change in the
+document only the changed lines are searched again if possible. Text
+cursors are only created for the results that are visible in the View.
 """
 
 
+import array
 import bisect
 import re
+import time
 import weakref
 
-from PyQt5.QtCore import QEvent, Qt
+from PyQt5.QtCore import QEvent, QPoint, Qt, QTimer
 from PyQt5.QtGui import QKeySequence, QPalette, QTextCursor
 from PyQt5.QtWidgets import (
     QAction, QApplication, QCheckBox, QGridLayout, QLabel, QLineEdit,
@@ -45,11 +52,24 @@ import gadgets.borderlayout
 
 
 class Search(plugin.MainWindowPlugin, QWidget):
+
+    # the time in msec to spend searching before returning to the event loop
+    scanTime = 20
+
     def __init__(self, mainwindow):
         QWidget.__init__(self, mainwindow)
         self._currentView = None
-        self._positions = []
+        self._starts = array.array('i')    # start positions of the results
+        self._ends = array.array('i')      # end positions of the results
         self._positionsDirty = True
+        self._pattern = None   # the compiled search
+        self._matches = None   # iterator over the matches while searching
+        self._offset = 0       # the position of the searched text
+        self._incremental = False   # can changes be searched line by line?
+        self._scanTimer = QTimer(self, singleShot=True, interval=0)
+        self._scanTimer.timeout.connect(self.slotScan)
+        self._highlightTimer = QTimer(self, singleShot=True, interval=0)
+        self._highlightTimer.timeout.connect(self.highlightingOn)
         self._replace = False  # are we in replace mode?
         self._going = False    # are we moving the text cursor?
 
@@ -141,10 +161,14 @@ class Search(plugin.MainWindowPlugin, QWidget):
         cur = self.currentView()
         if cur:
             cur.selectionChanged.disconnect(self.slotSelectionChanged)
-            cur.document().contentsChanged.disconnect(self.slotDocumentContentsChanged)
+            cur.document().contentsChange.disconnect(self.slotDocumentContentsChange)
+            cur.verticalScrollBar().valueChanged.disconnect(self.slotViewScrolled)
+            cur.verticalScrollBar().rangeChanged.disconnect(self.slotViewScrolled)
         if view:
             view.selectionChanged.connect(self.slotSelectionChanged)
-            view.document().contentsChanged.connect(self.slotDocumentContentsChanged)
+            view.document().contentsChange.connect(self.slotDocumentContentsChange)
+            view.verticalScrollBar().valueChanged.connect(self.slotViewScrolled)
+            view.verticalScrollBar().rangeChanged.connect(self.slotViewScrolled)
         self._currentView = weakref.ref(view) if view else None
 
     def showWidget(self):
@@ -181,13 +205,21 @@ class Search(plugin.MainWindowPlugin, QWidget):
                 self.updatePositions()
                 self.highlightingOn()
 
-    def slotDocumentContentsChanged(self):
+    def slotDocumentContentsChange(self, position, removed, added):
         """Called when the current document changes."""
-        self.markPositionsDirty()
+        if not (self.isVisible() and not self._positionsDirty
+                and self.updateChangedPositions(position, removed, added)):
+            self.markPositionsDirty()
+            if self.isVisible():
+                self.updatePositions()
         if self.isVisible():
-            self.updatePositions()
             self.highlightingOn()
 
+    def slotViewScrolled(self):
+        """Called when the View scrolls, highlights the now visible results."""
+        if self.isVisible():
+            self._highlightTimer.start()
+
     def slotHide(self):
         """Called when the close button is clicked."""
         view = self.currentView()
@@ -248,9 +280,10 @@ class Search(plugin.MainWindowPlugin, QWidget):
         self.markPositionsDirty()
         self.updatePositions()
         self.highlightingOn()
-        if not self._replace and self._positions:
-            positions = [c.position() for c in self._positions]
+        if not self._replace and self._starts:
             cursor = self.currentView().textCursor()
+            self.scan(cursor.selectionStart())
+            positions = self._starts
             index = bisect.bisect_left(positions, cursor.selectionStart())
             if index == len(positions):
                 index -= 1
@@ -259,17 +292,24 @@ class Search(plugin.MainWindowPlugin, QWidget):
                 # is in a search result. This happens when the search is pop up
                 # with an empty text and the current word is then set as search
                 # text.
-                if cursortools.contains(self._positions[index-1], cursor):
+                if cursortools.contains(self.cursor(index-1), cursor):
                     index -= 1
             self.gotoPosition(index)
         self._going = False
 
     def highlightingOn(self, view=None):
-        """Show the current search result positions."""
+        """Show the current search result positions that are visible."""
         if view is None:
             view = self.currentView()
         if view:
-            viewhighlighter.highlighter(view).highlight("search", self._positions, 1)
+            viewport = view.viewport()
+            top = view.cursorForPosition(QPoint(0, 0)).block().position()
+            block = view.cursorForPosition(QPoint(viewport.width(), viewport.height())).block()
+            bottom = block.position() + block.length()
+            cursors = [self.cursor(i) for i in range(
+                bisect.bisect_right(self._ends, top),
+                bisect.bisect_right(self._starts, bottom))]
+            viewhighlighter.highlighter(view).highlight("search", cursors, 1)
 
     def highlightingOff(self, view=None):
         """Hide the current search result positions."""
@@ -280,55 +320,149 @@ class Search(plugin.MainWindowPlugin, QWidget):
 
     def markPositionsDirty(self):
         """Delete positions and mark them dirty, i.e. they need updating."""
-        self._positions = []
+        self._starts = array.array('i')
+        self._ends = array.array('i')
+        self._matches = None
+        self._scanTimer.stop()
         self._positionsDirty = True
 
     def updatePositions(self):
-        """Update the search result positions if necessary."""
+        """Update the search result positions if necessary.
+
+        The first results are searched immediately, the remainder of the
+        document is searched in chunks from a timer. Use scan() to wait for
+        the results up to a certain position.
+
+        """
         view = self.currentView()
         if not view or not self._positionsDirty:
             return
         search = self.searchEntry.text()
         cursor = view.textCursor()
         document = view.document()
-        self._positions = []
+        self._pattern = None
         if search:
             text = document.toPlainText()
             start = 0
-            if (self._replace or not self._going) and cursor.hasSelection():
+            limited = (self._replace or not self._going) and cursor.hasSelection()
+            if limited:
                 # don't search outside the selection
                 start = cursor.selectionStart()
                 text = text[start:cursor.selectionEnd()]
+            # plain text searches can be updated line by line after a change
+            self._incremental = not (limited or self.regexCheck.isChecked()
+                                     or '\n' in search)
             flags = re.MULTILINE | re.DOTALL
             if not self.caseCheck.isChecked():
                 flags |= re.IGNORECASE
             if not self.regexCheck.isChecked():
                 search = re.escape(search)
             try:
-                matches = re.finditer(search, text, flags)
+                self._pattern = re.compile(search, flags)
             except re.error:
                 pass
             else:
-                for m in matches:
-                    c = QTextCursor(document)
-                    c.setPosition(start + m.end())
-                    c.setPosition(start + m.start(), QTextCursor.KeepAnchor)
-                    self._positions.append(c)
-        self.countLabel.setText(format(len(self._positions)))
-        enabled = len(self._positions) > 0
+                self._offset = start
+                self._matches = self._pattern.finditer(text)
+        self._positionsDirty = False
+        self.scan()
+
+    def scan(self, until=None):
+        """Collects results from the running search, if any.
+
+        If until is None, stops after scanTime msec and continues later from a
+        timer. Otherwise, continues until a result starting after the position
+        until is found, or the search is finished. Use float('inf') to get all
+        results.
+
+        """
+        matches = self._matches
+        if matches is None:
+            return
+        starts, ends, offset = self._starts, self._ends, self._offset
+        deadline = time.perf_counter() + self.scanTime / 1000
+        for count, m in enumerate(matches, 1):
+            starts.append(offset + m.start())
+            ends.append(offset + m.end())
+            if until is None:
+                if not count % 100 and time.perf_counter() > deadline:
+                    break
+            elif starts[-1] > until:
+                break
+        else:
+            self._matches = None
+        if self._matches is not None:
+            self._scanTimer.start()
+        self.updateCount()
+
+    def slotScan(self):
+        """Called from the timer to collect the next chunk of results."""
+        self.scan()
+        self.highlightingOn()
+
+    def updateCount(self):
+        """Shows the number of results and enables the buttons."""
+        self.countLabel.setText(format(len(self._starts)))
+        enabled = len(self._starts) > 0
         self.replaceButton.setEnabled(enabled)
         self.replaceAllButton.setEnabled(enabled)
         self.prevButton.setEnabled(enabled)
         self.nextButton.setEnabled(enabled)
-        self._positionsDirty = False
+
+    def updateChangedPositions(self, position, removed, added):
+        """Updates the result positions after a change in the document.
+
+        Only the changed lines are searched again, the positions of the
+        results after them are shifted. Returns False if this is not possible,
+        e.g. because the search is still running or could span multiple lines;
+        then the whole document needs to be searched again.
+
+        """
+        if (self._pattern is None or self._matches is not None
+            or not self._incremental):
+            return False
+        document = self.currentView().document()
+        first = document.findBlock(position)
+        last = document.findBlock(position + added)
+        start = first.position()
+        end = last.position() + last.length() - 1
+        delta = added - removed
+        # the results in the changed lines
+        i = bisect.bisect_left(self._starts, start)
+        j = bisect.bisect_left(self._starts, end - delta)
+        lines = []
+        block = first
+        while True:
+            lines.append(block.text())
+            if block == last:
+                break
+            block = block.next()
+        starts, ends = array.array('i'), array.array('i')
+        for m in self._pattern.finditer('\n'.join(lines)):
+            starts.append(start + m.start())
+            ends.append(start + m.end())
+        self._starts = (self._starts[:i] + starts
+                        + array.array('i', (p + delta for p in self._starts[j:])))
+        self._ends = (self._ends[:i] + ends
+                      + array.array('i', (p + delta for p in self._ends[j:])))
+        self.updateCount()
+        return True
+
+    def cursor(self, index):
+        """Returns a QTextCursor selecting the result at index."""
+        c = QTextCursor(self.currentView().document())
+        c.setPosition(self._ends[index])
+        c.setPosition(self._starts[index], QTextCursor.KeepAnchor)
+        return c
 
     def findNext(self):
         """Called on menu Find Next."""
         self._going = True
         self.updatePositions()
         view = self.currentView()
-        if view and self._positions:
-            positions = [c.position() for c in self._positions]
+        if view and self._starts:
+            self.scan(view.textCursor().position())
+            positions = self._starts
             index = bisect.bisect_right(positions, view.textCursor().position())
             if index < len(positions):
                 self.gotoPosition(index)
@@ -342,15 +476,17 @@ class Search(plugin.MainWindowPlugin, QWidget):
         self._going = True
         self.updatePositions()
         view = self.currentView()
-        positions = [c.position() for c in self._positions]
+        if view:
+            self.scan(view.textCursor().position())
+        positions = self._starts
         if view and positions:
             index = bisect.bisect_left(positions, view.textCursor().position()) - 1
             self.gotoPosition(index)
         self._going = False
 
     def gotoPosition(self, index):
-        """Scrolls the current View to the position in the _positions list at index."""
-        c = QTextCursor(self._positions[index])
+        """Scrolls the current View to the search result at index."""
+        c = self.cursor(index)
         #c.clearSelection()
         self.currentView().gotoTextCursor(c)
         self.currentView().ensureCursorVisible()
@@ -378,7 +514,7 @@ class Search(plugin.MainWindowPlugin, QWidget):
     def keyPressEvent(self, ev):
         """Catches Up and Down to jump between search results."""
         # if in search mode, Up and Down jump between search results
-        if not self._replace and self._positions and self.searchEntry.text() and not ev.modifiers():
+        if not self._replace and self._starts and self.searchEntry.text() and not ev.modifiers():
             if ev.key() == Qt.Key_Up:
                 self.findPrevious()
                 return
@@ -415,12 +551,13 @@ class Search(plugin.MainWindowPlugin, QWidget):
     def slotReplace(self):
         """Called when the user clicks Replace."""
         view = self.currentView()
-        if view and self._positions:
-            positions = [c.position() for c in self._positions]
+        if view and self._starts:
+            self.scan(view.textCursor().position())
+            positions = self._starts
             index = bisect.bisect_left(positions, view.textCursor().position())
             if index >= len(positions):
                 index = 0
-            if self.doReplace(self._positions[index]):
+            if self.doReplace(self.cursor(index)):
                 self.findNext()
 
     def slotReplaceAll(self):
@@ -428,7 +565,8 @@ class Search(plugin.MainWindowPlugin, QWidget):
         view = self.currentView()
         if view:
             replaced = False
-            cursors = self._positions
+            self.scan(float('inf'))
+            cursors = [self.cursor(i) for i in range(len(self._starts))]
             if view.textCursor().hasSelection():
                 cursors = [cursor for cursor in cursors if cursortools.contains(view.textCursor(), cursor)]
             with cursortools.compress_undo(view.textCursor()):
@@ -83,22 +83,16 @@ def restoreSession(key):
         sessions.setCurrentSession(session_name)
     ## restore documents
     numdocuments = settings.value('numdocuments', 0, int)
-    doc = None
+    urls = []
     for index in range(numdocuments):
         settings.beginGroup("document{0}".format(index))
-        url = settings.value("url", QUrl(), QUrl)
-        if url.isEmpty():
-            import document
-            doc = document.Document()
-        else:
-            try:
-                doc = app.openUrl(url)
-            except IOError:
-                pass
+        urls.append(settings.value("url", QUrl(), QUrl))
         settings.endGroup()
+    # the documents are read in parallel and loaded when needed
+    docs = app.openUrls(urls)
     # open at least one
-    if doc is None:
-        doc = app.openUrl(QUrl())
+    if not docs:
+        app.openUrl(QUrl())
     ## restore windows
     numwindows = settings.value('numwindows', 0, int)
     if numwindows > 0:
@@ -104,14 +104,8 @@ def loadSession(name):
     urls = qsettings.get_url_list(session, "urls")
     active = session.value("active", -1, int)
     result = None
-    docs = []
-    for url in urls:
-        try:
-            doc = app.openUrl(url)
-        except IOError:
-            pass
-        else:
-            docs.append(doc)
+    # the documents are read in parallel and loaded when needed
+    docs = app.openUrls(urls)
     setCurrentSession(name)
     if docs:
         if active not in range(len(docs)):
@@ -41,19 +41,38 @@ import highlighter
 
 def tokens(block):
     """Returns the tokens for the given block as a (possibly empty) tuple."""
+    tokens = highlighter.stored_tokens(block)
+    if tokens is not None:
+        return tokens
+    # the block may still have to be lexed
+    highlighter.highlighter(block.document()).lexUntil(block)
+    tokens = highlighter.stored_tokens(block)
+    if tokens is not None:
+        return tokens
+    # we used to call highlighter.highlighter(block.document()).rehighlight()
+    # here, but there is a bug in PyQt-4.9.6 causing QTextBlockUserData to
+    # lose its Python attributes. So we only run the highlighter when the
+    # previous block's userState() is -1.
+    return tuple(state(block).tokens(block.text()))
+
+
+def token_hash(block):
+    """Returns the hash of the meaningful tokens of the block, or None.
+
+    See highlighter.token_hash(). The hash is computed by the highlighter
+    when it tokenizes the block, so it is normally readily available.
+
+    """
     try:
-        return block.userData().tokens
+        return block.userData().hash
     except AttributeError:
-        # we used to call highlighter.highlighter(block.document()).rehighlight()
-        # here, but there is a bug in PyQt-4.9.6 causing QTextBlockUserData to
-        # lose its Python attributes. So we only run the highlighter when the
-        # previous block's userState() is -1.
-        return tuple(state(block).tokens(block.text()))
+        return highlighter.token_hash(tokens(block))
 
 
 def state(block):
     """Return the ly.lex.State() object at the beginning of the given QTextBlock."""
     hl = highlighter.highlighter(block.document())
+    hl.lexUntil(block.previous())
     if block.previous().userState() == -1 and block.blockNumber() > 0:
         hl.rehighlight()
     return hl.state(block.previous())
@@ -62,6 +81,7 @@ def state(block):
 def state_end(block):
     """Return the ly.lex.State() object at the end of the given QTextBlock."""
     hl = highlighter.highlighter(block.document())
+    hl.lexUntil(block)
     if block.userState() == -1:
         hl.rehighlight()
     return hl.state(block)
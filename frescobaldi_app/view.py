@@ -81,6 +81,11 @@ class View(QPlainTextEdit):
         self.include_target = []
         app.viewCreated(self)
 
+    def setDocument(self, document):
+        """Reimplemented to load the text of the document first, if needed."""
+        document.ensureLoaded()
+        super(View, self).setDocument(document)
+
     def event(self, ev):
         """General event handler.
 
@@ -38,6 +38,7 @@ import plugin
 import resultfiles
 import signals
 import popplertools
+import qpopplerview.diskcache
 
 
 _cache = weakref.WeakValueDictionary()
@@ -73,6 +74,7 @@ def load(filename):
         doc = popplerqt5.Poppler.Document.loadFromData(data)
         if doc:
             _cache[key] = doc
+            qpopplerview.diskcache.register(doc, data)
         return doc or None
 
 
@@ -176,7 +176,7 @@ class AbstractPopplerWidget(abstractviewwidget.AbstractViewWidget):
             document = doc.document()
             doc.ispresent = True
             if document:
-                self._links = pointandclick.links(document)
+                self._links = pointandclick.links(document, doc.filename())
                 self.view.load(document)
                 position = self._positions.get(doc, (0, 0, 0))
                 self.view.setPosition(position, True)
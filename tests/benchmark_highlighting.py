@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Measures the speed and memory use of the highlighter on LilyPond files.
+
+Usage: python3 tests/benchmark_highlighting.py [-k KEYSTROKES] [-r REPEAT] FILE...
+
+For every file this prints the time needed to lex and highlight the whole
+document, the time to re-apply the formats (as when the color scheme is
+changed), the average time to handle a keystroke, and the memory used by the
+stored tokens per 1000 lines, as tuples of tokens and as the compact arrays
+created by highlighter.pack_tokens().
+
+The keystrokes are typed at positions from a random generator with a fixed
+seed and every time is the best of a number of runs, so the numbers can be
+compared between runs and versions.
+
+"""
+
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from frescobaldi_app import toplevel
+toplevel.install()
+
+import po
+po.install(None)
+
+import app
+import highlighter
+import tokeniter
+import ly.lex
+
+from PyQt5.QtGui import QTextCursor, QTextDocument
+
+
+def best(func, repeat):
+    """Call func repeat times and return the shortest time it took."""
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def lex(text):
+    """Return a new QTextDocument with the text, highlighted."""
+    doc = QTextDocument()
+    doc.setPlainText(text)
+    highlighter.Highlighter.instance(doc).rehighlight()
+    tokeniter.state_end(doc.lastBlock())
+    return doc
+
+
+def keystrokes(doc, count):
+    """Type and remove a character at count positions; return the average time."""
+    rnd = random.Random(0)
+    lines = doc.blockCount()
+    c = QTextCursor(doc)
+    total = 0.0
+    for i in range(count):
+        block = doc.findBlockByNumber(rnd.randrange(lines))
+        c.setPosition(block.position() + rnd.randrange(block.length()))
+        start = time.perf_counter()
+        c.insertText("c")
+        total += time.perf_counter() - start
+        c.deletePreviousChar()
+    return total / count if count else 0.0
+
+
+def token_memory(text):
+    """Return the memory used by the tokens as tuples and packed, in bytes."""
+    state = ly.lex.guessState(text)
+    full = packed = 0
+    for line in text.splitlines() or ['']:
+        tokens = tuple(state.tokens(line))
+        full += sys.getsizeof(tokens) + sum(map(sys.getsizeof, tokens))
+        packed += sys.getsizeof(highlighter.pack_tokens(tokens))
+    return full, packed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the speed and memory use of the highlighter.")
+    parser.add_argument('-k', '--keystrokes', type=int, default=100,
+        help="the number of keystrokes to measure (default: %(default)s)")
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+        help="the number of runs to take the best time of (default: %(default)s)")
+    parser.add_argument('files', nargs='+', metavar='FILE',
+        help="the LilyPond files to highlight")
+    args = parser.parse_args()
+
+    app.instantiate()
+    print("{0:>8} {1:>10} {2:>10} {3:>10} {4:>10} {5:>12} {6:>12}  {7}".format(
+        "lines", "lex (s)", "lines/s", "format (s)", "key (ms)",
+        "tuples (kB)", "packed (kB)", "file"))
+    for filename in args.files:
+        with open(filename, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        lextime = best(lambda: lex(text), args.repeat)
+        doc = lex(text)
+        lines = doc.blockCount()
+        hl = highlighter.Highlighter.instance(doc)
+        formattime = best(hl.reformat, args.repeat)
+        keytime = min(keystrokes(doc, args.keystrokes) for i in range(args.repeat))
+        full, packed = token_memory(text)
+        factor = 1000 / lines / 1024
+        print("{0:>8} {1:>10.3f} {2:>10.0f} {3:>10.3f} {4:>10.2f} {5:>12.1f} {6:>12.1f}  {7}".format(
+            lines, lextime, lines / lextime if lextime else 0, formattime,
+            keytime * 1000, full * factor, packed * factor, filename))
+
+
+if __name__ == '__main__':
+    main()
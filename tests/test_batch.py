@@ -0,0 +1,113 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Tests for engraving multiple files (engrave/batch.py).
+
+Run from the top directory with: python -m unittest discover tests
+
+"""
+
+
+import builtins
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'frescobaldi_app'))
+
+try:
+    import PyQt5
+except ImportError:
+    PyQt5 = None
+
+
+class Document(object):
+    """Stands in for an open document, a JobManager only needs a weakref."""
+
+
+@unittest.skipIf(PyQt5 is None, "PyQt5 is not available")
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        if not hasattr(builtins, '_'):
+            builtins._ = lambda *args: args[0]
+        import jobmanager
+        # no job may start, so that they stay waiting in the queue
+        patches = [
+            mock.patch.object(jobmanager, 'maxjobs', lambda: 1),
+            mock.patch.object(jobmanager, 'running_jobs', lambda: 1),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(jobmanager._waiting.clear)
+
+    def createBatch(self, doc):
+        import job
+        import jobattributes
+        from engrave import batch
+        b = batch.Batch(['test.ly'])
+        def createJob(filename):
+            j = job.Job()
+            jobattributes.get(j).document = doc
+            return j
+        b._createJob = createJob
+        return b
+
+    def test_replaced_pending_job(self):
+        import job
+        import jobmanager
+        doc = Document()
+        b = self.createBatch(doc)
+        done = []
+        b.done.connect(lambda: done.append(True))
+        b.start()
+        batchjob = jobmanager.manager(doc).pending_job()
+        self.assertIsNotNone(batchjob)
+        self.assertTrue(b.is_running())
+
+        # the user starts another job for the same document
+        jobmanager.manager(doc).start_job(job.Job())
+        self.assertIsNot(jobmanager.manager(doc).pending_job(), batchjob)
+        self.assertTrue(batchjob.is_aborted())
+        self.assertFalse(b.is_running())
+        self.assertEqual(done, [True])
+        self.assertEqual(b.failures(), [('test.ly', batchjob)])
+
+    def test_hidden_job_keeps_pending_job(self):
+        import job
+        import jobattributes
+        import jobmanager
+        doc = Document()
+        b = self.createBatch(doc)
+        b.start()
+        batchjob = jobmanager.manager(doc).pending_job()
+
+        # the autocompiler does not replace the batch job
+        hidden = job.Job()
+        jobattributes.get(hidden).hidden = True
+        jobmanager.manager(doc).start_job(hidden)
+        self.assertIs(jobmanager.manager(doc).pending_job(), batchjob)
+        self.assertTrue(hidden.is_aborted())
+        self.assertTrue(b.is_running())
+
+
+if __name__ == '__main__':
+    unittest.main()
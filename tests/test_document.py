@@ -0,0 +1,85 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Tests for the Document (document.py).
+
+Run from the top directory with: python -m unittest discover tests
+
+"""
+
+
+import builtins
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'frescobaldi_app'))
+
+try:
+    import PyQt5
+except ImportError:
+    PyQt5 = None
+
+
+@unittest.skipIf(PyQt5 is None, "PyQt5 is not available")
+class TestLazyDocument(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not hasattr(builtins, '_'):
+            builtins._ = lambda *args: args[0]
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        cls.qapp = QApplication.instance() or QApplication([])
+
+    def lazyDocument(self, text):
+        """Return an unloaded Document for a new file with the text."""
+        from PyQt5.QtCore import QUrl
+        import document
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        filename = os.path.join(directory.name, 'test.ly')
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(text)
+        url = QUrl.fromLocalFile(filename)
+        doc = document.Document(url)
+        self.addCleanup(doc.close)
+        doc.setLazyText(*document.Document.load_lazy_data(url))
+        return doc, filename
+
+    def test_save_unloaded_document(self):
+        text = "\\relative c' {\n  c d e f\n}\n"
+        doc, filename = self.lazyDocument(text)
+        self.assertFalse(doc.isLoaded())
+        doc.save()
+        self.assertTrue(doc.isLoaded())
+        with open(filename, encoding='utf-8') as f:
+            self.assertEqual(f.read(), text)
+
+    def test_highlighter_loads_document(self):
+        import highlighter
+        doc, filename = self.lazyDocument("{ c d e }\n")
+        highlighter.highlighter(doc)
+        self.assertTrue(doc.isLoaded())
+        self.assertEqual(doc.firstBlock().text(), "{ c d e }")
+
+
+if __name__ == '__main__':
+    unittest.main()
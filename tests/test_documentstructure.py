@@ -0,0 +1,92 @@
+# This file is part of the Frescobaldi project, http://www.frescobaldi.org/
+#
+# Copyright (c) 2008 - 2014 by Wilbert Berendsen
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+# See http://www.gnu.org/licenses/ for more information.
+
+"""
+Tests for the document outline (documentstructure.py).
+
+Run from the top directory with: python -m unittest discover tests
+
+"""
+
+
+import os
+import re
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'frescobaldi_app'))
+
+try:
+    import PyQt5
+except ImportError:
+    PyQt5 = None
+
+
+@unittest.skipIf(PyQt5 is None, "PyQt5 is not available")
+class TestOutline(unittest.TestCase):
+    def structure(self, text, pattern):
+        """Return a QTextDocument with text and its DocumentStructure."""
+        from PyQt5.QtGui import QTextDocument
+        import documentstructure
+        rx = re.compile(pattern, re.MULTILINE)
+        p = mock.patch.object(documentstructure, 'outline_re', lambda: rx)
+        p.start()
+        self.addCleanup(p.stop)
+        doc = QTextDocument(text)
+        return doc, documentstructure.DocumentStructure.instance(doc)
+
+    def titles(self, structure):
+        return [m.group() for m in structure.outline()]
+
+    def test_line_pattern(self):
+        from PyQt5.QtGui import QTextCursor
+        doc, s = self.structure("\\score {\n}\n", r"\\(score|book)\b")
+        self.assertEqual(self.titles(s), ["\\score"])
+        c = QTextCursor(doc)
+        c.movePosition(QTextCursor.End)
+        c.insertText("\\book {\n}\n")
+        self.assertEqual(self.titles(s), ["\\score", "\\book"])
+        self.assertEqual(s.outline()[1].start(), doc.toPlainText().index("\\book"))
+        c.movePosition(QTextCursor.Start)
+        c.movePosition(QTextCursor.Down, QTextCursor.KeepAnchor, 2)
+        c.removeSelectedText()
+        self.assertEqual(self.titles(s), ["\\book"])
+
+    def test_multiline_pattern(self):
+        from PyQt5.QtGui import QTextCursor
+        text = "\\header {\n  title = \"A\"\n}\n"
+        doc, s = self.structure(text, r"\\header\s*\{\n\s*title")
+        self.assertEqual(self.titles(s), ["\\header {\n  title"])
+        self.assertEqual(s.outline()[0].start(), 0)
+        self.assertEqual(s.outline()[0].end(), text.index("title") + 5)
+
+        # the match follows changes in the document
+        c = QTextCursor(doc)
+        c.insertText("% comment\n")
+        self.assertEqual(s.outline()[0].start(), len("% comment\n"))
+
+        # and disappears when the lines don't match anymore
+        c.setPosition(doc.toPlainText().index("title"))
+        c.insertText("sub")
+        self.assertEqual(self.titles(s), [])
+
+
+if __name__ == '__main__':
+    unittest.main()